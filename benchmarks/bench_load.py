@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Load test the API with a corpus of synthetic filled sheets.
+
+Starts the app under uvicorn for every server configuration given (uvicorn
+workers x detection pool workers x pool queue size), or targets a running
+server with --url, then drives each scenario with a fixed number of
+concurrent clients (closed loop: every client sends its next request as soon
+as the previous one finishes):
+
+    - scan:     POST /scan-omr with sheets replayed from the corpus
+    - generate: POST /generate-and-download-pdf over a few sheet configurations
+
+Each run reports requests/s, p50/p95/p99 latency, 503 rejections (detection
+queue full) and errors. By default every upload gets a few random trailing
+bytes so the scan result cache never answers a replayed sheet; pass
+--repeat-content to measure with cache hits.
+
+Requires httpx (pip install httpx).
+
+Usage:
+    python -m benchmarks.bench_load --scenarios scan --concurrency 4,16 --server-workers 1 --scan-workers 1,2,4
+    python -m benchmarks.bench_load --scenarios generate --concurrency 50 --duration 30
+    python -m benchmarks.bench_load --url http://localhost:8000 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_scan import fill_sheet, render_blank, int_list
+from omr.layout import get_layout
+
+ROOT = Path(__file__).resolve().parent.parent
+
+GENERATE_CONFIGS = [(50, 4, 2), (100, 4, 2), (100, 5, 2), (200, 4, 3)]
+
+
+def build_corpus(args) -> list:
+    """Synthetic filled sheets as JPEG upload bytes"""
+    layout = get_layout(args.questions, args.options, args.columns)
+    blank = render_blank(args.questions, args.options, args.columns, args.dpi)
+    rng = np.random.default_rng(args.seed)
+    fill = argparse.Namespace(
+        blank_rate=0.05, coverage=0.8, darkness=40, rotation=1.0, blur=0.6, noise=6.0,
+        format="jpg", jpeg_quality=90
+    )
+    return [fill_sheet(blank, layout, args.dpi, rng, fill)[0] for _ in range(args.corpus)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """uvicorn main:app in a subprocess with the given pool configuration"""
+
+    def __init__(self, workers: int, scan_workers: int, queue_size: int = None):
+        self.workers = workers
+        self.scan_workers = scan_workers
+        self.queue_size = queue_size
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self._process = None
+
+    def __enter__(self):
+        env = dict(os.environ, OMR_SCAN_WORKERS=str(self.scan_workers), OMR_DB_PATH=self._db.name)
+        if self.queue_size:
+            env["OMR_SCAN_QUEUE_SIZE"] = str(self.queue_size)
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=ROOT, env=env
+        )
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+        for suffix in ("", "-wal", "-shm"):
+            Path(self._db.name + suffix).unlink(missing_ok=True)
+
+    def __str__(self):
+        queue = self.queue_size or self.scan_workers * 4
+        return f"uvicorn x{self.workers}, pool x{self.scan_workers}, queue {queue}"
+
+
+async def wait_ready(client, url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{url}/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become ready in {timeout:.0f}s")
+
+
+def scan_request(corpus: list, args):
+    sheets = itertools.cycle(corpus)
+    form = {"expected_options": str(args.options)}
+    if args.mode == "layout":
+        form.update(questions=str(args.questions), columns=str(args.columns))
+
+    def build():
+        data = next(sheets)
+        if not args.repeat_content:
+            # Decoders ignore bytes after the image end marker; the content hash changes
+            data += os.urandom(8)
+        return {"url": "/scan-omr", "files": {"file": ("sheet.jpg", data, "image/jpeg")}, "data": form}
+    return build
+
+
+def generate_request(args):
+    def build():
+        questions, options, columns = random.choice(GENERATE_CONFIGS)
+        return {"url": "/generate-and-download-pdf",
+                "data": {"questions": str(questions), "options": str(options), "columns": str(columns)}}
+    return build
+
+
+async def run_load(client, base_url: str, build, concurrency: int, args) -> dict:
+    """Closed-loop load: `concurrency` clients until the duration or request count is reached"""
+    latencies, statuses = [], {}
+    deadline = time.monotonic() + args.duration
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while time.monotonic() < deadline:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            request = build()
+            start = time.perf_counter()
+            try:
+                response = await client.post(base_url + request.pop("url"), **request)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    total = len(latencies)
+    ok = statuses.get(200, 0) + statuses.get(304, 0)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "requests": total,
+        "throughput": ok / elapsed if elapsed else 0.0,
+        "p50": p50, "p95": p95, "p99": p99,
+        "rejected": 100.0 * statuses.get(503, 0) / total if total else 0.0,
+        "errors": 100.0 * (total - ok - statuses.get(503, 0)) / total if total else 0.0,
+        "statuses": statuses,
+    }
+
+
+async def run_target(base_url: str, label: str, corpus: list, args, httpx) -> list:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    lines = []
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        await wait_ready(client, base_url)
+        builders = {"scan": scan_request(corpus, args), "generate": generate_request(args)}
+        for scenario in args.scenarios:
+            # Warm worker processes, layouts and the PDF cache before measuring
+            for _ in range(args.warmup):
+                request = builders[scenario]()
+                await client.post(base_url + request.pop("url"), **request)
+            for concurrency in args.concurrency:
+                row = await run_load(client, base_url, builders[scenario], concurrency, args)
+                codes = " ".join(f"{code}:{count}" for code, count in sorted(row["statuses"].items(), key=str))
+                line = (f"{label:<34} {scenario:<9} {concurrency:>5} {row['requests']:>8} "
+                        f"{row['throughput']:>8.1f} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} "
+                        f"{row['rejected']:>6.1f} {row['errors']:>6.1f}  {codes}")
+                print(line, flush=True)
+                lines.append(line)
+    return lines
+
+
+async def main_async(args, httpx):
+    corpus = build_corpus(args) if "scan" in args.scenarios else []
+    header = (f"{'server':<34} {'scenario':<9} {'conc':>5} {'requests':>8} {'req/s':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'503 %':>6} {'err %':>6}  status codes")
+    lines = [
+        f"# bench_load {time.strftime('%Y-%m-%dT%H:%M:%S')} duration={args.duration:g}s "
+        f"requests={args.requests} corpus={len(corpus)} {args.questions}q/{args.options}opt/{args.columns}col"
+        f"@{args.dpi} mode={args.mode} repeat_content={args.repeat_content}",
+        header,
+    ]
+    print("\n".join(lines), flush=True)
+
+    if args.url:
+        lines += await run_target(args.url.rstrip("/"), args.url, corpus, args, httpx)
+    else:
+        for workers, scan_workers, queue_size in itertools.product(
+            args.server_workers, args.scan_workers, args.queue_size or [None]
+        ):
+            with Server(workers, scan_workers, queue_size) as server:
+                lines += await run_target(server.url, str(server), corpus, args, httpx)
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n\n")
+        print(f"Results appended to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the OMR API")
+    parser.add_argument("--url", help="Target a running server instead of starting one per configuration")
+    parser.add_argument("--scenarios", type=lambda v: v.split(","), default=["scan", "generate"],
+                        help="Comma-separated: scan, generate")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 50], help="Concurrent clients (list)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per run")
+    parser.add_argument("--requests", type=int, help="Stop each run after this many requests")
+    parser.add_argument("--warmup", type=int, default=4, help="Unmeasured requests per scenario")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout (seconds)")
+    parser.add_argument("--server-workers", type=int_list, default=[1], help="uvicorn worker counts (list)")
+    parser.add_argument("--scan-workers", type=int_list, default=[os.cpu_count() or 1],
+                        help="Detection pool sizes, OMR_SCAN_WORKERS (list)")
+    parser.add_argument("--queue-size", type=int_list, help="Detection queue sizes, OMR_SCAN_QUEUE_SIZE (list)")
+    parser.add_argument("--corpus", type=int, default=32, help="Distinct synthetic sheets replayed")
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--mode", choices=["layout", "contour"], default="layout",
+                        help="layout: send the sheet configuration; contour: let the server search")
+    parser.add_argument("--repeat-content", action="store_true", help="Replay identical bytes (cache hits)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.txt", help="File results are appended to ('' = none)")
+    args = parser.parse_args()
+
+    try:
+        import httpx
+    except ImportError:
+        parser.error("httpx is required for load testing: pip install httpx")
+    random.seed(args.seed)
+    asyncio.run(main_async(args, httpx))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF rasterization backends.
+
+Renders every page of a PDF with each installed backend at the requested DPIs
+and reports per-page latency. Without --pdf, a blank sheet is generated with
+generate_omr_pdf.
+
+Usage:
+    python -m benchmarks.bench_rasterizer
+    python -m benchmarks.bench_rasterizer --pdf batch.pdf --dpi 150 200 300 --repeat 5
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from omr.rasterizer import BACKENDS, get_backend
+
+
+def load_pdf(path: str = None, questions: int = 100, options: int = 4, columns: int = 2) -> bytes:
+    """Read the given PDF or generate a blank OMR sheet"""
+    if path:
+        return Path(path).read_bytes()
+
+    from omr.blank_sheet import render_blank_pdf
+
+    return render_blank_pdf(questions, options, columns)
+
+
+def bench_backend(name: str, data: bytes, dpi: int, repeat: int) -> list:
+    """Return per-page render times in milliseconds"""
+    backend = get_backend(name)
+    pages = backend.page_count(data)
+
+    # Warm-up so imports and first-call setup are not measured
+    backend.render(data, 1, dpi)
+
+    timings = []
+    for _ in range(repeat):
+        for page in range(1, pages + 1):
+            start = time.perf_counter()
+            backend.render(data, page, dpi)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF rasterization backends")
+    parser.add_argument("--pdf", help="PDF to render (default: generated blank sheet)")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 200, 300])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=100)
+    args = parser.parse_args()
+
+    data = load_pdf(args.pdf, questions=args.questions)
+
+    print(f"{'backend':<10} {'dpi':>5} {'pages':>6} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9}")
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            print(f"{name:<10} not installed")
+            continue
+
+        for dpi in args.dpi:
+            try:
+                timings = bench_backend(name, data, dpi, args.repeat)
+            except Exception as e:
+                print(f"{name:<10} {dpi:>5} failed: {e}")
+                break
+            print(
+                f"{name:<10} {dpi:>5} {len(timings):>6} "
+                f"{statistics.mean(timings):>9.1f} {statistics.median(timings):>9.1f} {max(timings):>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scan pipeline on synthetic filled sheets.
+
+For every (questions, options, columns, dpi) case a blank sheet is generated
+with generate_omr_pdf and rasterized, then filled with a seeded random answer
+pattern. Bubble darkness, pencil coverage, sensor noise, blur and rotation
+are controlled from the command line. Sheets are encoded as uploads (JPEG by
+default) before timing, so the numbers include decoding.
+
+Each case reports:
+
+    - latency:    p50/p95/p99 ms per sheet, one sheet at a time (scan_sheet)
+    - throughput: sheets/s with --workers processes (iter_evaluate)
+    - accuracy:   share of questions read correctly (blank = correct when
+                  unanswered) and share of sheets read without any error
+
+Results are printed and written to bench_output.txt (with the commit and
+settings) so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.bench_scan
+    python -m benchmarks.bench_scan --questions 50,100,200 --dpi 150,300,600 --sheets 40
+    python -m benchmarks.bench_scan --rotation 3 --noise 12 --blur 1.2 --darkness 90 --append
+"""
+
+import argparse
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from omr.evaluation import iter_evaluate
+from omr.layout import OPTION_LABELS, get_layout
+from omr.blank_sheet import render_blank_pdf
+from omr.rasterizer import render_page
+from omr.scan import scan_sheet
+
+
+def int_list(value: str) -> list:
+    return [int(v) for v in value.split(",") if v]
+
+
+def render_blank(questions: int, options: int, columns: int, dpi: int) -> np.ndarray:
+    return render_page(render_blank_pdf(questions, options, columns), 1, dpi=dpi)
+
+
+def fill_sheet(blank: np.ndarray, layout, dpi: int, rng: np.random.Generator, args) -> tuple:
+    """
+    Mark a random answer pattern on a copy of the blank sheet.
+
+    Returns: (upload bytes, {question: "A"} truth)
+    """
+    scale = dpi / 72.0
+    positions = {(int(q), int(o)): (x, y, r) for q, o, x, y, r in layout.bubbles}
+    image = blank.copy()
+    truth = {}
+    for question in layout.questions:
+        if rng.random() < args.blank_rate:
+            continue
+        option = int(rng.integers(layout.options))
+        truth[int(question)] = OPTION_LABELS[option]
+        x, y, r = positions[int(question), option]
+        # Pencil marks rarely cover the whole bubble or sit dead centre
+        radius = max(1, int(r * scale * args.coverage))
+        jitter = rng.normal(0, r * scale * 0.08, 2)
+        center = (int(round(x * scale + jitter[0])), int(round(y * scale + jitter[1])))
+        cv2.circle(image, center, radius, int(args.darkness), -1, lineType=cv2.LINE_AA)
+
+    if args.rotation:
+        angle = rng.uniform(-args.rotation, args.rotation)
+        height, width = image.shape
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height), borderValue=255)
+    if args.blur:
+        image = cv2.GaussianBlur(image, (0, 0), args.blur)
+    if args.noise:
+        noise = rng.normal(0, args.noise, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality] if args.format == "jpg" else []
+    ok, encoded = cv2.imencode(f".{args.format}", image, params)
+    if not ok:
+        raise RuntimeError("Failed to encode synthetic sheet")
+    return encoded.tobytes(), truth
+
+
+def accuracy(detected: dict, truth: dict, questions) -> tuple:
+    """(questions read correctly, sheet read without error)"""
+    detected = {int(q): a for q, a in (detected or {}).items()}
+    correct = sum(detected.get(int(q)) == truth.get(int(q)) for q in questions)
+    return correct, correct == len(questions)
+
+
+def run_case(questions: int, options: int, columns: int, dpi: int, args) -> dict:
+    layout = get_layout(questions, options, columns)
+    blank = render_blank(questions, options, columns, dpi)
+    rng = np.random.default_rng(args.seed)
+    sheets = [fill_sheet(blank, layout, dpi, rng, args) for _ in range(args.sheets)]
+    config = {"questions": questions, "columns": columns} if args.mode == "layout" else {}
+
+    # Warm up layout extraction and imports outside the timed runs
+    scan_sheet(sheets[0][0], f"warmup.{args.format}", options, **config)
+
+    latencies, correct, exact, failed = [], 0, 0, 0
+    for data, truth in sheets:
+        start = time.perf_counter()
+        result = scan_sheet(data, f"sheet.{args.format}", options, **config)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if result.get("status", "success") != "success":
+            failed += 1
+            continue
+        right, whole = accuracy(result.get("detected_answers"), truth, layout.questions)
+        correct += right
+        exact += whole
+
+    throughput = None
+    if args.workers > 1:
+        start = time.perf_counter()
+        key = {1: "A"}
+        for _ in iter_evaluate([data for data, _ in sheets], key, workers=args.workers,
+                               expected_options=options, **config):
+            pass
+        throughput = len(sheets) / (time.perf_counter() - start)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "case": f"{questions}q/{options}opt/{columns}col@{dpi}",
+        "p50": p50, "p95": p95, "p99": p99,
+        "serial": 1000.0 / np.mean(latencies),
+        "parallel": throughput,
+        "question_accuracy": 100.0 * correct / (len(sheets) * len(layout.questions)),
+        "sheet_accuracy": 100.0 * exact / len(sheets),
+        "failed": failed,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan latency, throughput and accuracy")
+    parser.add_argument("--questions", type=int_list, default=[50, 100])
+    parser.add_argument("--options", type=int_list, default=[4])
+    parser.add_argument("--columns", type=int_list, default=[2])
+    parser.add_argument("--dpi", type=int_list, default=[150, 300])
+    parser.add_argument("--sheets", type=int, default=20, help="Sheets per case")
+    parser.add_argument("--mode", choices=["layout", "contour"], default="layout",
+                        help="layout: pass the sheet configuration; contour: detect_omr_answers only")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes for the throughput run (1 skips it)")
+    parser.add_argument("--darkness", type=float, default=40, help="Gray level of marks (0 = black)")
+    parser.add_argument("--coverage", type=float, default=0.8, help="Mark radius as a fraction of the bubble")
+    parser.add_argument("--blank-rate", type=float, default=0.05, help="Share of questions left unanswered")
+    parser.add_argument("--noise", type=float, default=6.0, help="Gaussian noise sigma (gray levels)")
+    parser.add_argument("--blur", type=float, default=0.6, help="Gaussian blur sigma (pixels, 0 = none)")
+    parser.add_argument("--rotation", type=float, default=1.0, help="Maximum random rotation (degrees)")
+    parser.add_argument("--format", choices=["jpg", "png"], default="jpg")
+    parser.add_argument("--jpeg-quality", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.txt")
+    parser.add_argument("--append", action="store_true", help="Append to the output instead of replacing it")
+    args = parser.parse_args()
+
+    settings = (f"mode={args.mode} sheets={args.sheets} workers={args.workers} darkness={args.darkness:g} "
+                f"coverage={args.coverage:g} blank_rate={args.blank_rate:g} noise={args.noise:g} "
+                f"blur={args.blur:g} rotation={args.rotation:g} format={args.format} seed={args.seed}")
+    lines = [
+        f"# bench_scan {datetime.now().isoformat(timespec='seconds')} commit {git_revision()} "
+        f"python {platform.python_version()} opencv {cv2.__version__} cpus {os.cpu_count()}",
+        f"# {settings}",
+        f"{'case':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'serial/s':>9} {'parallel/s':>11} "
+        f"{'q acc %':>8} {'sheet %':>8} {'failed':>7}",
+    ]
+    for line in lines:
+        print(line)
+
+    for questions in args.questions:
+        for options in args.options:
+            for columns in args.columns:
+                for dpi in args.dpi:
+                    row = run_case(questions, options, columns, dpi, args)
+                    parallel = f"{row['parallel']:>11.1f}" if row["parallel"] is not None else f"{'-':>11}"
+                    line = (f"{row['case']:<22} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['p99']:>8.1f} "
+                            f"{row['serial']:>9.1f} {parallel} {row['question_accuracy']:>8.2f} "
+                            f"{row['sheet_accuracy']:>8.1f} {row['failed']:>7}")
+                    print(line)
+                    lines.append(line)
+
+    with open(args.output, "a" if args.append else "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n\n")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
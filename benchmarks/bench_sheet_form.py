@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark multi-page sheet output: Form XObject reuse vs. per-page content.
+
+Builds an N-page PDF of the same blank sheet three ways and reports bytes and
+milliseconds per page:
+
+    - regenerate: generate_omr_pdf once per page, pages merged
+    - copy:       blank page content copied onto every page
+    - xobject:    blank page imported once as a Form XObject (SheetForm)
+
+Usage:
+    python -m benchmarks.bench_sheet_form
+    python -m benchmarks.bench_sheet_form --pages 500 --questions 200 --options 5 --columns 3
+"""
+
+import argparse
+import time
+
+from omr.blank_sheet import render_blank_pdf
+from omr.sheet_form import SheetForm, pymupdf
+
+
+def render_blank(questions: int, options: int, columns: int) -> bytes:
+    return render_blank_pdf(questions, options, columns)
+
+
+def build_regenerate(pages: int, questions: int, options: int, columns: int) -> bytes:
+    with pymupdf.open() as doc:
+        for _ in range(pages):
+            with pymupdf.open(stream=render_blank(questions, options, columns), filetype="pdf") as blank:
+                doc.insert_pdf(blank, from_page=0, to_page=0)
+        return doc.tobytes(garbage=1)
+
+
+def build_copy(blank_pdf: bytes, pages: int) -> bytes:
+    with pymupdf.open(stream=blank_pdf, filetype="pdf") as blank, pymupdf.open() as doc:
+        for _ in range(pages):
+            doc.insert_pdf(blank, from_page=0, to_page=0)
+        return doc.tobytes(garbage=1)
+
+
+def build_xobject(blank_pdf: bytes, pages: int) -> bytes:
+    with SheetForm(blank_pdf) as form:
+        return form.build(copies=pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Form XObject reuse for multi-page sheets")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--columns", type=int, default=2)
+    args = parser.parse_args()
+
+    blank_pdf = render_blank(args.questions, args.options, args.columns)
+    builders = {
+        "regenerate": lambda: build_regenerate(args.pages, args.questions, args.options, args.columns),
+        "copy": lambda: build_copy(blank_pdf, args.pages),
+        "xobject": lambda: build_xobject(blank_pdf, args.pages),
+    }
+
+    print(f"{args.pages} pages of {args.questions}q/{args.options}opt/{args.columns}col "
+          f"(single sheet: {len(blank_pdf)} bytes)")
+    print(f"{'method':<12} {'total KB':>10} {'bytes/page':>11} {'ms/page':>9}")
+    for name, build in builders.items():
+        start = time.perf_counter()
+        pdf = build()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<12} {len(pdf) / 1024:>10.1f} {len(pdf) / args.pages:>11.0f} "
+              f"{elapsed * 1000 / args.pages:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
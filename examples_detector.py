@@ -5,6 +5,7 @@ Example usage of the optimized OMR detector for evaluating OMR sheets.
 import logging
 from pathlib import Path
 from omr.detector_optimized import OMRDetector, detect_omr_answers, evaluate_omr
+from omr.evaluation import evaluate_batch
 
 # Setup logging
 logging.basicConfig(
@@ -129,31 +130,26 @@ def example_4_batch_evaluation():
     
     print(f"\nProcessing {len(sheet_files)} sheets...\n")
     
-    results = []
-    for sheet_path in sheet_files:
-        result = evaluate_omr(
-            image_path=str(sheet_path),
-            answer_key=answer_key,
-            expected_options=4,
-            fill_threshold=40.0
-        )
-        
+    # Parses the key once and detects sheets in parallel
+    batch = evaluate_batch(
+        sheet_files,
+        answer_key,
+        expected_options=4,
+        fill_threshold=40.0
+    )
+    
+    for result in batch["results"]:
         if result["status"] == "success":
-            results.append({
-                "file": sheet_path.name,
-                "score": result["score"],
-                "total": result["total"],
-                "percentage": result["percentage"]
-            })
-            print(f"✓ {sheet_path.name}: {result['score']}/{result['total']} ({result['percentage']}%)")
+            print(f"✓ {result['file']}: {result['score']}/{result['total']} ({result['percentage']}%)")
         else:
-            print(f"✗ {sheet_path.name}: {result['error']}")
+            print(f"✗ {result['file']}: {result['error']}")
     
     # Summary
-    if results:
-        avg_percentage = sum(r["percentage"] for r in results) / len(results)
+    summary = batch["summary"]
+    if summary["evaluated"]:
         print(f"\n{'─'*40}")
-        print(f"Average percentage: {avg_percentage:.2f}%")
+        print(f"Average percentage: {summary['mean_percentage']:.2f}%")
+        print(f"Median percentage: {summary['median_percentage']:.2f}%")
 
 
 def example_5_debug_analysis():
@@ -4,17 +4,45 @@ OMR Sheet Generator - FastAPI Application
 Simplified version: PDF generation endpoint only
 """
 
+import asyncio
+import json
 import logging
 import os
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import FastAPI, Form, File, UploadFile
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from typing import List
+
+from fastapi import FastAPI, Form, File, Header, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from omr.pdf_converter import generate_omr_pdf
-from omr.detector_enhanced import detect_omr_answers
+from omr.batch import scan_pdf_pages
+from omr.blank_sheet import render_blank_pdf
+from omr.class_set import build_class_set_pdf, iter_class_set_zip, parse_roster
+from omr.engine import DetectionPool, PoolSaturated
+from omr.evaluation import evaluation_record, score_answers, summarize
+from omr.jobs import JobRunner, JobTooLarge, cancel_job, create_job, get_job
+from omr.layout import get_layout
+from omr.loader import is_pdf
+from omr.pdf_cache import PDFCache
+from omr.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, PDF_GENERATION_SECONDS, REGISTRY, SCAN_FAILURES, SCAN_SECONDS,
+    CallbackMetric, failure_reason, observe_sheet, observe_timings
+)
+from omr.profiling import StageMetrics
+from omr.sheet_form import build_copies
+from omr.rasterizer import DEFAULT_DPI, clamp_dpi
+from omr.scan import scan_sheet, scan_source
+from omr.key_cache import AnswerKeyCache
+from omr.result_cache import ScanResultCache, scan_cache_key
+from omr.scoring import AnswerKey
+from omr.storage import (
+    ConnectionPool, EvaluationStore, content_hash, exam_statistics, load_exam_key,
+    query_evaluations, save_exam
+)
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -22,8 +50,235 @@ logger = logging.getLogger(__name__)
 
 # Setup paths
 BASE_DIR = Path(__file__).parent
-TMP_DIR = BASE_DIR / "tmp"
-TMP_DIR.mkdir(exist_ok=True)
+
+# Detection pool settings (override with environment variables)
+SCAN_WORKERS = int(os.environ.get("OMR_SCAN_WORKERS", os.cpu_count() or 1))
+SCAN_QUEUE_SIZE = int(os.environ.get("OMR_SCAN_QUEUE_SIZE", SCAN_WORKERS * 4))
+SCAN_TIMEOUT = float(os.environ.get("OMR_SCAN_TIMEOUT", 60))
+SCAN_RETRY_AFTER = int(os.environ.get("OMR_SCAN_RETRY_AFTER", 5))
+
+detection_pool = DetectionPool(
+    workers=SCAN_WORKERS,
+    max_queue=SCAN_QUEUE_SIZE,
+    timeout=SCAN_TIMEOUT,
+    retry_after=SCAN_RETRY_AFTER
+)
+
+# Blank-sheet PDF cache settings
+PDF_CACHE_MB = int(os.environ.get("OMR_PDF_CACHE_MB", 64))
+PDF_CACHE_DIR = os.environ.get("OMR_PDF_CACHE_DIR")
+# Comma-separated QUESTIONSxOPTIONSxCOLUMNS list, or "default"
+PDF_WARMUP = os.environ.get("OMR_PDF_WARMUP", "")
+DEFAULT_WARMUP_CONFIGS = [(50, 4, 2), (100, 4, 2), (50, 5, 2), (100, 5, 2), (20, 4, 1), (200, 4, 3)]
+
+pdf_cache = PDFCache(
+    max_bytes=PDF_CACHE_MB * 1024 * 1024,
+    disk_dir=PDF_CACHE_DIR,
+    version="1.0.0"
+)
+
+
+# Results database (WAL mode, shared connections)
+DB_PATH = Path(os.environ.get("OMR_DB_PATH", BASE_DIR / "database.db"))
+DB_POOL_SIZE = int(os.environ.get("OMR_DB_POOL_SIZE", 4))
+DB_BATCH_SIZE = int(os.environ.get("OMR_DB_BATCH_SIZE", 500))
+
+db_pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE)
+
+# Decoded answer keys by exam id; the TTL picks up edits made by other processes
+ANSWER_KEY_TTL = float(os.environ.get("OMR_ANSWER_KEY_TTL", 300))
+
+exam_keys = AnswerKeyCache(lambda exam_id: load_exam_key(db_pool, exam_id), ttl=ANSWER_KEY_TTL)
+
+
+# Asynchronous scan jobs (POST /jobs/scan); at most JOB_WINDOW job sheets share
+# the detection pool at once, leaving the rest of its queue to interactive scans
+JOB_MAX_ITEMS = int(os.environ.get("OMR_JOB_MAX_ITEMS", 10000))
+JOB_WINDOW = int(os.environ.get("OMR_JOB_WINDOW", 0)) or None
+# Finished jobs (results included) are deleted after this many hours; 0 keeps them
+JOB_RETENTION_HOURS = float(os.environ.get("OMR_JOB_RETENTION_HOURS", 168)) or None
+
+job_runner = JobRunner(detection_pool, db_pool, window=JOB_WINDOW, retention_hours=JOB_RETENTION_HOURS)
+
+
+# Scan result cache keyed by upload content hash (0 entries disables memory tier)
+SCAN_CACHE_SIZE = int(os.environ.get("OMR_SCAN_CACHE_SIZE", 1024))
+SCAN_CACHE_PERSIST = os.environ.get("OMR_SCAN_CACHE_PERSIST", "0").lower() in ("1", "true", "yes")
+SCAN_CACHE_DB_SIZE = int(os.environ.get("OMR_SCAN_CACHE_DB_SIZE", 100000))
+
+scan_cache = ScanResultCache(
+    max_entries=SCAN_CACHE_SIZE, db_pool=db_pool if SCAN_CACHE_PERSIST else None, max_db_entries=SCAN_CACHE_DB_SIZE
+)
+
+# Detections in progress by cache key, so concurrent duplicate uploads share one job
+inflight_scans = {}
+
+
+class ScanAbandoned(Exception):
+    """Set on a shared detection whose owning request was cancelled"""
+
+
+# Per-stage timing of every scan (wall time only); single requests can ask for
+# timing plus peak memory with the `profile` form field
+PROFILE_STAGES = os.environ.get("OMR_PROFILE_STAGES", "0").lower() in ("1", "true", "yes")
+STAGE_METRICS_WINDOW = int(os.environ.get("OMR_STAGE_METRICS_WINDOW", 1024))
+
+stage_metrics = StageMetrics(window=STAGE_METRICS_WINDOW)
+
+
+# Prometheus gauges and cache counters, read from their owners at scrape time
+def cache_lookups() -> dict:
+    pdf, scans, keys = pdf_cache.stats(), scan_cache.stats(), exam_keys.stats()
+    return {
+        ("pdf", "hit"): pdf["hits"], ("pdf", "disk_hit"): pdf["disk_hits"], ("pdf", "miss"): pdf["misses"],
+        ("scan", "hit"): scans["hits"], ("scan", "db_hit"): scans["db_hits"], ("scan", "miss"): scans["misses"],
+        ("answer_key", "hit"): keys["hits"], ("answer_key", "miss"): keys["misses"],
+    }
+
+
+def cache_entries() -> dict:
+    return {
+        ("pdf",): pdf_cache.stats()["entries"],
+        ("scan",): scan_cache.stats()["entries"],
+        ("answer_key",): exam_keys.stats()["entries"],
+    }
+
+
+for metric in (
+    CallbackMetric("omr_scan_queue_depth", "Detection jobs running or waiting", lambda: detection_pool.pending),
+    CallbackMetric("omr_scan_queue_capacity", "Maximum detection jobs running or waiting",
+                   lambda: detection_pool.max_queue),
+    CallbackMetric("omr_scan_workers", "Detection worker processes", lambda: detection_pool.workers),
+    CallbackMetric("omr_scan_pool_restarts_total", "Detection pools replaced after a worker died or hung",
+                   lambda: detection_pool.restarts, kind="counter"),
+    CallbackMetric("omr_scan_inflight_uploads", "Distinct uploads being detected", lambda: len(inflight_scans)),
+    CallbackMetric("omr_cache_lookups_total", "Cache lookups by cache and outcome", cache_lookups,
+                   labels=("cache", "result"), kind="counter"),
+    CallbackMetric("omr_cache_entries", "Entries held per cache", cache_entries, labels=("cache",)),
+):
+    REGISTRY.register(metric)
+
+
+# Streamed batch responses: keep proxies (nginx) from buffering the records
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_records(records, accept: str = None) -> StreamingResponse:
+    """
+    Stream result dicts as NDJSON, or as Server-Sent Events when the client
+    sends Accept: text/event-stream
+    """
+    if accept and "text/event-stream" in accept:
+        async def body():
+            async for record in records:
+                yield f"data: {json.dumps(record)}\n\n"
+        return StreamingResponse(body(), media_type="text/event-stream", headers=STREAM_HEADERS)
+
+    async def body():
+        async for record in records:
+            yield json.dumps(record) + "\n"
+    return StreamingResponse(body(), media_type="application/x-ndjson", headers=STREAM_HEADERS)
+
+
+async def detect_upload(content: bytes, filename: str, expected_options: int, dpi: int,
+                        questions: int = None, columns: int = None, deskew: bool = True,
+                        profile: bool = False) -> tuple:
+    """
+    Detect answers on an upload, reusing results for identical content.
+
+    Profiled requests (timing and peak memory) always run detection and are
+    not cached, since their timings describe this run only.
+
+    Returns: (result, cached) where cached is True when no new detection ran
+    """
+    if profile:
+        result = await detection_pool.run(
+            scan_sheet, content, filename, expected_options=expected_options, dpi=dpi,
+            questions=questions, columns=columns, deskew=deskew, profile=True, profile_memory=True
+        )
+        stage_metrics.record(result["timings"])
+        observe_timings(result["timings"])
+        observe_sheet("scan", result)
+        return result, False
+    
+    cache_key = scan_cache_key(content_hash(content), expected_options, dpi, questions, columns, deskew)
+    result = scan_cache.cached(cache_key)
+    if result is None and scan_cache.db_pool is not None:
+        result = await asyncio.to_thread(scan_cache.get, cache_key)
+    if result is not None:
+        return result, True
+    
+    # A request whose shared detection was abandoned (its owner cancelled)
+    # runs its own, or joins one that another waiter started first
+    while (pending := inflight_scans.get(cache_key)) is not None:
+        try:
+            return await asyncio.shield(pending), True
+        except ScanAbandoned:
+            continue
+    
+    pending = asyncio.get_running_loop().create_future()
+    inflight_scans[cache_key] = pending
+    try:
+        result = await detection_pool.run(
+            scan_sheet, content, filename, expected_options=expected_options, dpi=dpi,
+            questions=questions, columns=columns, deskew=deskew, profile=PROFILE_STAGES
+        )
+    except asyncio.CancelledError:
+        # Not pending.cancel(): waiters would get a CancelledError instead of
+        # a response
+        pending.set_exception(ScanAbandoned())
+        pending.exception()
+        raise
+    except Exception as e:
+        pending.set_exception(e)
+        pending.exception()  # waiters re-raise it; don't warn when there are none
+        raise
+    else:
+        # Timings describe this run only; waiters and the cache get the result without them
+        shared = {k: v for k, v in result.items() if k != "timings"}
+        pending.set_result(shared)
+    finally:
+        inflight_scans.pop(cache_key, None)
+    
+    observe_sheet("scan", result)
+    if "timings" in result:
+        stage_metrics.record(result["timings"])
+        observe_timings(result["timings"])
+    
+    if scan_cache.db_pool is not None:
+        await asyncio.to_thread(scan_cache.put, cache_key, shared)
+    else:
+        scan_cache.put(cache_key, shared)
+    return result, False
+
+
+async def get_exam_key(exam_id: int):
+    """Cached AnswerKey of an exam (None if unknown); loads from SQLite in a thread on a miss"""
+    key = exam_keys.get(exam_id, load=False)
+    if key is None:
+        key = await asyncio.to_thread(exam_keys.get, exam_id)
+    return key
+
+
+async def update_exam_key(exam_id: int, spec) -> AnswerKey:
+    """Validate, store and cache an exam's answer key"""
+    key = AnswerKey.from_spec(spec)
+    await asyncio.to_thread(save_exam, db_pool, exam_id, spec)
+    exam_keys.put(exam_id, key)
+    return key
+
+
+def parse_warmup_configs(value: str) -> list:
+    """Parse OMR_PDF_WARMUP into (questions, options, columns) tuples"""
+    if value.strip().lower() == "default":
+        return DEFAULT_WARMUP_CONFIGS
+    configs = []
+    for item in value.split(","):
+        if item.strip():
+            questions, options, columns = (int(part) for part in item.lower().split("x"))
+            configs.append((questions, options, columns))
+    return configs
+
 
 # Setup FastAPI app
 app = FastAPI(
@@ -42,6 +297,50 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def start_detection_pool():
+    """Spawn detection workers before the first scan arrives"""
+    detection_pool.start()
+
+
+@app.on_event("startup")
+def start_pdf_warmup():
+    """Pre-render common sheet configurations in the background"""
+    configs = parse_warmup_configs(PDF_WARMUP)
+    if configs:
+        threading.Thread(target=warm_pdf_cache, args=(configs,), daemon=True).start()
+
+
+@app.on_event("startup")
+def init_database():
+    """Create the exams/evaluations tables if missing"""
+    db_pool.init()
+
+
+@app.on_event("startup")
+async def start_job_runner():
+    """Re-queue interrupted job sheets and start scheduling jobs"""
+    await job_runner.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    """Stop scheduling jobs; unfinished sheets resume on the next start"""
+    await job_runner.stop()
+
+
+@app.on_event("shutdown")
+def stop_detection_pool():
+    """Stop detection workers"""
+    detection_pool.shutdown()
+
+
+@app.on_event("shutdown")
+def close_database():
+    """Close pooled database connections"""
+    db_pool.close()
+
+
 @app.get("/", response_class=HTMLResponse)
 def index():
     """Serve the form to generate OMR sheet"""
@@ -115,6 +414,9 @@ def index():
             .steps h3 { margin-top: 0; }
             .steps ol { margin: 10px 0; padding-left: 20px; }
             .steps li { margin: 8px 0; }
+            .batch-table { width: 100%; border-collapse: collapse; font-size: 14px; }
+            .batch-table th, .batch-table td { text-align: left; padding: 6px 8px; border-bottom: 1px solid #eee; vertical-align: top; }
+            .batch-table td:last-child { font-family: monospace; word-break: break-word; }
         </style>
     </head>
     <body>
@@ -170,7 +472,8 @@ def index():
             <hr style="margin: 40px 0; border: none; border-top: 1px solid #ddd;">
             
             <h2>📸 Scan & Detect Answers</h2>
-            <p>Upload a filled OMR sheet to automatically detect answers.</p>
+            <p>Upload a filled OMR sheet to automatically detect answers. A multi-page PDF is scanned
+            page by page and results appear as each page finishes.</p>
             
             <form id="scanForm" enctype="multipart/form-data">
                 <div class="form-group">
@@ -208,6 +511,11 @@ def index():
                 return;
             }
             
+            // PDFs may hold a whole batch; stream their pages instead of waiting for one blob
+            if (fileInput.files[0].name.toLowerCase().endsWith('.pdf')) {
+                return scanBatch(fileInput.files[0], optionsInput.value, resultDiv);
+            }
+            
             const formData = new FormData();
             formData.append('file', fileInput.files[0]);
             formData.append('expected_options', optionsInput.value);
@@ -234,7 +542,7 @@ def index():
                     let answerText = '';
                     for (const [qnum, answer] of Object.entries(answers)) {
                         answerText += qnum + '.' + answer + '  ';
-                        if (qnum % 5 === 0) answerText += '\n';
+                        if (qnum % 5 === 0) answerText += '\\n';
                     }
                     answersHTML += answerText;
                     answersHTML += '</pre></div>';
@@ -249,6 +557,92 @@ def index():
                 resultDiv.innerHTML += '<strong>❌ Error:</strong> ' + error.message + '</div>';
             }
         }
+        
+        async function readNDJSON(response, onRecord) {
+            // Call onRecord for every line of an NDJSON response as it arrives
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) onRecord(JSON.parse(line));
+                }
+            }
+            if (buffer.trim()) onRecord(JSON.parse(buffer));
+        }
+        
+        function addBatchRow(tbody, record) {
+            const ok = record.status === 'success';
+            const answers = Object.entries(record.detected_answers || {}).map(([q, a]) => q + '.' + a).join(' ');
+            const row = document.createElement('tr');
+            row.dataset.page = record.page;
+            for (const value of [
+                record.page,
+                ok ? '✅' : '❌',
+                ok ? record.detected_bubbles + ' / ' + record.total_questions : '',
+                ok ? answers : (record.error || record.status)
+            ]) {
+                const cell = document.createElement('td');
+                cell.textContent = value;
+                row.appendChild(cell);
+            }
+            // Pages finish out of order; keep the table sorted by page
+            const next = Array.from(tbody.rows).find(r => Number(r.dataset.page) > record.page);
+            tbody.insertBefore(row, next || null);
+        }
+        
+        async function scanBatch(file, options, resultDiv) {
+            const formData = new FormData();
+            formData.append('file', file);
+            formData.append('expected_options', options);
+            
+            resultDiv.style.display = 'block';
+            resultDiv.innerHTML = '<p id="batchProgress"></p>' +
+                '<div style="max-height: 400px; overflow-y: auto;"><table class="batch-table">' +
+                '<thead><tr><th>Page</th><th>Status</th><th>Marked</th><th>Answers</th></tr></thead>' +
+                '<tbody></tbody></table></div>';
+            const progress = document.getElementById('batchProgress');
+            const tbody = resultDiv.querySelector('tbody');
+            progress.textContent = '⏳ Uploading ' + file.name + '...';
+            
+            let total = 0, done = 0, failed = 0;
+            try {
+                const response = await fetch('/scan-omr/batch', {
+                    method: 'POST',
+                    body: formData,
+                    headers: { 'Accept': 'application/x-ndjson' }
+                });
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error || data.message || response.statusText);
+                }
+                
+                await readNDJSON(response, (record) => {
+                    if (record.status === 'started') {
+                        total = record.pages;
+                    } else if (record.status === 'complete') {
+                        progress.textContent = '✅ Scanned ' + record.pages + ' pages' +
+                            (record.failed ? ' (' + record.failed + ' failed)' : '');
+                        return;
+                    } else if (record.page === undefined) {
+                        throw new Error(record.error || record.message);
+                    } else {
+                        done++;
+                        if (record.status !== 'success') failed++;
+                        addBatchRow(tbody, record);
+                    }
+                    progress.textContent = '⏳ Scanned ' + done + ' / ' + total + ' pages' +
+                        (failed ? ' (' + failed + ' failed)' : '') + '...';
+                });
+            } catch (error) {
+                progress.textContent = '❌ Error: ' + error.message;
+            }
+        }
         </script>
     </div>
     </body>
@@ -256,11 +650,66 @@ def index():
     """
 
 
+def render_sheet_pdf(questions: int, options: int, columns: int) -> bytes:
+    """Generate a blank OMR sheet and return its bytes"""
+    with PDF_GENERATION_SECONDS.time(kind="sheet"):
+        pdf_bytes = render_blank_pdf(questions, options, columns)
+    
+    if not pdf_bytes:
+        raise ValueError(f"PDF generation produced no output for {questions}q/{options}opt/{columns}col")
+    
+    logger.info(f"Generated PDF: {len(pdf_bytes)} bytes")
+    return pdf_bytes
+
+
+def render_copies(sheet_pdf: bytes, copies: int) -> bytes:
+    """Build a multi-copy PDF from a rendered sheet"""
+    with PDF_GENERATION_SECONDS.time(kind="copies"):
+        return build_copies(sheet_pdf, copies)
+
+
+def sheet_cache_key(questions: int, options: int, columns: int, copies: int = 1) -> tuple:
+    """PDF cache key of a sheet configuration"""
+    return (questions, options, columns, copies) if copies > 1 else (questions, options, columns)
+
+
+def get_sheet_pdf(questions: int, options: int, columns: int, copies: int = 1) -> tuple:
+    """Return (pdf_bytes, etag) for a sheet configuration, rendering on a cache miss"""
+    if copies > 1:
+        # Copies reference the cached single sheet as one shared Form XObject
+        return pdf_cache.get_or_render(
+            sheet_cache_key(questions, options, columns, copies),
+            lambda: render_copies(get_sheet_pdf(questions, options, columns)[0], copies)
+        )
+    return pdf_cache.get_or_render(
+        sheet_cache_key(questions, options, columns),
+        lambda: render_sheet_pdf(questions, options, columns)
+    )
+
+
+def warm_pdf_cache(configs: list):
+    """Pre-render sheet configurations into the PDF cache"""
+    for questions, options, columns in configs:
+        try:
+            get_sheet_pdf(questions, options, columns)
+        except Exception as e:
+            logger.warning(f"PDF cache warm-up failed for {questions}q/{options}opt/{columns}col: {e}")
+    logger.info(f"PDF cache warmed with {len(configs)} configurations")
+
+
+def render_class_set(blank_pdf: bytes, students: list) -> bytes:
+    """Build a personalised multi-page class set PDF"""
+    with PDF_GENERATION_SECONDS.time(kind="class_set"):
+        return build_class_set_pdf(blank_pdf, students)
+
+
 @app.post("/generate-and-download-pdf")
 async def generate_and_download_pdf(
     questions: int = Form(50),
     options: int = Form(4),
-    columns: int = Form(2)
+    columns: int = Form(2),
+    copies: int = Form(1),
+    if_none_match: str = Header(None)
 ):
     """
     Endpoint: Generate OMR PDF and return as downloadable file
@@ -269,40 +718,38 @@ async def generate_and_download_pdf(
         - questions: Number of questions (1-200)
         - options: Options per question (2-6)
         - columns: Grid columns (1-3)
+        - copies: Number of identical pages in the PDF (1-500)
+        - If-None-Match header: ETag of a previously downloaded PDF
     
-    Returns: PDF file download
+    Returns: PDF file download (served from cache when already rendered),
+    or 304 Not Modified when the ETag matches
     """
     try:
         # Validate inputs
         questions = max(1, min(questions, 200))
         options = max(2, min(options, 6))
         columns = max(1, min(columns, 3))
+        copies = max(1, min(copies, 500))
         
-        logger.info(f"Generating OMR: {questions} questions, {options} options, {columns} columns")
+        logger.info(f"Generating OMR: {questions} questions, {options} options, {columns} columns, {copies} copies")
         
-        # Create temporary PDF file
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        pdf_path = str(TMP_DIR / f"omr_{timestamp}.pdf")
+        # The ETag follows from the configuration, so revalidation never renders
+        etag = pdf_cache.etag(sheet_cache_key(questions, options, columns, copies))
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
         
-        # Generate PDF using pdf_converter module
-        logger.info(f"Generating PDF: {pdf_path}")
-        generate_omr_pdf(
-            output_path=pdf_path,
-            questions=questions,
-            options=options,
-            columns=columns
-        )
+        # ReportLab only runs on a cache miss, off the event loop
+        pdf_bytes, etag = await asyncio.to_thread(get_sheet_pdf, questions, options, columns, copies)
         
-        # Verify PDF was created
-        if not os.path.exists(pdf_path):
-            logger.error(f"PDF file was not created: {pdf_path}")
-            raise FileNotFoundError(f"PDF generation failed for {pdf_path}")
-        
-        logger.info(f"Returning PDF for download: {pdf_path}")
-        return FileResponse(
-            pdf_path,
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"omr_sheet_{questions}q_{options}opt_{timestamp}.pdf"
+        return Response(
+            content=pdf_bytes,
             media_type="application/pdf",
-            filename=f"omr_sheet_{questions}q_{options}opt_{timestamp}.pdf"
+            headers={
+                "ETag": etag,
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            }
         )
         
     except Exception as e:
@@ -313,10 +760,99 @@ async def generate_and_download_pdf(
         }
 
 
+@app.post("/generate-class-set")
+async def generate_class_set(
+    roster: UploadFile = File(...),
+    questions: int = Form(50),
+    options: int = Form(4),
+    columns: int = Form(2),
+    output: str = Form("pdf")
+):
+    """
+    Endpoint: Generate one pre-printed sheet per student on a roster
+    
+    Parameters:
+        - roster: CSV (student_id,name) or JSON list of students
+        - questions: Number of questions (1-200)
+        - options: Options per question (2-6)
+        - columns: Grid columns (1-3)
+        - output: "pdf" for one multi-page PDF, "zip" for one PDF per student
+    
+    Returns: PDF download (built in full before it is sent) or streamed ZIP
+    """
+    questions = max(1, min(questions, 200))
+    options = max(2, min(options, 6))
+    columns = max(1, min(columns, 3))
+    output = output.lower()
+    
+    try:
+        if output not in ("pdf", "zip"):
+            raise ValueError(f"Unknown output '{output}', use 'pdf' or 'zip'")
+        students = parse_roster(await roster.read(), roster.filename)
+        blank_pdf, _ = await asyncio.to_thread(get_sheet_pdf, questions, options, columns)
+    except Exception as e:
+        logger.error(f"Error preparing class set: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": str(e), "message": "Failed to generate class set"}
+        )
+    
+    logger.info(f"Generating class set: {len(students)} students, {questions}q/{options}opt/{columns}col as {output}")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    if output == "zip":
+        # Entries are rendered and sent one student at a time
+        return StreamingResponse(
+            iter_class_set_zip(blank_pdf, students),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="omr_class_set_{timestamp}.zip"'}
+        )
+    
+    # A single PDF is only complete once saved; use output=zip to stream large rosters
+    pdf_bytes = await asyncio.to_thread(render_class_set, blank_pdf, students)
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="omr_class_set_{timestamp}.pdf"'}
+    )
+
+
+@app.get("/sheet-layout")
+def sheet_layout(questions: int = 50, options: int = 4, columns: int = 2):
+    """
+    Endpoint: Bubble geometry of a generated sheet
+    
+    Parameters:
+        - questions: Number of questions (1-200)
+        - options: Options per question (2-6)
+        - columns: Grid columns (1-3)
+    
+    Returns: JSON with page size and bubble centers/radii in points (origin top-left)
+    """
+    questions = max(1, min(questions, 200))
+    options = max(2, min(options, 6))
+    columns = max(1, min(columns, 3))
+    
+    try:
+        return get_layout(questions, options, columns).to_dict()
+    except Exception as e:
+        logger.error(f"Error extracting sheet layout: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": str(e), "message": "Failed to build sheet layout"}
+        )
+
+
 @app.post("/scan-omr")
 async def scan_omr(
     file: UploadFile = File(...),
-    expected_options: int = Form(4)
+    expected_options: int = Form(4),
+    dpi: int = Form(DEFAULT_DPI),
+    questions: int = Form(0),
+    columns: int = Form(0),
+    deskew: bool = Form(True),
+    exam_id: int = Form(0),
+    profile: bool = Form(False)
 ):
     """
     Endpoint: Scan a filled OMR sheet and detect answers
@@ -324,6 +860,12 @@ async def scan_omr(
     Parameters:
         - file: OMR sheet image/PDF (JPEG, PNG, or PDF)
         - expected_options: Expected number of options per question (2-6)
+        - dpi: Rasterization resolution for PDF uploads (72-600)
+        - questions, columns: Sheet configuration if known (enables the fast layout path)
+        - deskew: Estimate and correct the sheet's rotation before detection
+        - exam_id: Also score the sheet against this exam's answer key
+        - profile: Bypass the result cache and return per-stage wall time
+          and peak memory in raw_result["timings"]
     
     Returns: JSON with detected answers in format:
     {
@@ -339,57 +881,98 @@ async def scan_omr(
         "detected_bubbles": 50
     }
     """
+    request_started = time.perf_counter()
     try:
         # Validate inputs
         expected_options = max(2, min(expected_options, 6))
+        dpi = clamp_dpi(dpi)
         
         logger.info(f"Scanning OMR sheet with {expected_options} expected options")
         
-        # Save uploaded file temporarily
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_ext = Path(file.filename).suffix.lower()
-        temp_path = str(TMP_DIR / f"scan_{timestamp}{file_ext}")
-        
-        # Save file to disk
-        with open(temp_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        logger.info(f"Saved uploaded file: {temp_path}")
-        
-        # If PDF, convert to image first
-        if file_ext == ".pdf":
-            try:
-                from pdf2image import convert_from_path
-                images = convert_from_path(temp_path, first_page=1, last_page=1)
-                if images:
-                    import tempfile
-                    png_path = str(TMP_DIR / f"scan_{timestamp}_page1.png")
-                    images[0].save(png_path, "PNG")
-                    temp_path = png_path
-                    logger.info(f"Converted PDF to image: {png_path}")
-            except ImportError:
-                logger.error("pdf2image not installed, please install it: pip install pdf2image pillow")
+        # Resolve the answer key first so an unknown exam costs no detection
+        key = None
+        if exam_id:
+            key = await get_exam_key(exam_id)
+            if key is None:
                 return JSONResponse(
                     status_code=400,
-                    content={"error": "PDF processing not available", "message": "Please upload an image (PNG/JPEG) instead"}
+                    content={"status": "error", "error": f"Exam {exam_id} not found", "message": "Failed to scan OMR sheet"}
                 )
         
-        # Detect OMR answers
-        logger.info(f"Detecting answers from: {temp_path}")
-        result = detect_omr_answers(temp_path, expected_options=expected_options)
+        # Read upload into memory; decoding happens in the worker, no tmp/ files
+        started = time.perf_counter()
+        content = await file.read()
+        read_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Received upload: {file.filename} ({len(content)} bytes)")
+        
+        # Rasterize and detect in the process pool so the event loop stays free;
+        # a re-upload of the same content reuses the earlier result
+        try:
+            started = time.perf_counter()
+            result, cached = await detect_upload(
+                content, file.filename, expected_options, dpi,
+                questions=questions or None, columns=columns or None, deskew=deskew, profile=profile
+            )
+            if profile:
+                # Time outside the worker: upload read, pool queueing and IPC
+                round_trip_ms = (time.perf_counter() - started) * 1000
+                result["timings"]["request"] = {
+                    "read_ms": round(read_ms, 2),
+                    "round_trip_ms": round(round_trip_ms, 2),
+                    "queue_ms": round(max(0.0, round_trip_ms - result["timings"]["total_ms"]), 2),
+                }
+        except ImportError:
+            SCAN_FAILURES.inc(reason="pdf_unavailable")
+            logger.error("No PDF rasterizer installed, please install it: pip install PyMuPDF (or pdf2image pillow)")
+            return JSONResponse(
+                status_code=400,
+                content={"error": "PDF processing not available", "message": "Please upload an image (PNG/JPEG) instead"}
+            )
         
         logger.info(f"Detection result: {result}")
         
-        return {
+        response = {
             "status": "success",
             "detected_answers": result.get("detected_answers", {}),
             "total_questions": result.get("total_questions", 0),
             "detected_bubbles": len(result.get("detected_answers", {})),
+            "cached": cached,
             "raw_result": result
         }
+        if key is not None:
+            response["evaluation"] = score_answers(
+                result.get("detected_answers", {}), key, result.get("multiple_marks")
+            )
+        SCAN_SECONDS.observe(time.perf_counter() - request_started, cached=str(cached).lower())
+        return response
         
+    except PoolSaturated as e:
+        SCAN_FAILURES.inc(reason="queue_full")
+        logger.warning(f"Rejecting scan, detection queue full ({detection_pool.pending} pending)")
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+            content={
+                "status": "error",
+                "error": str(e),
+                "message": "Server busy, please retry shortly"
+            }
+        )
+    
+    except asyncio.TimeoutError:
+        SCAN_FAILURES.inc(reason="timeout")
+        logger.error(f"Scan timed out after {detection_pool.timeout}s")
+        return JSONResponse(
+            status_code=504,
+            content={
+                "status": "error",
+                "error": f"Detection timed out after {detection_pool.timeout} seconds",
+                "message": "Failed to scan OMR sheet"
+            }
+        )
+    
     except Exception as e:
+        SCAN_FAILURES.inc(reason=failure_reason(e))
         logger.error(f"Error scanning OMR: {e}", exc_info=True)
         return JSONResponse(
             status_code=400,
@@ -401,10 +984,309 @@ async def scan_omr(
         )
 
 
+@app.post("/scan-omr/batch")
+async def scan_omr_batch(
+    file: UploadFile = File(...),
+    expected_options: int = Form(4),
+    dpi: int = Form(DEFAULT_DPI),
+    questions: int = Form(0),
+    columns: int = Form(0),
+    deskew: bool = Form(True),
+    accept: str = Header(None)
+):
+    """
+    Endpoint: Scan every page of a multi-page PDF and stream results
+    
+    Parameters:
+        - file: Multi-page PDF, one OMR sheet per page
+        - expected_options: Expected number of options per question (2-6)
+        - dpi: Rasterization resolution for each page (72-600)
+        - questions, columns: Sheet configuration if known (enables the fast layout path)
+        - deskew: Estimate and correct each sheet's rotation before detection
+    
+    Returns: NDJSON stream (Server-Sent Events with Accept: text/event-stream),
+    the page count first, then one line per page as it finishes:
+    {"status": "started", "pages": 300}
+    {"page": 3, "status": "success", "detected_answers": {...}, "total_questions": 50, "detected_bubbles": 50}
+    ...
+    {"status": "complete", "pages": 300, "failed": 0}
+    """
+    expected_options = max(2, min(expected_options, 6))
+    dpi = clamp_dpi(dpi)
+    content = await file.read()
+    
+    if not is_pdf(content, file.filename):
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": "Batch scanning requires a PDF", "message": "Upload a multi-page PDF"}
+        )
+    
+    if detection_pool.pending >= detection_pool.max_queue:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": str(detection_pool.retry_after)},
+            content={"status": "error", "error": "Detection queue is full, retry later", "message": "Server busy, please retry shortly"}
+        )
+    
+    logger.info(f"Batch scanning {file.filename} ({len(content)} bytes) with {expected_options} expected options")
+    
+    async def stream():
+        try:
+            async for record in scan_pdf_pages(
+                detection_pool, content, expected_options=expected_options, dpi=dpi,
+                questions=questions or None, columns=columns or None, deskew=deskew
+            ):
+                yield record
+        except Exception as e:
+            logger.error(f"Error in batch scan: {e}", exc_info=True)
+            yield {"status": "error", "error": str(e), "message": "Failed to scan PDF"}
+    
+    return stream_records(stream(), accept)
+
+
+@app.post("/evaluate-batch")
+async def evaluate_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    answer_key: str = Form(None),
+    exam_id: int = Form(0),
+    expected_options: int = Form(4),
+    dpi: int = Form(DEFAULT_DPI),
+    questions: int = Form(0),
+    columns: int = Form(0),
+    deskew: bool = Form(True),
+    accept: str = Header(None)
+):
+    """
+    Endpoint: Evaluate many sheets against one answer key
+    
+    Parameters:
+        - files: Sheet images or single-page PDFs
+        - answer_key: JSON answer key, e.g. {"1": "A", "2": "C", ...}, or
+          {"answers": {...}, "weights": {"1": 2, ...}, "negative": 0.25} for
+          per-question marks and negative marking
+        - exam_id: Store results under this exam; without answer_key the
+          exam's stored key is used, with one the exam's key is replaced
+        - expected_options: Expected number of options per question (2-6)
+        - dpi: Rasterization resolution for PDF uploads (72-600)
+        - questions, columns: Sheet configuration if known (enables the fast layout path)
+        - deskew: Estimate and correct each sheet's rotation before detection
+    
+    Returns: NDJSON stream (Server-Sent Events with Accept: text/event-stream),
+    the sheet count first, then one line per sheet as it finishes:
+    {"status": "started", "sheets": 2000}
+    {"index": 0, "file": "s1.png", "status": "success", "score": 45, "total": 50, "percentage": 90.0, ...}
+    ...
+    {"status": "complete", "summary": {"sheets": 2000, "mean_percentage": 71.4, ...}}
+    """
+    expected_options = max(2, min(expected_options, 6))
+    dpi = clamp_dpi(dpi)
+    
+    try:
+        if answer_key and exam_id:
+            key = await update_exam_key(exam_id, json.loads(answer_key))
+        elif answer_key:
+            key = AnswerKey.from_spec(answer_key)
+        elif exam_id:
+            key = await get_exam_key(exam_id)
+            if key is None:
+                raise ValueError(f"exam {exam_id} not found")
+        else:
+            raise ValueError("answer_key or exam_id is required")
+    except (ValueError, TypeError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": f"Invalid answer key: {e}", "message": "Failed to evaluate sheets"}
+        )
+    
+    names = [file.filename for file in files]
+    contents = [await file.read() for file in files]
+    logger.info(f"Evaluating {len(contents)} sheets against a {len(key)}-question key")
+    
+    async def stream():
+        yield {"status": "started", "sheets": len(contents)}
+        records = []
+        store = EvaluationStore(db_pool, exam_id, key, batch_size=DB_BATCH_SIZE) if exam_id else None
+        results = detection_pool.imap_unordered(
+            scan_source, contents, expected_options=expected_options, dpi=dpi,
+            questions=questions or None, columns=columns or None, deskew=deskew
+        )
+        try:
+            async for index, detection, error in results:
+                observe_sheet("evaluate", detection, error)
+                record = evaluation_record(index, names[index], detection, key, error=error)
+                records.append(record)
+                if store is not None:
+                    store.add(record, sheet_hash=content_hash(contents[index]))
+                    if store.full:
+                        await asyncio.to_thread(store.flush)
+                yield record
+        finally:
+            # Keep what was scored even if the client disconnects mid-stream
+            if store is not None:
+                await asyncio.to_thread(store.flush)
+        
+        summary = summarize(records, key)
+        if store is not None:
+            summary["stored"] = store.written
+        yield {"status": "complete", "summary": summary}
+    
+    return stream_records(stream(), accept)
+
+
+@app.post("/jobs/scan", status_code=202)
+async def submit_scan_job(
+    files: List[UploadFile] = File(...),
+    expected_options: int = Form(4),
+    dpi: int = Form(DEFAULT_DPI),
+    questions: int = Form(0),
+    columns: int = Form(0),
+    deskew: bool = Form(True)
+):
+    """
+    Endpoint: Queue sheets for scanning and return immediately
+    
+    Parameters:
+        - files: Sheet images and/or PDFs (every PDF page is a sheet)
+        - expected_options: Expected number of options per question (2-6)
+        - dpi: Rasterization resolution for PDF pages (72-600)
+        - questions, columns: Sheet configuration if known (enables the fast layout path)
+        - deskew: Estimate and correct each sheet's rotation before detection
+    
+    Returns: JSON with the job id and number of sheets; poll GET /jobs/{job_id}
+    """
+    params = {
+        "expected_options": max(2, min(expected_options, 6)),
+        "dpi": clamp_dpi(dpi),
+        "questions": questions or None,
+        "columns": columns or None,
+        "deskew": deskew,
+    }
+    uploads = [(file.filename, await file.read()) for file in files]
+    
+    try:
+        job = await asyncio.to_thread(create_job, db_pool, uploads, params, max_items=JOB_MAX_ITEMS)
+    except JobTooLarge as e:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "error", "error": str(e), "message": "Split the upload into smaller jobs"}
+        )
+    except ImportError as e:
+        return JSONResponse(
+            status_code=500,
+            content={"status": "error", "error": str(e), "message": "PDF support unavailable"}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": str(e), "message": "Failed to create scan job"}
+        )
+    
+    job_runner.wake()
+    logger.info(f"Queued scan job {job['job_id']} with {job['total']} sheets")
+    return {"status": "queued", **job, "status_url": f"/jobs/{job['job_id']}"}
+
+
+@app.get("/jobs/{job_id}")
+async def scan_job_status(job_id: str, after: int = 0, limit: int = 100):
+    """
+    Endpoint: Progress and results of a scan job
+    
+    Parameters:
+        - after: Return results completed after this cursor (the previous
+          response's "cursor"; 0 for the first poll)
+        - limit: Maximum results per response (1-1000)
+    
+    Returns: JSON with status, done/failed/total counts, progress percentage,
+    results in completion order and the cursor for the next poll
+    """
+    limit = max(1, min(limit, 1000))
+    job = await asyncio.to_thread(get_job, db_pool, job_id, after=max(0, after), limit=limit)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "error": f"job {job_id} not found"})
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_scan_job(job_id: str):
+    """Endpoint: Cancel a job's remaining sheets; results so far are kept"""
+    if not await asyncio.to_thread(cancel_job, db_pool, job_id):
+        return JSONResponse(
+            status_code=404, content={"status": "error", "error": f"no active job {job_id}"}
+        )
+    return {"status": "cancelled", "job_id": job_id}
+
+
+@app.post("/exams/{exam_id}/answer-key")
+async def set_exam_answer_key(exam_id: int, answer_key: str = Form(...)):
+    """
+    Endpoint: Create or replace an exam's answer key
+    
+    Parameters:
+        - answer_key: JSON answer key, plain or extended (weights/negative)
+    
+    Returns: JSON with the exam id and number of questions
+    """
+    try:
+        key = await update_exam_key(exam_id, json.loads(answer_key))
+    except (ValueError, TypeError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "error": f"Invalid answer key: {e}", "message": "Failed to save answer key"}
+        )
+    return {"status": "success", "exam_id": exam_id, "total_questions": len(key)}
+
+
+@app.get("/exams/{exam_id}/evaluations")
+async def exam_evaluations(exam_id: int, limit: int = 100, offset: int = 0):
+    """
+    Endpoint: Stored evaluations of an exam, best score first
+    
+    Parameters:
+        - limit: Maximum rows (1-1000)
+        - offset: Rows to skip (for paging)
+    
+    Returns: JSON with score statistics and the requested page of evaluations
+    """
+    limit = max(1, min(limit, 1000))
+    offset = max(0, offset)
+    
+    key = await get_exam_key(exam_id)
+    
+    return {
+        "statistics": await asyncio.to_thread(exam_statistics, db_pool, exam_id),
+        "evaluations": await asyncio.to_thread(
+            query_evaluations, db_pool, exam_id, limit=limit, offset=offset, answer_key=key
+        )
+    }
+
+
 @app.get("/health")
 async def health():
     """Health check"""
-    return {"status": "healthy", "service": "OMR Sheet Generator", "version": "1.0.0"}
+    return {
+        "status": "healthy",
+        "service": "OMR Sheet Generator",
+        "version": "1.0.0",
+        "scan_queue": detection_pool.stats(),
+        "pdf_cache": pdf_cache.stats(),
+        "answer_keys": exam_keys.stats(),
+        "scan_cache": scan_cache.stats()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/metrics/stages")
+async def stage_timings():
+    """
+    Aggregated per-stage scan timings: count, mean, p50/p95 over the recent
+    window and max (plus peak memory from profiled requests)
+    """
+    return {"profiling": PROFILE_STAGES, **stage_metrics.snapshot()}
 
 
 @app.get("/info")
@@ -417,8 +1299,19 @@ async def info():
         "endpoints": {
             "GET /": "HTML interface for OMR generation and scanning",
             "POST /generate-and-download-pdf": "Generate and download OMR PDF sheet",
+            "POST /generate-class-set": "Generate one pre-printed sheet per student on a roster",
+            "GET /sheet-layout": "Bubble geometry of a generated sheet",
             "POST /scan-omr": "Scan and detect answers from filled OMR sheet",
+            "POST /scan-omr/batch": "Scan every page of a multi-page PDF (NDJSON stream)",
+            "POST /evaluate-batch": "Evaluate many sheets against one answer key (NDJSON stream)",
+            "POST /jobs/scan": "Queue sheets for background scanning, returns a job id",
+            "GET /jobs/{job_id}": "Scan job progress and results (cursor paging)",
+            "DELETE /jobs/{job_id}": "Cancel a scan job",
+            "POST /exams/{exam_id}/answer-key": "Create or replace an exam's answer key",
+            "GET /exams/{exam_id}/evaluations": "Stored evaluations of an exam, best score first",
             "GET /health": "Health check",
+            "GET /metrics": "Prometheus metrics",
+            "GET /metrics/stages": "Aggregated per-stage scan timings",
             "GET /info": "Service information"
         }
     }
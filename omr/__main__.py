@@ -0,0 +1,5 @@
+import sys
+
+from omr.cli import main
+
+sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Multi-page PDF scanning.
+
+The upload is split into single-page PDFs once (omr.rasterizer.split_pages)
+and each page is a scan_sheet job in a DetectionPool carrying only that
+page, so pages are rasterized in the workers (rendering holds the GIL and
+would otherwise stall the event loop) and no job pickles the whole document.
+Only a small window of pages is in flight at once, so worker memory stays
+bounded regardless of how many pages the batch PDF has. Results are yielded
+in completion order, not page order.
+"""
+
+import asyncio
+import logging
+
+from omr.engine import SATURATED_BACKOFF, DetectionPool, PoolSaturated
+from omr.metrics import observe_sheet
+from omr.rasterizer import DEFAULT_DPI, page_count, split_pages
+from omr.scan import scan_sheet
+
+logger = logging.getLogger(__name__)
+
+
+def _page_result(page: int, task: asyncio.Future) -> dict:
+    """Convert a finished page task into a result record"""
+    try:
+        result = task.result()
+    except asyncio.TimeoutError as e:
+        observe_sheet("batch", error=e)
+        return {"page": page, "status": "error", "error": "Detection timed out"}
+    except Exception as e:
+        observe_sheet("batch", error=e)
+        return {"page": page, "status": "error", "error": str(e)}
+
+    observe_sheet("batch", result)
+    answers = result.get("detected_answers", {})
+    return {
+        "page": page,
+        "status": result.get("status", "success"),
+        "detected_answers": answers,
+        "total_questions": result.get("total_questions", 0),
+        "detected_bubbles": len(answers),
+        "error": result.get("error"),
+    }
+
+
+async def scan_pdf_pages(pool: DetectionPool, data: bytes,
+                         expected_options: int = 4, dpi: int = DEFAULT_DPI,
+                         questions: int = None, columns: int = None, deskew: bool = True,
+                         window: int = None):
+    """
+    Detect answers on every page of an in-memory PDF.
+
+    Parameters:
+        - pool: DetectionPool used for detection
+        - data: Raw PDF bytes
+        - expected_options: Expected number of options per question
+        - dpi: Resolution used to rasterize each page
+        - questions, columns: Sheet configuration, enables the layout fast path
+        - deskew: Estimate and correct each page's rotation before detection
+        - window: Maximum pages in flight in the pool at once
+          (default: number of pool workers)
+
+    Yields: {"status": "started", "pages": total} once the page count is
+    known, one result dict per page as soon as it finishes, then a summary
+    dict with "status": "complete".
+    """
+    pages = await asyncio.to_thread(split_pages, data)
+    total = len(pages) if pages is not None else await asyncio.to_thread(page_count, data)
+    window = max(1, min(window or pool.workers, pool.max_queue))
+    logger.info(f"Batch scan: {total} pages, window {window}")
+    yield {"status": "started", "pages": total}
+
+    pending = {}
+    next_page = 1
+    failed = 0
+
+    try:
+        while next_page <= total or pending:
+            if next_page <= total and len(pending) < window:
+                # Without PyMuPDF the whole document goes with a page number
+                source, page = (pages[next_page - 1], 1) if pages is not None else (data, next_page)
+                try:
+                    # The .pdf name keeps scan_sheet on the PDF path even
+                    # without %PDF- magic bytes
+                    future = pool.submit(
+                        scan_sheet, source, "batch.pdf", expected_options, dpi=dpi, questions=questions,
+                        columns=columns, deskew=deskew, page=page
+                    )
+                except PoolSaturated:
+                    # Shared pool is busy with other requests; wait for our own
+                    # jobs if we have any, otherwise back off briefly.
+                    if not pending:
+                        await asyncio.sleep(SATURATED_BACKOFF)
+                        continue
+                else:
+                    task = asyncio.ensure_future(pool.wait(future))
+                    pending[task] = next_page
+                    if pages is not None:
+                        pages[next_page - 1] = None
+                    next_page += 1
+                    continue
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                record = _page_result(pending.pop(task), task)
+                if record["status"] != "success":
+                    failed += 1
+                yield record
+    finally:
+        # Client went away or the generator was closed early
+        for task in pending:
+            task.cancel()
+
+    yield {"status": "complete", "pages": total, "failed": failed}
@@ -0,0 +1,24 @@
+"""
+Blank answer sheet PDF bytes.
+
+omr.pdf_converter.generate_omr_pdf is only known to take an output file path
+(a str), so it is never handed a file-like object: the sheet is written to a
+private temporary file, read back and the file removed.
+"""
+
+import os
+import tempfile
+
+
+def render_blank_pdf(questions: int, options: int, columns: int) -> bytes:
+    """Generate a blank OMR sheet with generate_omr_pdf and return the PDF bytes"""
+    from omr.pdf_converter import generate_omr_pdf
+
+    fd, path = tempfile.mkstemp(prefix="omr_sheet_", suffix=".pdf")
+    os.close(fd)
+    try:
+        generate_omr_pdf(output_path=path, questions=questions, options=options, columns=columns)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(path)
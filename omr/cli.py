@@ -0,0 +1,218 @@
+"""
+Command-line bulk scanner.
+
+Usage:
+    python -m omr scan SHEETS_DIR --key exam.json --out results.csv
+    python -m omr scan class_scans.pdf --key exam.json --workers 8 --out results.jsonl
+    python -m omr scan SHEETS_DIR --key exam.json --out results.parquet --resume
+
+Inputs are image files, PDFs (every page is one sheet) or directories, which
+are walked recursively. Sheets are detected in parallel worker processes and
+scored against the answer key as they finish; each result is appended to the
+output straight away. Successfully scored sheets are recorded in a checkpoint
+file (<out>.checkpoint) so an interrupted run continues with --resume, which
+also retries the sheets that failed. Before retrying, --resume drops every
+output row not backed by the checkpoint (failed sheets and rows written after
+the last checkpoint), so the output holds one row per sheet.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+from omr.evaluation import iter_evaluate
+from omr.rasterizer import DEFAULT_DPI, clamp_dpi, page_count
+from omr.scoring import AnswerKey
+from omr.writers import BASE_COLUMNS, WRITERS, flatten_record, open_writer, question_columns, retain_rows
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+def collect_sheets(inputs) -> list:
+    """
+    Expand input paths into (key, path, page) sheet entries.
+
+    page is None for image files and 1-based for PDF pages; key identifies
+    the sheet in the output and the checkpoint ("scans/a.png", "class.pdf#3").
+    """
+    sheets = []
+    for root in map(Path, inputs):
+        if root.is_dir():
+            files = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS | {".pdf"})
+        elif root.exists():
+            files = [root]
+        else:
+            raise FileNotFoundError(f"Input not found: {root}")
+
+        for path in files:
+            if path.suffix.lower() == ".pdf":
+                pages = page_count(path.read_bytes())
+                sheets.extend((f"{path}#{page}", path, page) for page in range(1, pages + 1))
+            else:
+                sheets.append((str(path), path, None))
+    return sheets
+
+
+def iter_sources(sheets: list):
+    """
+    Yield detection sources for sheets.
+
+    Image paths and (pdf_path, page) tuples are passed to the workers, which
+    read and rasterize them, so a page that fails to render becomes an error
+    row for that sheet instead of ending the run.
+    """
+    for _, path, page in sheets:
+        yield path if page is None else (path, page)
+
+
+def read_checkpoint(path: Path) -> set:
+    if not path.exists():
+        return set()
+    return {line for line in path.read_text(encoding="utf-8").splitlines() if line}
+
+
+class Progress:
+    """Single-line progress on stderr (a line every `every` sheets when not a TTY)"""
+
+    def __init__(self, total: int, quiet: bool = False, every: int = 100):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.percentage_sum = 0.0
+        self.quiet = quiet
+        self.every = every
+        self.tty = sys.stderr.isatty()
+        self.started = time.perf_counter()
+
+    def update(self, record: dict):
+        self.done += 1
+        if record["status"] == "success":
+            self.percentage_sum += record["percentage"]
+        else:
+            self.failed += 1
+
+        if self.quiet or not (self.tty or self.done % self.every == 0 or self.done == self.total):
+            return
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        line = f"[{self.done}/{self.total}] {rate:.1f} sheets/s, {self.failed} failed"
+        sys.stderr.write(f"\r{line}" if self.tty else f"{line}\n")
+        sys.stderr.flush()
+
+    def finish(self) -> str:
+        if self.tty and not self.quiet and self.done:
+            sys.stderr.write("\n")
+        scored = self.done - self.failed
+        mean = self.percentage_sum / scored if scored else 0.0
+        elapsed = time.perf_counter() - self.started
+        return (f"Scanned {self.done} sheets in {elapsed:.1f}s "
+                f"({self.failed} failed, mean {mean:.2f}%)")
+
+
+def scan_command(args) -> int:
+    with open(args.key, encoding="utf-8") as f:
+        spec = json.load(f)
+    if args.negative is not None:
+        if not (isinstance(spec, dict) and "answers" in spec):
+            spec = {"answers": spec}
+        spec["negative"] = args.negative
+    answer_key = AnswerKey.from_spec(spec)
+    questions = answer_key.questions.tolist()
+
+    out = Path(args.out)
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else out.with_name(out.name + ".checkpoint")
+    completed = read_checkpoint(checkpoint_path) if args.resume else set()
+
+    sheets = collect_sheets(args.inputs)
+    todo = [sheet for sheet in sheets if sheet[0] not in completed]
+    if completed:
+        print(f"Resuming: {len(sheets) - len(todo)} of {len(sheets)} sheets already done", file=sys.stderr)
+        # Rows of sheets about to be retried would otherwise stay next to their new rows
+        dropped = retain_rows(
+            out, lambda row: row.get("status") == "success" and row.get("file") in completed, fmt=args.format
+        )
+        if dropped:
+            print(f"Dropped {dropped} earlier rows of sheets to retry", file=sys.stderr)
+    if not todo:
+        print("Nothing to scan", file=sys.stderr)
+        return 0
+
+    columns = BASE_COLUMNS + question_columns(questions)
+    writer = open_writer(out, columns, fmt=args.format, append=bool(completed))
+    checkpoint = open(checkpoint_path, "a" if completed else "w", encoding="utf-8")
+    progress = Progress(len(todo), quiet=args.quiet)
+    unsaved = []
+
+    try:
+        records = iter_evaluate(
+            iter_sources(todo), answer_key, workers=args.workers,
+            expected_options=args.expected_options, dpi=args.dpi,
+            questions=args.questions, columns=args.columns, deskew=not args.no_deskew
+        )
+        for record in records:
+            key = todo[record["index"]][0]
+            record["file"] = key
+            # Failed sheets stay out of the checkpoint so --resume retries them
+            if record["status"] == "success":
+                unsaved.append(key)
+            # Checkpoint only what the writer reports as durable
+            if writer.write(flatten_record(record, questions)):
+                checkpoint.write("".join(f"{k}\n" for k in unsaved))
+                checkpoint.flush()
+                unsaved = []
+            progress.update(record)
+    finally:
+        writer.close()
+        checkpoint.write("".join(f"{k}\n" for k in unsaved))
+        checkpoint.close()
+
+    print(progress.finish(), file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="omr", description="OMR sheet tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="Scan and score a directory or PDF of sheets")
+    scan.add_argument("inputs", nargs="+", help="Image files, PDFs or directories")
+    scan.add_argument("--key", required=True, help="Answer key JSON ({\"1\": \"A\", ...}, [\"A\", ...] "
+                                                    "or {\"answers\": ..., \"weights\": ..., \"negative\": ...})")
+    scan.add_argument("--out", required=True, help="Output file (.csv, .jsonl) or Parquet directory (.parquet)")
+    scan.add_argument("--format", choices=sorted(WRITERS), help="Output format (default: from --out extension)")
+    scan.add_argument("--negative", type=float, help="Fraction of a question's marks deducted per wrong answer")
+    scan.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    scan.add_argument("--resume", action="store_true", help="Skip sheets listed in the checkpoint, retry failed ones and append")
+    scan.add_argument("--checkpoint", help="Checkpoint file (default: <out>.checkpoint)")
+    scan.add_argument("--expected-options", type=int, default=4, help="Options per question (2-6)")
+    scan.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="PDF rasterization resolution")
+    scan.add_argument("--questions", type=int, help="Sheet question count (enables the layout fast path)")
+    scan.add_argument("--columns", type=int, help="Sheet column count (enables the layout fast path)")
+    scan.add_argument("--no-deskew", action="store_true", help="Skip rotation estimation and correction")
+    scan.add_argument("--quiet", action="store_true", help="No progress output")
+    scan.set_defaults(handler=scan_command)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    if args.command == "scan":
+        args.expected_options = max(2, min(args.expected_options, 6))
+        args.dpi = clamp_dpi(args.dpi)
+
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        print("\nInterrupted, rerun with --resume to continue", file=sys.stderr)
+        return 130
+    except (OSError, ValueError, ImportError) as e:
+        print(f"omr: error: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,277 @@
+"""
+Process-pool execution engine for OMR detection.
+
+Bubble detection is CPU bound (OpenCV thresholding, contour search, grouping),
+so running it inside an ``async`` endpoint blocks every other request on the
+worker. ``DetectionPool`` runs jobs in separate processes, bounds the number of
+in-flight jobs and applies a per-job timeout.
+
+A worker that dies (segfault in native code, OOM kill) breaks a
+``ProcessPoolExecutor`` for good, and a job that hangs past its timeout would
+hold its worker forever. The pool therefore replaces a broken executor and
+resubmits the jobs that were in it, each alone in a one-off worker process so
+a job that crashes its worker again fails by itself. The workers of a job
+still running after its timeout are killed, which takes the same path.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a batch submission when the pool is full
+SATURATED_BACKOFF = 0.2
+
+# Times a job is resubmitted (in its own process) after its executor broke; a
+# job that kills its worker every time then fails with BrokenProcessPool
+MAX_RESUBMITS = 1
+
+
+class PoolSaturated(Exception):
+    """Raised when the pool already holds its maximum number of jobs"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Detection queue is full, retry later")
+        self.retry_after = retry_after
+
+
+class DetectionPool:
+    """
+    Bounded process pool for detection jobs.
+
+    Parameters:
+        - workers: Number of worker processes (default: CPU count)
+        - max_queue: Maximum jobs running or waiting at once (default: 4 per worker)
+        - timeout: Seconds to wait for a single job before giving up
+        - retry_after: Seconds suggested to clients when the pool is full
+    """
+
+    def __init__(self, workers: int = None, max_queue: int = None,
+                 timeout: float = 60.0, retry_after: int = 5):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.max_queue = max(1, max_queue if max_queue is not None else self.workers * 4)
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.restarts = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs currently running or queued"""
+        return self._pending
+
+    def start(self):
+        """Create the worker processes (called lazily on first submit)"""
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting detection pool: {self.workers} workers, queue {self.max_queue}")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_queue": self.max_queue,
+            "restarts": self.restarts,
+        }
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise PoolSaturated(self.retry_after)
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Submit a job to the pool.
+
+        The slot is released when the job actually finishes, not when a caller
+        stops waiting for it, so timed-out jobs still count against the queue.
+        If the job's worker pool breaks, it is resubmitted up to MAX_RESUBMITS
+        times, isolated in a single-use process.
+
+        Raises PoolSaturated when the queue is full.
+        """
+        self.start()
+        self._acquire()
+        future = Future()
+        try:
+            self._attempt(future, fn, args, kwargs, MAX_RESUBMITS)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._cancel_attempt)
+        return future
+
+    def _attempt(self, future: Future, fn, args: tuple, kwargs: dict, resubmits: int,
+                 isolated: bool = False):
+        """Run fn in the shared (or a single-use) executor, resolving `future` when it finishes"""
+        if isolated:
+            executor = ProcessPoolExecutor(max_workers=1)
+            inner = executor.submit(fn, *args, **kwargs)
+            inner.add_done_callback(lambda _: executor.shutdown(wait=False))
+        else:
+            with self._lock:
+                executor = self._executor
+            if executor is None:
+                raise RuntimeError("Detection pool is shut down")
+            try:
+                inner = executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                executor = self._replace(executor)
+                inner = executor.submit(fn, *args, **kwargs)
+        future.attempt = (executor, inner)
+        inner.add_done_callback(
+            lambda inner: self._attempt_done(future, inner, executor, fn, args, kwargs, resubmits)
+        )
+
+    def _attempt_done(self, future: Future, inner: Future, executor, fn, args: tuple, kwargs: dict,
+                      resubmits: int):
+        if inner.cancelled():
+            self._release()
+            future.cancel()
+            return
+
+        error = inner.exception()
+        if isinstance(error, BrokenProcessPool) and not future.cancelled():
+            self._replace(executor)
+            if resubmits > 0:
+                logger.warning(f"Detection worker died, resubmitting {getattr(fn, '__name__', 'job')}")
+                try:
+                    self._attempt(future, fn, args, kwargs, resubmits - 1, isolated=True)
+                    return
+                except Exception as e:
+                    error = e
+
+        self._release()
+        try:
+            if error is None:
+                future.set_result(inner.result())
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            # The caller cancelled (stopped waiting) meanwhile
+            pass
+
+    @staticmethod
+    def _cancel_attempt(future: Future):
+        # Drops the job if it has not started yet; see _recycle for running ones
+        if future.cancelled():
+            future.attempt[1].cancel()
+
+    def _replace(self, broken) -> ProcessPoolExecutor:
+        """Swap a broken shared executor for a new one (once) and return the current one"""
+        with self._lock:
+            if self._executor is broken:
+                logger.warning("Detection pool broken, starting new workers")
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.restarts += 1
+            current = self._executor
+        # Work left in the broken executor has already failed with BrokenProcessPool
+        broken.shutdown(wait=False)
+        return current
+
+    def _recycle(self, future: Future):
+        """
+        Kill the workers of an abandoned job that is still running.
+
+        A ProcessPoolExecutor cannot stop one task or replace one worker, so
+        every worker of that executor is terminated. The executor breaks, is
+        replaced, and the other jobs that were running in it are resubmitted.
+        """
+        executor, inner = future.attempt
+        if inner.done():
+            return
+        logger.warning("Detection job still running after its timeout, recycling workers")
+        # _processes is private but stable across CPython 3.8+
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+
+    async def wait(self, future: Future, timeout: float = None):
+        """
+        Await a submitted job.
+
+        Raises asyncio.TimeoutError when the job does not finish within the
+        timeout; the job is dropped if it has not started, and its workers
+        are recycled if it has.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._recycle(future)
+            raise
+
+    async def run(self, fn, *args, timeout: float = None, **kwargs):
+        """
+        Run a job in the pool and await its result.
+
+        Raises PoolSaturated when the queue is full and asyncio.TimeoutError
+        when the job does not finish within the timeout.
+        """
+        return await self.wait(self.submit(fn, *args, **kwargs), timeout)
+
+    async def imap_unordered(self, fn, items, window: int = None, **kwargs):
+        """
+        Run fn(item, **kwargs) for every item, yielding results as they finish.
+
+        At most `window` items (default: number of workers) are in the pool
+        at once, so large batches neither flood the shared queue nor pickle
+        every input up front. When the pool is full because of other
+        requests, submission waits instead of failing.
+
+        Yields: (index, result, error) with error None on success
+        """
+        window = max(1, min(window or self.workers, self.max_queue))
+        items = iter(enumerate(items))
+        pending = {}
+        next_item = next(items, None)
+
+        try:
+            while next_item is not None or pending:
+                if next_item is not None and len(pending) < window:
+                    index, item = next_item
+                    try:
+                        future = self.submit(fn, item, **kwargs)
+                    except PoolSaturated:
+                        if not pending:
+                            await asyncio.sleep(SATURATED_BACKOFF)
+                            continue
+                    else:
+                        task = asyncio.ensure_future(self.wait(future))
+                        pending[task] = index
+                        next_item = next(items, None)
+                        continue
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        result, error = task.result(), None
+                    except asyncio.TimeoutError:
+                        result, error = None, TimeoutError("Detection timed out")
+                    except Exception as e:
+                        result, error = None, e
+                    yield index, result, error
+        finally:
+            for task in pending:
+                task.cancel()
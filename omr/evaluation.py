@@ -0,0 +1,166 @@
+"""
+Batch evaluation of OMR sheets against a shared answer key.
+
+The answer key is normalized once and scoring happens in the parent process;
+worker processes only run detection. Sheets are fanned out over a process
+pool and results are yielded as they complete, followed by aggregate
+statistics for the whole batch.
+"""
+
+import logging
+import os
+import statistics
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from omr.rasterizer import DEFAULT_DPI
+from omr.scan import scan_source
+from omr.scoring import AnswerKey
+
+logger = logging.getLogger(__name__)
+
+
+def score_answers(detected_answers: dict, answer_key, multiple_marks=None) -> dict:
+    """
+    Compare detected answers with an answer key.
+
+    Parameters:
+        - detected_answers: {question: "A"} from detection
+        - answer_key: AnswerKey, or a plain key (see AnswerKey.from_spec)
+        - multiple_marks: Questions detected with more than one mark
+
+    Returns: score, total, percentage, correct, wrong and unmarked counts
+    (plus max_score for weighted keys).
+    """
+    key = AnswerKey.from_spec(answer_key)
+    return key.score(key.encode(detected_answers, multiple_marks))
+
+
+def evaluation_record(index: int, name: str, detection: dict, answer_key, error=None) -> dict:
+    """Build the per-sheet result from a detection result or an error"""
+    if error is not None:
+        return {"index": index, "file": name, "status": "error", "error": str(error)}
+    if detection.get("status", "success") != "success":
+        return {"index": index, "file": name, "status": "error", "error": detection.get("error")}
+
+    answers = detection.get("detected_answers", {})
+    record = {"index": index, "file": name, "status": "success"}
+    multiple_marks = detection.get("multiple_marks")
+    record.update(score_answers(answers, answer_key, multiple_marks))
+    record["detected_answers"] = answers
+    if multiple_marks:
+        record["multiple_marks"] = multiple_marks
+    return record
+
+
+def summarize(records: list, answer_key) -> dict:
+    """Aggregate statistics over per-sheet evaluation records"""
+    answer_key = AnswerKey.from_spec(answer_key)
+    scored = [r for r in records if r["status"] == "success"]
+    summary = {
+        "sheets": len(records),
+        "evaluated": len(scored),
+        "failed": len(records) - len(scored),
+        "total": len(answer_key),
+    }
+    if not scored:
+        return summary
+
+    percentages = [r["percentage"] for r in scored]
+    summary.update({
+        "mean_score": round(statistics.mean(r["score"] for r in scored), 2),
+        "mean_percentage": round(statistics.mean(percentages), 2),
+        "median_percentage": round(statistics.median(percentages), 2),
+        "min_percentage": min(percentages),
+        "max_percentage": max(percentages),
+        "stdev_percentage": round(statistics.pstdev(percentages), 2),
+    })
+
+    # Share of sheets answering each question correctly (item difficulty),
+    # one comparison over the whole (sheets x questions) code matrix
+    correct = answer_key.correct_matrix(answer_key.encode_batch(scored))
+    summary["question_correct_rate"] = {
+        int(q): round(float(rate), 3) for q, rate in zip(answer_key.questions, correct.mean(axis=0))
+    }
+    return summary
+
+
+def _source_name(source, index: int) -> str:
+    if isinstance(source, tuple):
+        return f"{Path(source[0]).name}#{source[1]}"
+    if isinstance(source, (str, Path)):
+        return Path(source).name
+    return f"sheet_{index + 1}"
+
+
+def iter_evaluate(sources, answer_key, workers: int = None, expected_options: int = 4,
+                  dpi: int = DEFAULT_DPI, questions: int = None, columns: int = None,
+                  deskew: bool = True, fill_threshold: float = None):
+    """
+    Evaluate sheets in parallel, yielding a record per sheet as it completes.
+
+    Parameters:
+        - sources: Iterable of file paths, (pdf_path, page) tuples, upload
+          bytes or decoded images
+        - answer_key: AnswerKey or plain/extended key spec, parsed once
+        - workers: Worker processes (default: CPU count)
+        - expected_options, dpi, questions, columns, deskew: Passed to detection
+        - fill_threshold: Minimum fill percentage for a marked bubble (None
+          keeps the detector's default)
+
+    Yields: Per-sheet records with "index" in input order and "file".
+    """
+    answer_key = AnswerKey.from_spec(answer_key)
+    workers = max(1, workers or os.cpu_count() or 1)
+    window = workers * 2
+    options = {"expected_options": expected_options, "dpi": dpi, "questions": questions, "columns": columns,
+               "deskew": deskew, "fill_threshold": fill_threshold}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for index, source in enumerate(sources):
+            pending[executor.submit(scan_source, source, **options)] = (index, _source_name(source, index))
+            if len(pending) < window:
+                continue
+
+            # Keep at most `window` sheets in flight
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _record(future, pending.pop(future), answer_key)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _record(future, pending.pop(future), answer_key)
+
+
+def _record(future, tag: tuple, answer_key: AnswerKey) -> dict:
+    index, name = tag
+    try:
+        detection = future.result()
+    except Exception as e:
+        logger.warning(f"Evaluation failed for {name}: {e}")
+        return evaluation_record(index, name, None, answer_key, error=e)
+    return evaluation_record(index, name, detection, answer_key)
+
+
+def evaluate_batch(sources, answer_key, workers: int = None, expected_options: int = 4,
+                   dpi: int = DEFAULT_DPI, questions: int = None, columns: int = None,
+                   deskew: bool = True, fill_threshold: float = None) -> dict:
+    """
+    Evaluate many sheets against one answer key (parameters as for
+    iter_evaluate).
+
+    Returns:
+    {
+        "results": [per-sheet records in input order],
+        "summary": {"sheets": ..., "mean_percentage": ..., ...}
+    }
+    """
+    answer_key = AnswerKey.from_spec(answer_key)
+    records = list(iter_evaluate(
+        sources, answer_key, workers=workers, expected_options=expected_options,
+        dpi=dpi, questions=questions, columns=columns, deskew=deskew, fill_threshold=fill_threshold
+    ))
+    records.sort(key=lambda r: r["index"])
+    return {"results": records, "summary": summarize(records, answer_key)}
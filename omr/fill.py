@@ -0,0 +1,56 @@
+"""
+Vectorized bubble fill-ratio computation.
+
+Computing fill with a mask and cv2.countNonZero per bubble costs one Python
+iteration per bubble (1,200 for a 200-question x 6-option sheet).
+disc_fill_ratios computes the fill of every bubble in a few array operations,
+with one gather of precomputed disc offsets per bubble radius, and returns
+fill percentages (0-100) as a float64 array in input order.
+"""
+
+import numpy as np
+
+
+def _disc_offsets(radius: int) -> tuple:
+    """Row and column offsets of every pixel in a disc of the given radius"""
+    yy, xx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = xx * xx + yy * yy <= radius * radius
+    return yy[inside], xx[inside]
+
+
+def disc_fill_ratios(binary: np.ndarray, centers, radii, threshold: int = None) -> np.ndarray:
+    """
+    Fill percentage of circular ROIs.
+
+    Parameters:
+        - binary: Binary image, ink pixels non-zero
+        - centers: (N, 2) array of (x, y) pixel centers
+        - radii: Scalar or (N,) array of pixel radii
+        - threshold: When given, `binary` is a grayscale image and pixels at
+          or below the threshold count as ink, so only the sampled pixels are
+          binarized instead of the whole image
+
+    Bubbles sharing a radius are sampled together with one fancy-indexing
+    gather. Discs that fall partly outside the image report 0.
+    """
+    centers = np.rint(np.asarray(centers, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    radii = np.broadcast_to(np.maximum(1, np.rint(radii)).astype(np.int64), (len(centers),))
+    height, width = binary.shape[:2]
+    fills = np.zeros(len(centers), dtype=np.float64)
+
+    for radius in np.unique(radii):
+        group = np.flatnonzero(radii == radius)
+        cx, cy = centers[group, 0], centers[group, 1]
+        inside = (cx - radius >= 0) & (cy - radius >= 0) & (cx + radius < width) & (cy + radius < height)
+        group, cx, cy = group[inside], cx[inside], cy[inside]
+        if not len(group):
+            continue
+
+        dy, dx = _disc_offsets(int(radius))
+        samples = binary[cy[:, None] + dy[None, :], cx[:, None] + dx[None, :]]
+        if threshold is not None:
+            samples = samples <= threshold
+        fills[group] = np.count_nonzero(samples, axis=1) * (100.0 / len(dy))
+
+    return fills
+
@@ -0,0 +1,387 @@
+"""
+Asynchronous scan jobs backed by SQLite.
+
+Submitting a job stores the uploads (job_files) and one work item per sheet
+(job_items; every page of a PDF is an item) and returns a job id at once.
+PDFs are stored split into single-page PDFs, so a worker receives only the
+page it scans, never the whole upload.
+A ``JobRunner`` in the server process feeds items to the shared
+DetectionPool, keeping a small window in flight and taking the next item
+from each unfinished job in turn, so a 5,000-sheet job does not hold up one
+submitted after it.
+
+Every finished item gets a per-job completion sequence number; clients poll
+``get_job(..., after=cursor)`` for just the results that arrived since their
+last poll. Job state lives in the database, so items left running by a
+crash or restart are re-queued when the runner starts. Uploads are deleted
+once a job finishes, and the runner purges finished jobs after a retention
+period.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+from omr.engine import SATURATED_BACKOFF, DetectionPool, PoolSaturated
+from omr.loader import is_pdf
+from omr.metrics import observe_sheet
+from omr.rasterizer import page_count, split_pages
+from omr.scan import scan_sheet
+from omr.storage import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+CANCELLED = "cancelled"
+
+# Stored files kept in memory by the runner (only unsplit PDFs are read by
+# more than one item)
+FILE_CACHE_SIZE = 4
+
+# Seconds between purges of finished jobs by the runner
+PURGE_INTERVAL = 3600
+
+
+class JobTooLarge(Exception):
+    """Raised by create_job when a job has more sheets than allowed"""
+
+    def __init__(self, items: int, limit: int):
+        super().__init__(f"Job has {items} sheets, the limit is {limit}")
+        self.items = items
+        self.limit = limit
+
+
+def create_job(pool: ConnectionPool, files: list, params: dict, max_items: int = None) -> dict:
+    """
+    Store a scan job.
+
+    Parameters:
+        - pool: ConnectionPool
+        - files: List of (filename, bytes); PDFs contribute one item per page
+        - params: Keyword arguments for omr.scan.scan_sheet (expected_options,
+          dpi, questions, columns, deskew)
+        - max_items: Maximum sheets (PDF pages included), checked before
+          anything is stored
+
+    Returns: {"job_id": ..., "total": items}
+    Raises ValueError for an empty job or an unreadable PDF, JobTooLarge
+    above max_items.
+    """
+    if not files:
+        raise ValueError("A job needs at least one file")
+
+    counts = [page_count(data) if is_pdf(data, name) else 1 for name, data in files]
+    if max_items is not None and sum(counts) > max_items:
+        raise JobTooLarge(sum(counts), max_items)
+
+    # Stored files are (name, data, first_page); items are (file_index, page)
+    stored, items = [], []
+    for (name, data), pages in zip(files, counts):
+        split = split_pages(data) if pages > 1 else None
+        if split is None:
+            items.extend((len(stored), page) for page in range(1, pages + 1))
+            stored.append((name, data, 1))
+            continue
+        for page, page_data in enumerate(split, start=1):
+            items.append((len(stored), page))
+            stored.append((name, page_data, page))
+
+    job_id = uuid.uuid4().hex
+    with pool.connection() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, params, total) VALUES (?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(params), len(items))
+        )
+        conn.executemany(
+            "INSERT INTO job_files (job_id, file_index, name, data, first_page) VALUES (?, ?, ?, ?, ?)",
+            [(job_id, index, name, data, first_page) for index, (name, data, first_page) in enumerate(stored)]
+        )
+        conn.executemany(
+            "INSERT INTO job_items (job_id, item_index, file_index, page) VALUES (?, ?, ?, ?)",
+            [(job_id, index, file_index, page) for index, (file_index, page) in enumerate(items)]
+        )
+    logger.info(f"Created job {job_id}: {len(files)} files, {len(items)} sheets")
+    return {"job_id": job_id, "total": len(items)}
+
+
+def get_job(pool: ConnectionPool, job_id: str, after: int = 0, limit: int = 100):
+    """
+    Job status, progress and results completed after the `after` cursor, or
+    None if the job does not exist.
+
+    Results are in completion order; pass the returned "cursor" as `after`
+    on the next poll.
+    """
+    with pool.connection() as conn:
+        row = conn.execute(
+            "SELECT status, params, total, done, failed, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        results = conn.execute(
+            "SELECT seq, result FROM job_items WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, limit)
+        ).fetchall()
+
+    status, params, total, done, failed, created_at, started_at, finished_at = row
+    finished = done + failed
+    cursor = results[-1][0] if results else after
+    return {
+        "job_id": job_id,
+        "status": status,
+        "total": total,
+        "done": done,
+        "failed": failed,
+        "progress": round(100.0 * finished / total, 1) if total else 100.0,
+        "params": json.loads(params),
+        "created_at": created_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "results": [json.loads(result) for _, result in results],
+        "cursor": cursor,
+        "has_more": cursor < finished,
+    }
+
+
+def cancel_job(pool: ConnectionPool, job_id: str) -> bool:
+    """Stop scheduling a job's remaining items; False if it is not active"""
+    with pool.connection() as conn:
+        cancelled = conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status IN (?, ?)",
+            (CANCELLED, job_id, QUEUED, RUNNING)
+        ).rowcount
+        if cancelled:
+            conn.execute(
+                "UPDATE job_items SET status = ? WHERE job_id = ? AND status = ?", (CANCELLED, job_id, QUEUED)
+            )
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+    return bool(cancelled)
+
+
+def purge_jobs(pool: ConnectionPool, older_than_hours: float) -> int:
+    """Delete finished jobs older than the given age; returns the number removed"""
+    with pool.connection() as conn:
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < datetime('now', ?)",
+            (COMPLETE, CANCELLED, f"-{older_than_hours} hours")
+        )]
+        for table, column in (("job_items", "job_id"), ("job_files", "job_id"), ("jobs", "id")):
+            conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(job_id,) for job_id in ids])
+    return len(ids)
+
+
+def _item_record(index: int, name: str, page: int, result: dict = None, error: Exception = None) -> dict:
+    if error is not None:
+        message = "Detection timed out" if isinstance(error, asyncio.TimeoutError) else str(error)
+        return {"index": index, "file": name, "page": page, "status": "error", "error": message}
+    answers = result.get("detected_answers", {})
+    return {
+        "index": index,
+        "file": name,
+        "page": page,
+        "status": result.get("status", "success"),
+        "detected_answers": answers,
+        "total_questions": result.get("total_questions", 0),
+        "detected_bubbles": len(answers),
+        "multiple_marks": result.get("multiple_marks", []),
+        "error": result.get("error"),
+    }
+
+
+class JobRunner:
+    """
+    Background scheduler that runs queued job items in a DetectionPool.
+
+    Parameters:
+        - pool: DetectionPool shared with the interactive endpoints
+        - db_pool: ConnectionPool of the jobs database
+        - window: Items in the detection pool at once (default: pool workers),
+          leaving queue room for interactive scans
+        - poll_interval: Seconds between checks for work when idle
+        - retention_hours: Finished jobs older than this are purged every
+          PURGE_INTERVAL seconds (None keeps them)
+    """
+
+    def __init__(self, pool: DetectionPool, db_pool: ConnectionPool, window: int = None,
+                 poll_interval: float = 1.0, retention_hours: float = None):
+        self.pool = pool
+        self.db_pool = db_pool
+        self.window = max(1, min(window or pool.workers, pool.max_queue))
+        self.poll_interval = poll_interval
+        self.retention_hours = retention_hours
+        self._next_purge = 0.0
+
+        self._task = None
+        self._wakeup = None
+        self._last_job = 0
+        self._files = OrderedDict()
+
+    async def start(self):
+        """Re-queue interrupted items and start scheduling"""
+        requeued = await asyncio.to_thread(self._requeue)
+        if requeued:
+            logger.info(f"Re-queued {requeued} interrupted job items")
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Signal that new work was submitted"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _requeue(self) -> int:
+        with self.db_pool.connection() as conn:
+            return conn.execute(
+                "UPDATE job_items SET status = ? WHERE status = ? AND job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?))",
+                (QUEUED, RUNNING, QUEUED, RUNNING)
+            ).rowcount
+
+    async def _run(self):
+        in_flight = {}
+        while True:
+            try:
+                if self.retention_hours is not None and time.monotonic() >= self._next_purge:
+                    self._next_purge = time.monotonic() + PURGE_INTERVAL
+                    purged = await asyncio.to_thread(purge_jobs, self.db_pool, self.retention_hours)
+                    if purged:
+                        logger.info(f"Purged {purged} finished jobs older than {self.retention_hours}h")
+
+                while len(in_flight) < self.window:
+                    item = await asyncio.to_thread(self._claim)
+                    if item is None:
+                        break
+                    task = asyncio.create_task(self._detect(item))
+                    in_flight[task] = item
+
+                if not in_flight:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    item = in_flight.pop(task)
+                    await asyncio.to_thread(self._finish, item, task.result())
+            except asyncio.CancelledError:
+                for task in in_flight:
+                    task.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Job runner error: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    def _claim(self):
+        """
+        Mark the next item of the next active job (round-robin) as running.
+
+        Returns: (job_id, item_index, name, page, data, data_page, params) or
+        None, where data_page is the page to scan within the stored data
+        """
+        with self.db_pool.connection() as conn:
+            jobs = conn.execute(
+                "SELECT rowid, id, params FROM jobs WHERE status IN (?, ?) ORDER BY rowid", (QUEUED, RUNNING)
+            ).fetchall()
+            # Start after the job served last, wrapping around
+            jobs = [job for job in jobs if job[0] > self._last_job] + [job for job in jobs if job[0] <= self._last_job]
+
+            for rowid, job_id, params in jobs:
+                while True:
+                    row = conn.execute(
+                        "SELECT item_index, file_index, page FROM job_items "
+                        "WHERE job_id = ? AND status = ? ORDER BY item_index LIMIT 1", (job_id, QUEUED)
+                    ).fetchone()
+                    if row is None:
+                        break
+                    # Conditional update: another server process may have taken it
+                    claimed = conn.execute(
+                        "UPDATE job_items SET status = ? WHERE job_id = ? AND item_index = ? AND status = ?",
+                        (RUNNING, job_id, row[0], QUEUED)
+                    ).rowcount
+                    if not claimed:
+                        continue
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, CURRENT_TIMESTAMP) "
+                        "WHERE id = ? AND status = ?", (RUNNING, job_id, QUEUED)
+                    )
+                    self._last_job = rowid
+                    name, data, first_page = self._file(conn, job_id, row[1])
+                    return job_id, row[0], name, row[2], data, row[2] - first_page + 1, json.loads(params)
+        return None
+
+    def _file(self, conn, job_id: str, file_index: int) -> tuple:
+        key = (job_id, file_index)
+        if key not in self._files:
+            self._files[key] = conn.execute(
+                "SELECT name, data, first_page FROM job_files WHERE job_id = ? AND file_index = ?",
+                (job_id, file_index)
+            ).fetchone()
+            while len(self._files) > FILE_CACHE_SIZE:
+                self._files.popitem(last=False)
+        self._files.move_to_end(key)
+        return self._files[key]
+
+    async def _detect(self, item: tuple) -> dict:
+        job_id, index, name, page, data, data_page, params = item
+        while True:
+            try:
+                result = await self.pool.run(scan_sheet, data, name, page=data_page, **params)
+            except PoolSaturated:
+                # Interactive requests have the pool; wait for a free slot
+                await asyncio.sleep(SATURATED_BACKOFF)
+                continue
+            except Exception as e:
+                logger.warning(f"Job {job_id} item {index} failed: {e}")
+                observe_sheet("job", error=e)
+                return _item_record(index, name, page, error=e)
+            observe_sheet("job", result)
+            return _item_record(index, name, page, result)
+
+    def _finish(self, item: tuple, record: dict):
+        """Store an item's result and advance the job's counters"""
+        job_id, index = item[0], item[1]
+        failed = record["status"] != "success"
+        with self.db_pool.connection() as conn:
+            stored = conn.execute(
+                "UPDATE job_items SET status = ?, result = ? WHERE job_id = ? AND item_index = ? AND status = ?",
+                (record["status"], json.dumps(record), job_id, index, RUNNING)
+            ).rowcount
+            if not stored:
+                # Cancelled, or already finished by another process after a re-queue
+                return
+            conn.execute(
+                "UPDATE jobs SET done = done + ?, failed = failed + ? WHERE id = ?",
+                (int(not failed), int(failed), job_id)
+            )
+            finished, total, status = conn.execute(
+                "SELECT done + failed, total, status FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            conn.execute(
+                "UPDATE job_items SET seq = ? WHERE job_id = ? AND item_index = ?", (finished, job_id, index)
+            )
+            if finished >= total and status == RUNNING:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (COMPLETE, job_id)
+                )
+                conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+                for key in [key for key in self._files if key[0] == job_id]:
+                    del self._files[key]
+                logger.info(f"Job {job_id} complete: {total} sheets")
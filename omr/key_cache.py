@@ -0,0 +1,95 @@
+"""
+In-process cache of exam answer keys.
+
+Answer keys are stored as JSON text in the exams table. Looking one up per
+evaluation would cost a SQLite round-trip, a json.loads and re-encoding the
+key for the scorer. ``AnswerKeyCache`` keeps ready-to-use AnswerKey objects
+(uint8 answers, weight and penalty arrays) per exam id, so the hot path is a
+dict lookup. Entries expire after a TTL so edits made by other processes are
+picked up; updates through this process invalidate immediately.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from omr.scoring import AnswerKey
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerKeyCache:
+    """
+    LRU of decoded answer keys by exam id with a TTL.
+
+    Parameters:
+        - loader: Callable exam_id -> stored key spec (decoded JSON) or None
+        - ttl: Seconds before an entry is reloaded (0 disables expiry)
+        - max_entries: Maximum cached exams
+    """
+
+    def __init__(self, loader, ttl: float = 300.0, max_entries: int = 1024):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, exam_id: int, load: bool = True):
+        """
+        Return the exam's AnswerKey, or None if the exam does not exist.
+
+        With load=False only the cache is consulted, so async callers can take
+        the fast path inline and run the database load in a thread on a miss.
+        Raises ValueError if the stored key is invalid.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(exam_id)
+            if entry is not None and (not self.ttl or now - entry[1] < self.ttl):
+                self._entries.move_to_end(exam_id)
+                self.hits += 1
+                return entry[0]
+        if not load:
+            return None
+
+        with self._lock:
+            self.misses += 1
+        spec = self.loader(exam_id)
+        if spec is None:
+            return None
+        key = AnswerKey.from_spec(spec)
+        self.put(exam_id, key)
+        return key
+
+    def put(self, exam_id: int, key: AnswerKey):
+        """Cache a key, e.g. right after the exam was saved"""
+        # Shared between concurrent requests, so make the arrays read-only
+        for array in (key.questions, key.answers, key.weights, key.penalties):
+            array.flags.writeable = False
+        with self._lock:
+            self._entries[exam_id] = (key, time.monotonic())
+            self._entries.move_to_end(exam_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, exam_id: int = None):
+        """Drop one exam's key, or every key when exam_id is None"""
+        with self._lock:
+            if exam_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(exam_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,456 @@
+"""
+Template-geometry fast path for sheets produced by generate_omr_pdf.
+
+Every blank sheet is generated by us, so bubble positions are deterministic
+for a given (questions, options, columns). Instead of rediscovering bubbles
+with contour search, area filtering and aspect-ratio checks, the geometry is
+read once from the generated PDF's vector paths and cached. A scan is then
+registered to that geometry and fill is sampled in fixed ROIs.
+
+Geometry is expressed in PDF points with the origin at the top-left corner
+of the page, so it maps onto a rasterized page by a plain scale.
+"""
+
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from omr.fill import disc_fill_ratios
+
+logger = logging.getLogger(__name__)
+
+OPTION_LABELS = "ABCDEF"
+
+# Bubble outline radius range in points, used to pick bubbles out of the
+# other vector paths on the page
+BUBBLE_RADIUS_RANGE = (3.0, 20.0)
+
+# Fraction of the bubble radius sampled for fill, keeping the printed ring out
+INNER_RADIUS = 0.65
+
+# Registration works on a downscaled copy of the scan at most this wide (pixels)
+REGISTRATION_WIDTH = 600
+
+# Template renderings kept per layout. Registration asks for two sizes per
+# scan (full and half registration level), whose heights follow the scan's
+# aspect ratio, so the sizes seen by a long-running worker are unbounded.
+TEMPLATE_CACHE_SIZE = 8
+
+# Maximum translation accepted from registration, as a fraction of page size
+MAX_SHIFT = 0.08
+
+# Page scale searched when the scan does not cover exactly the page (scanner
+# margins, fit-to-page, cropped photos), relative to image size / page size.
+# Coarse log steps over the range, then fine steps around the best one.
+SCALE_RANGE = (0.80, 1.25)
+COARSE_SCALE_STEP = 0.02
+FINE_SCALE_STEP = 0.004
+
+# Phase correlation peaks: clean scans score ~0.4 and a 2% scale error drops
+# to ~0.06, so a page-fit match below SEARCH_RESPONSE triggers the scale
+# search. Very noisy sheets still score ~0.12-0.15 at the right scale, while
+# blank or unrelated images stay under 0.01; below MIN_RESPONSE registration
+# is rejected and callers fall back to contour detection.
+SEARCH_RESPONSE = 0.15
+MIN_RESPONSE = 0.08
+
+
+class SheetLayout:
+    """
+    Bubble geometry of one generated sheet page.
+
+    Parameters:
+        - page_size: (width, height) of the page in points
+        - options: Options per question
+        - bubbles: Rows of (question, option_index, x, y, radius) in points,
+          origin at the top-left corner
+        - pdf: Blank sheet PDF the layout came from (page `page`), used as the
+          registration template when available
+    """
+
+    def __init__(self, page_size, options: int, bubbles, pdf: bytes = None, page: int = 1):
+        self.page_size = (float(page_size[0]), float(page_size[1]))
+        self.options = options
+        self.bubbles = np.asarray(bubbles, dtype=np.float64).reshape(-1, 5)
+        self.pdf = pdf
+        self.page = page
+        self._templates = OrderedDict()
+
+    def template(self, width: int, height: int) -> np.ndarray:
+        """
+        Inverted (ink = high) float32 rendering of the blank sheet at the
+        given size. The most recent TEMPLATE_CACHE_SIZE sizes are cached.
+
+        Without the source PDF, only the bubble rings are drawn.
+        """
+        key = (width, height)
+        if key not in self._templates:
+            if self.pdf is not None:
+                from omr.rasterizer import render_page
+
+                dpi = 72.0 * width / self.page_size[0]
+                blank = render_page(self.pdf, self.page, dpi=max(1, int(np.ceil(dpi))))
+                blank = cv2.resize(blank, (width, height), interpolation=cv2.INTER_AREA)
+                template = (255 - blank).astype(np.float32)
+            else:
+                scale_x, scale_y = width / self.page_size[0], height / self.page_size[1]
+                template = np.zeros((height, width), dtype=np.float32)
+                for _, _, x, y, r in self.bubbles:
+                    center = (int(round(x * scale_x)), int(round(y * scale_y)))
+                    radius = max(1, int(round(r * scale_x)))
+                    cv2.circle(template, center, radius, 255.0, max(1, radius // 4))
+            self._templates[key] = template
+            while len(self._templates) > TEMPLATE_CACHE_SIZE:
+                self._templates.popitem(last=False)
+        self._templates.move_to_end(key)
+        return self._templates[key]
+
+    @property
+    def questions(self) -> np.ndarray:
+        """Sorted unique question numbers on the page"""
+        return np.unique(self.bubbles[:, 0]).astype(int)
+
+    @property
+    def total_questions(self) -> int:
+        return len(self.questions)
+
+    def to_dict(self) -> dict:
+        return {
+            "page_size": list(self.page_size),
+            "options": self.options,
+            "bubbles": [
+                {"question": int(q), "option": OPTION_LABELS[int(o)],
+                 "x": round(float(x), 2), "y": round(float(y), 2), "r": round(float(r), 2)}
+                for q, o, x, y, r in self.bubbles
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SheetLayout":
+        bubbles = [
+            (b["question"], OPTION_LABELS.index(b["option"]), b["x"], b["y"], b["r"])
+            for b in data["bubbles"]
+        ]
+        return cls(data["page_size"], data["options"], bubbles)
+
+
+def _find_circles(page) -> list:
+    """Return (x, y, r) of every circle-like vector path on a PyMuPDF page"""
+    min_r, max_r = BUBBLE_RADIUS_RANGE
+    circles = []
+    for path in page.get_drawings():
+        items = path.get("items", [])
+        if not items or any(item[0] != "c" for item in items):
+            continue
+        rect = path["rect"]
+        w, h = rect.width, rect.height
+        if abs(w - h) > 0.1 * max(w, h):
+            continue
+        r = (w + h) / 4
+        if min_r <= r <= max_r:
+            circles.append(((rect.x0 + rect.x1) / 2, (rect.y0 + rect.y1) / 2, r))
+    return circles
+
+
+def _group_rows(circles: list) -> list:
+    """Group circles into rows by y proximity, each row sorted by x"""
+    circles = sorted(circles, key=lambda c: c[1])
+    rows, current = [], [circles[0]]
+    for circle in circles[1:]:
+        if circle[1] - current[-1][1] > circle[2]:
+            rows.append(sorted(current))
+            current = []
+        current.append(circle)
+    rows.append(sorted(current))
+    return rows
+
+
+def _question_labels(page) -> list:
+    """Return (x1, y_center, number) for every integer word on the page"""
+    labels = []
+    for x0, y0, x1, y1, word, *_ in page.get_text("words"):
+        word = word.rstrip(".):")
+        if word.isdigit():
+            labels.append((x1, (y0 + y1) / 2, int(word)))
+    return labels
+
+
+def _label_for(group: list, labels: list):
+    """Find the printed question number just left of a bubble group"""
+    x, y, r = group[0]
+    best = None
+    for lx, ly, number in labels:
+        if lx <= x and abs(ly - y) <= r and (best is None or lx > best[0]):
+            best = (lx, number)
+    return best[1] if best else None
+
+
+def extract_layout(pdf_data: bytes, options: int, page: int = 1) -> SheetLayout:
+    """
+    Read bubble geometry from a generated sheet PDF.
+
+    Bubbles are the circle paths on the page. They are grouped into rows and
+    chunked into groups of `options`; each group is numbered by the printed
+    question label to its left, or in reading order when no label is found.
+
+    Raises ValueError if the page has no bubbles or the bubble count does
+    not split into groups of `options`.
+    """
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+
+    with pymupdf.open(stream=pdf_data, filetype="pdf") as doc:
+        pdf_page = doc[page - 1]
+        page_size = (pdf_page.rect.width, pdf_page.rect.height)
+        circles = _find_circles(pdf_page)
+        labels = _question_labels(pdf_page)
+
+    if not circles:
+        raise ValueError("No bubbles found in sheet PDF")
+
+    bubbles = []
+    next_question = 1
+    for row in _group_rows(circles):
+        if len(row) % options:
+            raise ValueError(f"Row with {len(row)} bubbles does not split into {options} options")
+        for start in range(0, len(row), options):
+            group = row[start:start + options]
+            question = _label_for(group, labels) or next_question
+            next_question = question + 1
+            for option, (x, y, r) in enumerate(group):
+                bubbles.append((question, option, x, y, r))
+
+    layout = SheetLayout(page_size, options, bubbles, pdf=pdf_data, page=page)
+    if len(layout.questions) * options != len(layout.bubbles):
+        raise ValueError("Question labels are not unique per bubble group")
+    return layout
+
+
+@lru_cache(maxsize=64)
+def get_layout(questions: int, options: int, columns: int) -> SheetLayout:
+    """Generate a blank sheet once and return its cached geometry"""
+    from omr.blank_sheet import render_blank_pdf
+
+    layout = extract_layout(render_blank_pdf(questions, options, columns), options)
+    logger.info(f"Extracted layout for {questions}q/{options}opt/{columns}col: {len(layout.bubbles)} bubbles")
+    return layout
+
+
+def _to_gray(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def downscale(gray: np.ndarray, width: int = REGISTRATION_WIDTH) -> tuple:
+    """
+    Return (small, factor): gray shrunk by an integer factor to at most
+    `width` pixels wide.
+
+    Integer factors take OpenCV's block-averaging path for INTER_AREA, several
+    times faster than an arbitrary ratio on 600dpi scans.
+    """
+    step = -(-gray.shape[1] // width)
+    if step <= 1:
+        return gray, 1.0
+    factor = 1.0 / step
+    return cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA), factor
+
+
+def _phase_correlate(spectrum: np.ndarray, scan: np.ndarray, max_dx: int, max_dy: int):
+    """
+    Phase correlation with the peak searched only within +-max_dx/max_dy.
+
+    `spectrum` is the conjugate rfft2 of the template, computed once per
+    registration. A sheet is a periodic grid of bubbles, so the full
+    correlation surface has competing peaks one row or column pitch apart and
+    far from zero; bounding the search to plausible shifts keeps registration
+    on the right one. Returns (dx, dy, response, on_edge) with sub-pixel dx/dy.
+    """
+    cross = np.fft.rfft2(scan) * spectrum
+    cross /= np.abs(cross) + 1e-9
+    surface = np.fft.fftshift(np.fft.irfft2(cross, s=scan.shape))
+
+    cy, cx = scan.shape[0] // 2, scan.shape[1] // 2
+    window = surface[cy - max_dy:cy + max_dy + 1, cx - max_dx:cx + max_dx + 1]
+    py, px = np.unravel_index(np.argmax(window), window.shape)
+    on_edge = py in (0, window.shape[0] - 1) or px in (0, window.shape[1] - 1)
+
+    # Sub-pixel peak from the centroid of the 3x3 neighbourhood
+    y0, x0 = py + cy - max_dy, px + cx - max_dx
+    patch = np.clip(surface[max(y0 - 1, 0):y0 + 2, max(x0 - 1, 0):x0 + 2], 0, None)
+    yy, xx = np.mgrid[max(y0 - 1, 0) - y0:patch.shape[0] + max(y0 - 1, 0) - y0,
+                      max(x0 - 1, 0) - x0:patch.shape[1] + max(x0 - 1, 0) - x0]
+    total = patch.sum() or 1.0
+    return (x0 - cx + (patch * xx).sum() / total, y0 - cy + (patch * yy).sum() / total,
+            float(surface[y0, x0]), on_edge)
+
+
+def _scale_about_center(image: np.ndarray, scale: float) -> np.ndarray:
+    """Resample so that output pixel p shows input pixel scale * (p - c) + c"""
+    height, width = image.shape[:2]
+    cx, cy = (width - 1) / 2, (height - 1) / 2
+    matrix = np.float32([[scale, 0, (1 - scale) * cx], [0, scale, (1 - scale) * cy]])
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+def _log_steps(low: float, high: float, step: float) -> np.ndarray:
+    count = int(np.ceil(np.log(high / low) / np.log1p(step))) + 1
+    return np.exp(np.linspace(np.log(low), np.log(high), count))
+
+
+def register(gray: np.ndarray, layout: SheetLayout, small: tuple = None):
+    """
+    Align a scan to the layout.
+
+    Translation comes from phase correlation between the blank sheet (or its
+    bubble rings) and the scan at low resolution. Scale is first assumed from
+    the image size against the page size (the scan covers the page); when
+    that match scores below SEARCH_RESPONSE, scales within SCALE_RANGE are
+    searched, coarse then fine, for scans with margins or cropped edges.
+
+    Parameters:
+        - gray: Full-resolution grayscale scan
+        - layout: Sheet layout
+        - small: Precomputed downscale(gray) result, to share the pyramid level
+
+    Returns: (scale_x, scale_y, dx, dy, response) or None when no scale
+    gives a correlation peak of at least MIN_RESPONSE inside the plausible
+    shift range.
+    """
+    height, width = gray.shape[:2]
+    base_x = width / layout.page_size[0]
+    base_y = height / layout.page_size[1]
+
+    small, factor = small if small is not None else downscale(gray)
+    small_h, small_w = small.shape[:2]
+    scan = (255 - small).astype(np.float32)
+    spectrum = np.conj(np.fft.rfft2(layout.template(small_w, small_h)))
+
+    def correlate(scan: np.ndarray, spectrum: np.ndarray, scale: float):
+        warped = scan if scale == 1.0 else _scale_about_center(scan, scale)
+        height, width = scan.shape
+        dx, dy, response, on_edge = _phase_correlate(
+            spectrum, warped, int(MAX_SHIFT * width), int(MAX_SHIFT * height)
+        )
+        # A peak on the window edge is a neighbouring grid period, not a match
+        return (0.0 if on_edge else response), scale, dx, dy
+
+    best = correlate(scan, spectrum, 1.0)
+    if best[0] < SEARCH_RESPONSE:
+        # Coarse scales on a half-size level, refined on the registration level
+        coarse, _ = downscale(small, small_w // 2)
+        coarse_scan = (255 - coarse).astype(np.float32)
+        coarse_spectrum = np.conj(np.fft.rfft2(layout.template(coarse.shape[1], coarse.shape[0])))
+        scale = max(correlate(coarse_scan, coarse_spectrum, scale)
+                    for scale in _log_steps(*SCALE_RANGE, COARSE_SCALE_STEP))[1]
+        low, high = scale / (1 + COARSE_SCALE_STEP), scale * (1 + COARSE_SCALE_STEP)
+        best = max(best, *(correlate(scan, spectrum, scale) for scale in _log_steps(low, high, FINE_SCALE_STEP)))
+
+    response, scale, dx, dy = best
+    if response < MIN_RESPONSE:
+        return None
+    if scale != 1.0:
+        logger.info(f"Registered at {scale:.3f}x the page-fit scale (response {response:.2f})")
+
+    # Template pixel t lies at warped pixel t + d, i.e. scan pixel
+    # scale * (t + d - c) + c on the downscaled level
+    cx, cy = (small_w - 1) / 2, (small_h - 1) / 2
+    return (scale * base_x, scale * base_y,
+            (scale * (dx - cx) + cx) / factor, (scale * (dy - cy) + cy) / factor, response)
+
+
+def sample_fill(image: np.ndarray, layout: SheetLayout, transform, threshold: int = None) -> np.ndarray:
+    """
+    Return the fill percentage of every layout bubble, in layout order.
+
+    image is a binary image, or grayscale when threshold is given (see
+    disc_fill_ratios).
+    """
+    scale_x, scale_y, dx, dy = transform[:4]
+    bubbles = layout.bubbles
+    centers = np.column_stack((bubbles[:, 2] * scale_x + dx, bubbles[:, 3] * scale_y + dy))
+    radii = np.floor(bubbles[:, 4] * min(scale_x, scale_y) * INNER_RADIUS)
+    return disc_fill_ratios(image, centers, radii, threshold=threshold)
+
+
+def detect_with_layout(image, layout: SheetLayout, fill_threshold: float = 50.0,
+                       debug: bool = False, pyramid: bool = True, timer=None) -> dict:
+    """
+    Detect answers by sampling fill at the known bubble positions.
+
+    Parameters:
+        - image: Scan as np.ndarray (BGR or grayscale), bytes or path
+        - layout: SheetLayout of the blank sheet
+        - fill_threshold: Minimum fill percentage for a bubble to count as marked
+        - debug: Include per-bubble fill percentages in the result
+        - pyramid: Register and pick the ink threshold on the downscaled
+          level, then binarize only the sampled bubble pixels at full
+          resolution. When False the whole scan is binarized (Otsu) first.
+        - timer: omr.profiling.StageTimer to record stage timings in
+
+    Returns: Same shape as detect_omr_answers, with "method": "layout".
+    Registration failures return "status": "error" so callers can fall back
+    to contour detection.
+    """
+    from omr.loader import load_image
+    from omr.profiling import stage
+
+    with stage(timer, "grayscale"):
+        gray = _to_gray(load_image(image, cv2.IMREAD_GRAYSCALE))
+    with stage(timer, "downscale"):
+        small = downscale(gray)
+
+    with stage(timer, "register"):
+        transform = register(gray, layout, small=small)
+    if transform is None:
+        return {"status": "error", "error": "Could not register scan to sheet layout", "method": "layout"}
+
+    if pyramid:
+        # Otsu on the downscaled histogram is a close estimate of the full-size
+        # one; ink is then tested only inside the bubble discs
+        with stage(timer, "threshold"):
+            threshold, _ = cv2.threshold(small[0], 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        with stage(timer, "sample_fill"):
+            fills = sample_fill(gray, layout, transform, threshold=threshold)
+    else:
+        with stage(timer, "threshold"):
+            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        with stage(timer, "sample_fill"):
+            fills = sample_fill(binary, layout, transform)
+
+    # Arrange fills as a (questions x options) matrix and pick answers in one pass
+    questions, question_index = np.unique(layout.bubbles[:, 0].astype(int), return_inverse=True)
+    grid = np.full((len(questions), layout.options), -1.0)
+    grid[question_index, layout.bubbles[:, 1].astype(int)] = fills
+
+    marked = grid >= fill_threshold
+    best = grid.argmax(axis=1)
+    answered = np.flatnonzero(marked.any(axis=1))
+    detected_answers = {int(questions[i]): OPTION_LABELS[best[i]] for i in answered}
+    multiple_marks = questions[marked.sum(axis=1) > 1].tolist()
+
+    result = {
+        "status": "success",
+        "method": "layout",
+        "detected_answers": detected_answers,
+        "total_questions": layout.total_questions,
+        "multiple_marks": multiple_marks,
+        "registration": {
+            "scale": [round(float(transform[0]), 4), round(float(transform[1]), 4)],
+            "shift": [round(float(transform[2]), 1), round(float(transform[3]), 1)],
+            "response": round(float(transform[4]), 3),
+        },
+    }
+    if debug:
+        result["fill_details"] = {
+            int(q): {OPTION_LABELS[o]: round(float(f), 1) for o, f in enumerate(row) if f >= 0}
+            for q, row in zip(questions, grid)
+        }
+    return result
@@ -0,0 +1,127 @@
+"""
+Image input helpers shared by the detector and the scan pipeline.
+
+Sheets can arrive as a file path, raw encoded bytes (an upload buffer) or an
+already decoded NumPy array. ``load_image`` normalizes all three so that
+uploads can be decoded in memory without a round-trip through tmp/.
+
+Detection only needs one 8-bit channel, so the scan pipeline decodes uploads
+with ``decode_gray``: straight to grayscale, and for very large JPEG/PNG
+scans at a reduced size picked from the header before decoding.
+"""
+
+import struct
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+def decode_image(data: bytes, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Decode an encoded image (PNG, JPEG, ...) from memory.
+
+    Raises ValueError if the buffer is not a readable image.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, flags)
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return image
+
+
+# (factor, flag) from the largest reduction down
+REDUCED_GRAYSCALE = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# JPEG start-of-frame markers (SOF0-SOF15 minus DHT, JPG and DAC)
+_JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def encoded_size(data: bytes):
+    """
+    (width, height) read from a PNG or JPEG header without decoding, or None
+    for other formats and truncated headers.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+
+    if data[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length field
+            offset += 2
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    return None
+
+
+def decode_gray(data: bytes, min_width: int = None) -> np.ndarray:
+    """
+    Decode an encoded image straight to one 8-bit channel.
+
+    Parameters:
+        - data: Encoded image bytes
+        - min_width: When given, scans whose shorter side is at least 2, 4 or
+          8 times this are decoded at that fraction of their size (libjpeg
+          scales during decoding, so the full-size image is never built).
+          The shorter side is used because EXIF orientation is applied after
+          the header is read.
+
+    Raises ValueError if the buffer is not a readable image.
+    """
+    flags = cv2.IMREAD_GRAYSCALE
+    size = encoded_size(data) if min_width else None
+    if size is not None:
+        for factor, reduced in REDUCED_GRAYSCALE:
+            if min(size) // factor >= min_width:
+                flags = reduced
+                break
+    return decode_image(data, flags)
+
+
+def load_image(source, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Load an image from a path, encoded bytes or a NumPy array.
+
+    Parameters:
+        - source: str/Path to an image file, bytes/bytearray/memoryview of an
+          encoded image, or a decoded np.ndarray (returned unchanged)
+        - flags: cv2.IMREAD_* flags used when decoding
+
+    Returns: Decoded image as np.ndarray
+    """
+    if isinstance(source, np.ndarray):
+        return source
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_image(bytes(source), flags)
+
+    path = Path(source)
+    if not path.exists():
+        raise FileNotFoundError(f"Image not found: {path}")
+
+    # imdecode on the file contents also handles non-ASCII paths on Windows
+    return decode_image(path.read_bytes(), flags)
+
+
+def is_pdf(data: bytes, filename: str = None) -> bool:
+    """Check whether an upload is a PDF by extension or magic bytes"""
+    if filename and Path(filename).suffix.lower() == ".pdf":
+        return True
+    return bytes(data[:5]) == b"%PDF-"
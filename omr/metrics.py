@@ -0,0 +1,246 @@
+"""
+Prometheus metrics without a client library.
+
+Counters and histograms are plain integers and floats behind one lock per
+metric; observing a value is a bisect and two additions, cheap enough to
+stay on under load. Values owned by other components (pool queue depth,
+cache hit counts) are read when /metrics is scraped via ``CallbackMetric``
+instead of being mirrored on every request.
+
+Service metrics are module-level so the API and the batch scanner share
+them. Detection runs in worker processes, so worker-side durations travel
+back in result dicts and are observed in the server process.
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers cached hits (~1ms) to slow 600dpi PDF scans
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally labelled"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """
+    Histogram with fixed upper bounds.
+
+    Parameters:
+        - buckets: Increasing upper bounds; +Inf is added
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last one is +Inf) and the sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> list:
+        with self._lock:
+            series = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+
+        lines = []
+        for key, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    Gauge or counter whose value is read when the registry is rendered.
+
+    Parameters:
+        - read: Callable returning a number, or {label values tuple: number}
+        - kind: "gauge" or "counter"
+    """
+
+    def __init__(self, name: str, documentation: str, read, labels: tuple = (), kind: str = "gauge"):
+        super().__init__(name, documentation, labels)
+        self.read = read
+        self.kind = kind
+
+    def _samples(self) -> list:
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Registry:
+    """Ordered set of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric (replacing one of the same name) and return it"""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+SCAN_SECONDS = REGISTRY.register(Histogram(
+    "omr_scan_seconds", "End-to-end /scan-omr latency", labels=("cached",)
+))
+PDF_GENERATION_SECONDS = REGISTRY.register(Histogram(
+    "omr_pdf_generation_seconds", "Sheet PDF rendering time (cache misses and class sets)", labels=("kind",)
+))
+RASTERIZE_SECONDS = REGISTRY.register(Histogram(
+    "omr_rasterize_seconds", "PDF page rasterization time", labels=("source",)
+))
+BUBBLES_PER_SHEET = REGISTRY.register(Histogram(
+    "omr_bubbles_per_sheet", "Marked answers detected per sheet",
+    buckets=(0, 10, 25, 50, 75, 100, 150, 200, 300)
+))
+SHEETS = REGISTRY.register(Counter(
+    "omr_sheets_total", "Sheets detected, by endpoint", labels=("endpoint",)
+))
+SCAN_FAILURES = REGISTRY.register(Counter(
+    "omr_scan_failures_total", "Failed sheet scans by reason", labels=("reason",)
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "omr_stage_seconds", "Scan pipeline stage time (profiled scans only)", labels=("stage",)
+))
+
+
+def failure_reason(error: BaseException = None) -> str:
+    """Label for a failed scan: the kind of exception, or "detection" for a failed result"""
+    from concurrent.futures.process import BrokenProcessPool
+
+    from omr.engine import PoolSaturated
+
+    if error is None:
+        return "detection"
+    if isinstance(error, PoolSaturated):
+        return "queue_full"
+    if isinstance(error, BrokenProcessPool):
+        return "worker_crash"
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, ImportError):
+        return "pdf_unavailable"
+    if isinstance(error, ValueError):
+        return "invalid_input"
+    return "error"
+
+
+def observe_sheet(endpoint: str, result: dict = None, error: BaseException = None):
+    """Count one freshly detected sheet, or its failure"""
+    if error is not None or result is None or result.get("status", "success") != "success":
+        SCAN_FAILURES.inc(reason=failure_reason(error))
+        return
+    SHEETS.inc(endpoint=endpoint)
+    BUBBLES_PER_SHEET.observe(len(result.get("detected_answers") or {}))
+    if "rasterize" in result:
+        RASTERIZE_SECONDS.observe(result["rasterize"]["ms"] / 1000, source="worker")
+
+
+def observe_timings(timings: dict):
+    """Add a StageTimer report to the stage histogram"""
+    for name, entry in timings.get("stages", {}).items():
+        STAGE_SECONDS.observe(entry["ms"] / 1000, stage=name)
@@ -0,0 +1,140 @@
+"""
+Cache for generated blank-sheet PDFs.
+
+A sheet's content is fixed by (questions, options, columns) and the input
+space is small, so rendered bytes are kept in a size-capped in-memory LRU
+with an optional on-disk tier. The bytes are not reproducible (ReportLab
+embeds a creation date and a random document /ID), so the ETag is derived
+from the cache key and generator version rather than the content: it stays
+the same across re-renders, restarts and server processes, and it is weak
+because re-rendered bytes differ. Clients revalidate with If-None-Match.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(key: tuple, version: str) -> str:
+    """Weak ETag for a cache key under a generator version"""
+    name = "_".join(str(part) for part in key)
+    return 'W/"' + hashlib.sha256(f"{version}:{name}".encode()).hexdigest()[:32] + '"'
+
+
+class PDFCache:
+    """
+    In-memory LRU of rendered PDFs with an optional disk tier.
+
+    Parameters:
+        - max_bytes: Memory budget for cached PDFs
+        - disk_dir: Directory for the disk tier (None disables it)
+        - version: Generator version; part of disk file names so a new
+          layout never serves stale files
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir=None, version: str = "1"):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.version = version
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: tuple) -> Path:
+        name = "_".join(str(part) for part in key)
+        return self.disk_dir / f"omr_v{self.version}_{name}.pdf"
+
+    def etag(self, key: tuple) -> str:
+        """ETag of key's PDF, known without rendering it"""
+        return make_etag(key, self.version)
+
+    def _remember(self, key: tuple, data: bytes, etag: str):
+        """Insert into the memory tier, evicting least recently used entries"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (etag, data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key: tuple):
+        """Return (data, etag) from memory or disk, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[0]
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                pass
+            else:
+                etag = self.etag(key)
+                self._remember(key, data, etag)
+                with self._lock:
+                    self.disk_hits += 1
+                return data, etag
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: tuple, data: bytes) -> str:
+        """Store rendered bytes in every tier and return their ETag"""
+        etag = self.etag(key)
+        self._remember(key, data, etag)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not write PDF cache file {path}: {e}")
+        return etag
+
+    def get_or_render(self, key: tuple, render) -> tuple:
+        """
+        Return (data, etag) for key, calling render() to produce bytes on a miss.
+
+        Concurrent misses for the same key may render more than once; the
+        result is identical, so the last write simply wins.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        data = render()
+        return data, self.put(key, data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
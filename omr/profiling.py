@@ -0,0 +1,153 @@
+"""
+Opt-in per-stage timing for the scan pipeline.
+
+A ``StageTimer`` is created per scan when profiling is requested and passed
+down the pipeline; each stage (decode, rasterize, deskew, register, ...)
+runs inside ``timer.stage(name)``. With profiling off callers pass None and
+``stage()`` returns a shared no-op context, so the cost is one function call
+per stage.
+
+Peak memory is measured with tracemalloc, which sees NumPy (and therefore
+OpenCV output) allocations. Tracing slows allocation-heavy code noticeably,
+so it is enabled separately from wall-clock timing. Stages do not nest.
+
+``StageMetrics`` aggregates timing reports across scans for the server.
+"""
+
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+_NO_STAGE = nullcontext()
+
+
+def stage(timer, name: str):
+    """timer.stage(name), or a no-op context when timer is None"""
+    return _NO_STAGE if timer is None else timer.stage(name)
+
+
+class StageTimer:
+    """
+    Wall time (and optionally peak memory) of named pipeline stages.
+
+    Use it as a context manager so tracing is stopped even when the scan
+    raises before report().
+
+    Parameters:
+        - memory: Also record each stage's peak traced allocation
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.stages = {}
+        self._started = time.perf_counter()
+        self._owns_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Stop tracing if this timer started it"""
+        if self._owns_tracing:
+            tracemalloc.stop()
+            self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"ms": 0.0})
+            entry["ms"] += (time.perf_counter() - start) * 1000
+            if self.memory:
+                peak = (tracemalloc.get_traced_memory()[1] - base) / 1024
+                entry["peak_kb"] = max(entry.get("peak_kb", 0.0), peak)
+
+    def report(self) -> dict:
+        """
+        Stop tracing (if this timer started it) and return
+        {"total_ms": ..., "stages": {name: {"ms": ..., "peak_kb": ...}}}
+        """
+        self.close()
+        return {
+            "total_ms": round((time.perf_counter() - self._started) * 1000, 2),
+            "stages": {
+                name: {key: round(value, 2) for key, value in entry.items()}
+                for name, entry in self.stages.items()
+            },
+        }
+
+
+class StageMetrics:
+    """
+    Running aggregate of stage timings across scans.
+
+    Keeps counts and totals per stage plus the most recent `window` samples
+    for percentiles, so memory stays bounded under sustained load.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+        self.scans = 0
+
+    def record(self, timings: dict):
+        """Add one StageTimer.report() (stages plus "total")"""
+        samples = dict(timings.get("stages", {}))
+        if "total_ms" in timings:
+            samples["total"] = {"ms": timings["total_ms"]}
+        with self._lock:
+            self.scans += 1
+            for name, entry in samples.items():
+                stats = self._stages.get(name)
+                if stats is None:
+                    stats = self._stages[name] = {
+                        "count": 0, "total_ms": 0.0, "max_ms": 0.0, "max_peak_kb": None,
+                        "recent": deque(maxlen=self.window),
+                    }
+                stats["count"] += 1
+                stats["total_ms"] += entry["ms"]
+                stats["max_ms"] = max(stats["max_ms"], entry["ms"])
+                stats["recent"].append(entry["ms"])
+                if "peak_kb" in entry:
+                    stats["max_peak_kb"] = max(stats["max_peak_kb"] or 0.0, entry["peak_kb"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = {name: dict(stats, recent=list(stats["recent"])) for name, stats in self._stages.items()}
+            scans = self.scans
+
+        summary = {}
+        for name, stats in stages.items():
+            p50, p95 = np.percentile(stats["recent"], [50, 95])
+            summary[name] = {
+                "count": stats["count"],
+                "mean_ms": round(stats["total_ms"] / stats["count"], 2),
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "max_ms": round(stats["max_ms"], 2),
+            }
+            if stats["max_peak_kb"] is not None:
+                summary[name]["max_peak_kb"] = round(stats["max_peak_kb"], 1)
+        return {"scans": scans, "window": self.window, "stages": summary}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self.scans = 0
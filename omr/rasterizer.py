@@ -0,0 +1,189 @@
+"""
+PDF rasterization backends for the scan pipeline.
+
+Two interchangeable backends render a single PDF page straight into an 8-bit
+grayscale NumPy array:
+
+    - pymupdf:   in-process MuPDF rendering (fast, no subprocess)
+    - pdf2image: poppler's pdftoppm via pdf2image (portable fallback)
+
+``render_page`` picks the backend from the argument, the OMR_RASTERIZER
+environment variable or, by default, PyMuPDF when installed. A document the
+backend cannot open at all is invalid input (ValueError); if the preferred
+backend fails for any other reason (rendering error, missing dependency),
+rendering falls back to pdf2image.
+
+``split_pages`` cuts a multi-page PDF into one-page PDFs (PyMuPDF only), so
+a page can be sent to a worker process without the rest of the document.
+"""
+
+import logging
+import os
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DPI = 200
+MIN_DPI = 72
+MAX_DPI = 600
+
+
+def clamp_dpi(dpi: int) -> int:
+    """Keep a requested DPI within the supported range"""
+    return max(MIN_DPI, min(int(dpi), MAX_DPI))
+
+
+class PyMuPDFBackend:
+    """Render pages in-process with PyMuPDF"""
+
+    name = "pymupdf"
+
+    def __init__(self):
+        try:
+            import pymupdf
+        except ImportError:
+            import fitz as pymupdf
+        self._pymupdf = pymupdf
+
+    def _open(self, data: bytes):
+        """Open an in-memory PDF; ValueError when it is not a readable PDF"""
+        try:
+            return self._pymupdf.open(stream=data, filetype="pdf")
+        except self._pymupdf.FileDataError as e:
+            raise ValueError(f"Invalid PDF: {e}") from e
+
+    def page_count(self, data: bytes) -> int:
+        with self._open(data) as doc:
+            return doc.page_count
+
+    def render(self, data: bytes, page: int = 1, dpi: int = DEFAULT_DPI) -> np.ndarray:
+        with self._open(data) as doc:
+            if not 1 <= page <= doc.page_count:
+                raise ValueError(f"PDF has no page {page}")
+            pix = doc[page - 1].get_pixmap(dpi=dpi, colorspace=self._pymupdf.csGRAY, alpha=False)
+
+        # View the pixmap memory by stride (rows may be padded), crop to the
+        # real width and copy once into a writable array
+        image = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+        return image[:, :pix.width].copy()
+
+    def split(self, data: bytes) -> list:
+        with self._open(data) as doc:
+            pages = []
+            for index in range(doc.page_count):
+                with self._pymupdf.open() as single:
+                    # Copies only the objects this page references
+                    single.insert_pdf(doc, from_page=index, to_page=index)
+                    pages.append(single.tobytes())
+        return pages
+
+
+class Pdf2ImageBackend:
+    """Render pages with poppler's pdftoppm via pdf2image"""
+
+    name = "pdf2image"
+
+    def __init__(self):
+        import pdf2image
+        self._pdf2image = pdf2image
+
+    def page_count(self, data: bytes) -> int:
+        return int(self._pdf2image.pdfinfo_from_bytes(data)["Pages"])
+
+    def render(self, data: bytes, page: int = 1, dpi: int = DEFAULT_DPI) -> np.ndarray:
+        images = self._pdf2image.convert_from_bytes(
+            data, dpi=dpi, first_page=page, last_page=page, grayscale=True
+        )
+        if not images:
+            raise ValueError(f"PDF has no page {page}")
+        image = images[0] if images[0].mode == "L" else images[0].convert("L")
+        return np.array(image)
+
+
+BACKENDS = {
+    PyMuPDFBackend.name: PyMuPDFBackend,
+    Pdf2ImageBackend.name: Pdf2ImageBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str = None):
+    """
+    Return a rasterizer backend instance.
+
+    Parameters:
+        - name: "pymupdf", "pdf2image" or "auto" (default: OMR_RASTERIZER or "auto")
+
+    Raises ImportError if the requested backend (or, for "auto", every
+    backend) is not installed.
+    """
+    name = (name or os.environ.get("OMR_RASTERIZER") or "auto").lower()
+
+    if name == "auto":
+        for candidate in BACKENDS.values():
+            try:
+                return candidate()
+            except ImportError:
+                continue
+        raise ImportError("No PDF rasterizer installed, install PyMuPDF or pdf2image")
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown rasterizer '{name}', choose from {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def _fallback(backend, error: Exception):
+    """
+    Return the pdf2image backend when a faster backend failed, else re-raise.
+
+    Invalid input (ValueError: unreadable PDF, missing page) is re-raised as
+    is, since poppler would only fail on it with a less useful error.
+    """
+    if backend.name == Pdf2ImageBackend.name or isinstance(error, ValueError):
+        raise error
+    logger.warning(f"{backend.name} rasterization failed ({error}), falling back to pdf2image")
+    return get_backend(Pdf2ImageBackend.name)
+
+
+def page_count(data: bytes, backend: str = None) -> int:
+    """Return the number of pages in an in-memory PDF"""
+    rasterizer = get_backend(backend)
+    try:
+        return rasterizer.page_count(data)
+    except Exception as e:
+        return _fallback(rasterizer, e).page_count(data)
+
+
+def render_page(data: bytes, page: int = 1, dpi: int = DEFAULT_DPI, backend: str = None) -> np.ndarray:
+    """
+    Render one page (1-based) of an in-memory PDF to a grayscale uint8 array.
+
+    Parameters:
+        - data: Raw PDF bytes
+        - page: Page number, starting at 1
+        - dpi: Render resolution (clamped to 72-600)
+        - backend: Backend name, see get_backend()
+    """
+    dpi = clamp_dpi(dpi)
+    rasterizer = get_backend(backend)
+    try:
+        return rasterizer.render(data, page, dpi)
+    except Exception as e:
+        return _fallback(rasterizer, e).render(data, page, dpi)
+
+
+def split_pages(data: bytes) -> list:
+    """
+    Split an in-memory PDF into one single-page PDF per page.
+
+    Returns a list of PDF bytes in page order, or None when PyMuPDF is not
+    installed (poppler cannot write PDFs); callers then send the whole
+    document with a page number. Raises ValueError for an unreadable PDF.
+    """
+    try:
+        backend = get_backend(PyMuPDFBackend.name)
+    except ImportError:
+        return None
+    return backend.split(data)
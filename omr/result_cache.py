@@ -0,0 +1,148 @@
+"""
+Cache of scan results keyed by upload content.
+
+Operators re-upload the same scan (double-clicks, browser retries). Results
+are cached under the content hash of the upload plus every parameter that
+changes detection, in a bounded in-memory LRU with an optional SQLite tier
+that survives restarts and is shared by server processes. The SQLite tier is
+capped too: every PRUNE_INTERVAL writes, rows beyond the newest
+max_db_entries are deleted (replacing a row makes it the newest).
+"""
+
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump when detection changes so stored results are not reused
+DETECTOR_VERSION = "4"
+
+# Writes to the SQLite tier between prunes
+PRUNE_INTERVAL = 256
+
+
+def scan_cache_key(sheet_hash: str, expected_options: int, dpi: int, questions: int = None,
+                   columns: int = None, deskew: bool = True) -> str:
+    """Cache key for a scan of the given content with the given parameters"""
+    return (f"{sheet_hash}:{expected_options}:{dpi}:{questions or 0}:{columns or 0}:{int(deskew)}"
+            f":v{DETECTOR_VERSION}")
+
+
+class ScanResultCache:
+    """
+    LRU of detection results with an optional SQLite tier.
+
+    Parameters:
+        - max_entries: Results kept in memory (0 disables the memory tier)
+        - db_pool: omr.storage.ConnectionPool for the persistent tier (None disables it)
+        - max_db_entries: Rows kept in the persistent tier
+    """
+
+    def __init__(self, max_entries: int = 1024, db_pool=None, max_db_entries: int = 100000):
+        self.max_entries = max_entries
+        self.db_pool = db_pool
+        self.max_db_entries = max(1, max_db_entries)
+        # Prune on the first write, which also trims a table left over from
+        # a run with a larger limit
+        self._writes = PRUNE_INTERVAL - 1
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """Return a cached result from memory or SQLite, or None"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        if self.db_pool is not None:
+            with self.db_pool.connection() as conn:
+                row = conn.execute("SELECT result FROM scan_results WHERE cache_key = ?", (key,)).fetchone()
+            if row is not None:
+                result = json.loads(row[0])
+                self._remember(key, result)
+                with self._lock:
+                    self.db_hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, result: dict):
+        """Cache a successful detection result"""
+        if result.get("status", "success") != "success":
+            return
+        self._remember(key, result)
+        if self.db_pool is not None:
+            with self.db_pool.connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO scan_results (cache_key, result) VALUES (?, ?)",
+                    (key, json.dumps(result))
+                )
+            with self._lock:
+                self._writes = (self._writes + 1) % PRUNE_INTERVAL
+                due = self._writes == 0
+            if due:
+                self.prune()
+
+    def prune(self) -> int:
+        """Delete persistent rows beyond the newest max_db_entries; returns rows removed"""
+        if self.db_pool is None:
+            return 0
+        # REPLACE deletes and re-inserts, so rowid order is write order
+        with self.db_pool.connection() as conn:
+            removed = conn.execute(
+                "DELETE FROM scan_results WHERE rowid <= "
+                "(SELECT rowid FROM scan_results ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                (self.max_db_entries,)
+            ).rowcount
+        if removed:
+            logger.info(f"Pruned {removed} cached scan results")
+        return removed
+
+    def _remember(self, key: str, result: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def cached(self, key: str):
+        """Memory-tier lookup only (no I/O), for use on the event loop"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            elif self.db_pool is None:
+                self.misses += 1
+            return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_pool is not None:
+            with self.db_pool.connection() as conn:
+                conn.execute("DELETE FROM scan_results")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "persistent": self.db_pool is not None,
+            "max_db_entries": self.max_db_entries,
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,246 @@
+"""
+Scan pipeline executed inside detection worker processes.
+
+Everything here must be importable at module level so that jobs can be pickled
+and sent to a ``DetectionPool``.
+"""
+
+import inspect
+import logging
+import os
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from omr.deskew import DEFAULT_TOLERANCE, deskew as deskew_image
+from omr.detector_enhanced import detect_omr_answers
+from omr.layout import detect_with_layout, get_layout
+from omr.loader import decode_gray, encoded_size, is_pdf
+from omr.profiling import StageTimer, stage
+from omr.rasterizer import DEFAULT_DPI, render_page
+
+logger = logging.getLogger(__name__)
+
+# Detection gains nothing from more than ~300dpi (A4 width in pixels); larger
+# uploads are decoded at a reduced size, and larger contour inputs are shrunk
+# by an integer factor, to at least this width
+CONTOUR_MIN_WIDTH = 2480
+
+# omr.detector_enhanced.detect_omr_answers is only known to accept an image
+# file path. An upload that reaches it unchanged (no deskew, no downscale) is
+# written to one temporary file as uploaded; anything else is written as a
+# PNG. Set OMR_DETECTOR_ARRAYS=1 once it takes arrays to skip the file.
+DETECTOR_ACCEPTS_ARRAYS = os.environ.get("OMR_DETECTOR_ARRAYS", "0").lower() in ("1", "true", "yes")
+
+# Whether detect_omr_answers takes a fill_threshold keyword; if not, its own
+# built-in threshold applies on the contour path
+_DETECTOR_PARAMS = inspect.signature(detect_omr_answers).parameters
+DETECTOR_TAKES_THRESHOLD = "fill_threshold" in _DETECTOR_PARAMS or any(
+    param.kind is inspect.Parameter.VAR_KEYWORD for param in _DETECTOR_PARAMS.values()
+)
+
+
+def detect_image(image, expected_options: int = 4, questions: int = None,
+                 columns: int = None, deskew: bool = True,
+                 deskew_tolerance: float = DEFAULT_TOLERANCE, profile: bool = False,
+                 profile_memory: bool = False, timer: StageTimer = None, upload: tuple = None,
+                 fill_threshold: float = None) -> dict:
+    """
+    Detect answers on a decoded sheet image.
+
+    fill_threshold is the minimum fill percentage for a marked bubble; None
+    keeps each detector's default (50 on the layout fast path). The contour
+    detector only receives it when detect_omr_answers accepts the keyword.
+
+    upload is the (bytes, suffix) the image was decoded from at full size;
+    when contour detection gets the image unchanged, those bytes are handed
+    to the detector instead of re-encoding the image.
+
+    With deskew, the rotation is estimated on a small edge map first and the
+    grayscale image is straightened only when the angle exceeds
+    deskew_tolerance degrees; the result gets a "deskew" entry with the angle
+    and its cost. From then on only the single-channel image is used, so a
+    color input is converted once and then released.
+
+    When the sheet configuration (questions, columns) is known, the template
+    geometry fast path is tried first; it registers on a downscaled level and
+    samples fill at full resolution. Contour detection is used when the
+    configuration is unknown or the scan cannot be registered to the layout,
+    on a copy shrunk to about 300dpi for very large scans.
+
+    With profile (or a timer from the caller), per-stage wall time, and with
+    profile_memory peak traced memory, are returned under "timings".
+    """
+    if timer is None and profile:
+        with StageTimer(memory=profile_memory) as timer:
+            return detect_image(image, expected_options, questions=questions, columns=columns, deskew=deskew,
+                                deskew_tolerance=deskew_tolerance, timer=timer, upload=upload,
+                                fill_threshold=fill_threshold)
+
+    skew = None
+    if deskew:
+        start = time.perf_counter()
+        image, angle, applied = deskew_image(image, tolerance=deskew_tolerance, timer=timer)
+        if applied:
+            upload = None
+        skew = {
+            "angle": round(angle, 2),
+            "applied": applied,
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    result = _detect(image, expected_options, questions, columns, timer, upload, fill_threshold)
+    if skew is not None:
+        result["deskew"] = skew
+    if timer is not None:
+        result["timings"] = timer.report()
+    return result
+
+
+def _detect(image, expected_options: int, questions: int = None, columns: int = None,
+            timer: StageTimer = None, upload: tuple = None, fill_threshold: float = None) -> dict:
+    """
+    Layout fast path on the single-channel image, then contour detection
+    (after any downscale)
+    """
+    if questions and columns:
+        try:
+            with stage(timer, "layout"):
+                layout = get_layout(questions, expected_options, columns)
+            threshold = {} if fill_threshold is None else {"fill_threshold": fill_threshold}
+            result = detect_with_layout(image, layout, timer=timer, **threshold)
+            if result["status"] == "success":
+                return result
+            logger.warning(f"Layout fast path failed ({result['error']}), using contour detection")
+        except (ImportError, ValueError) as e:
+            logger.warning(f"Layout unavailable ({e}), using contour detection")
+
+    step = image.shape[1] // CONTOUR_MIN_WIDTH
+    if step > 1:
+        with stage(timer, "downscale"):
+            image = cv2.resize(image, None, fx=1.0 / step, fy=1.0 / step, interpolation=cv2.INTER_AREA)
+        upload = None
+        logger.info(f"Downscaled {step}x for contour detection: {image.shape[1]}x{image.shape[0]}")
+
+    if DETECTOR_ACCEPTS_ARRAYS and image.ndim == 2:
+        # Arrays must have the BGR layout of a color upload; a file needs no
+        # conversion because cv2.imread returns BGR for grayscale images too
+        with stage(timer, "to_bgr"):
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    with stage(timer, "contour_detection"):
+        return _contour_detect(image, expected_options, upload, fill_threshold)
+
+
+def _contour_detect(image: np.ndarray, expected_options: int, upload: tuple = None,
+                    fill_threshold: float = None) -> dict:
+    """
+    Run detect_omr_answers on a decoded image, through one temporary file
+    unless it accepts arrays: the original upload bytes when given, else a
+    fast lossless PNG of the image
+    """
+    options = {"expected_options": expected_options}
+    if fill_threshold is not None:
+        if DETECTOR_TAKES_THRESHOLD:
+            options["fill_threshold"] = fill_threshold
+        else:
+            logger.warning("detect_omr_answers takes no fill_threshold, using its built-in threshold")
+
+    if DETECTOR_ACCEPTS_ARRAYS:
+        return detect_omr_answers(image, **options)
+
+    if upload is not None:
+        data, suffix = upload
+    else:
+        ok, encoded = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise ValueError("Failed to encode image for contour detection")
+        data, suffix = encoded.tobytes(), ".png"
+
+    # The file only lives for the duration of the call
+    fd, path = tempfile.mkstemp(prefix="omr_scan_", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return detect_omr_answers(path, **options)
+    finally:
+        os.unlink(path)
+
+
+def scan_sheet(data: bytes, filename: str = None, expected_options: int = 4,
+               dpi: int = DEFAULT_DPI, questions: int = None, columns: int = None,
+               deskew: bool = True, profile: bool = False, profile_memory: bool = False,
+               page: int = 1, fill_threshold: float = None) -> dict:
+    """
+    Decode (or rasterize) an uploaded sheet in memory and detect answers.
+
+    Parameters:
+        - data: Raw upload bytes (JPEG, PNG or PDF)
+        - filename: Original filename, used to recognise PDFs
+        - expected_options: Expected number of options per question
+        - dpi: Resolution used when rasterizing a PDF
+        - questions, columns: Sheet configuration, enables the layout fast path
+        - deskew: Estimate and correct the sheet's rotation before detection
+        - profile, profile_memory: Return per-stage wall time (and peak
+          memory) under "timings", including decode/rasterize
+        - page: PDF page to scan (1-based)
+        - fill_threshold: Minimum fill percentage for a marked bubble
+          (None keeps the detector's default)
+
+    Returns: Detection result dict
+    """
+    with (StageTimer(memory=profile_memory) if profile else nullcontext()) as timer:
+        rasterize = None
+        upload = None
+        if is_pdf(data, filename):
+            start = time.perf_counter()
+            with stage(timer, "rasterize"):
+                image = render_page(data, page, dpi=dpi)
+            rasterize = {"dpi": dpi, "ms": round((time.perf_counter() - start) * 1000, 1)}
+            logger.info(f"Rasterized PDF page {page} at {dpi}dpi: {image.shape[1]}x{image.shape[0]}")
+        else:
+            with stage(timer, "decode"):
+                # One channel, decoded at reduced size when far above ~300dpi
+                image = decode_gray(data, min_width=CONTOUR_MIN_WIDTH)
+            size = encoded_size(data)
+            if size is None or sorted(image.shape) == sorted(size):
+                # Decoded at full size: the path-based detector can read the upload as is
+                upload = (data, Path(filename).suffix.lower() if filename else "")
+
+        result = detect_image(image, expected_options, questions=questions, columns=columns, deskew=deskew,
+                              timer=timer, upload=upload, fill_threshold=fill_threshold)
+    if rasterize is not None:
+        result["rasterize"] = rasterize
+    return result
+
+
+def scan_source(source, filename: str = None, expected_options: int = 4,
+                dpi: int = DEFAULT_DPI, questions: int = None, columns: int = None,
+                deskew: bool = True, profile: bool = False, profile_memory: bool = False,
+                fill_threshold: float = None) -> dict:
+    """
+    Detect answers from a file path, upload bytes or decoded image, or one
+    page of a PDF file given as a (path, page) tuple.
+
+    Paths are read (and PDF pages rasterized) inside the worker so only the
+    path crosses the process boundary.
+    """
+    page = 1
+    if isinstance(source, tuple):
+        source, page = source
+
+    if isinstance(source, np.ndarray):
+        return detect_image(source, expected_options, questions=questions, columns=columns, deskew=deskew,
+                            profile=profile, profile_memory=profile_memory, fill_threshold=fill_threshold)
+
+    if isinstance(source, (str, Path)):
+        filename = filename or str(source)
+        source = Path(source).read_bytes()
+
+    return scan_sheet(source, filename, expected_options, dpi=dpi, questions=questions, columns=columns,
+                      deskew=deskew, profile=profile, profile_memory=profile_memory, page=page,
+                      fill_threshold=fill_threshold)
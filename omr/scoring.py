@@ -0,0 +1,201 @@
+"""
+Vectorized answer-key scoring.
+
+Answer keys and detected answers are encoded as one uint8 code per question:
+
+    0-5          option index (A-F)
+    0x80 | mask  multiple marks; bit i of mask set for each known marked option
+    255          unmarked
+
+With sheets stacked into an (S, N) code matrix, scoring one sheet or a whole
+batch is the same handful of NumPy comparisons against the key row, including
+per-question weights and negative marking.
+"""
+
+import json
+
+import numpy as np
+
+from omr.layout import OPTION_LABELS
+
+UNMARKED = 255
+MULTI_FLAG = 0x80
+
+# Lowest marked option for each multi-mark bitmask
+_LOWEST_OPTION = np.array([(mask & -mask).bit_length() - 1 if mask else 0 for mask in range(64)], dtype=np.uint8)
+
+
+def normalize_answer_key(answer_key) -> dict:
+    """
+    Normalize an answer key to {question_number: "A"}.
+
+    Accepts a dict with int or str question keys, a list of answers for
+    questions 1..N, or a JSON string of either.
+    """
+    if isinstance(answer_key, (str, bytes)):
+        answer_key = json.loads(answer_key)
+    if isinstance(answer_key, (list, tuple)):
+        answer_key = {i: answer for i, answer in enumerate(answer_key, start=1)}
+    if not isinstance(answer_key, dict) or not answer_key:
+        raise ValueError("Answer key must be a non-empty dict or list")
+    return {int(q): str(answer).strip().upper() for q, answer in answer_key.items()}
+
+
+def _option_codes(labels: list) -> np.ndarray:
+    """
+    Encode option labels ("A".."F") as uint8 option indices.
+
+    Anything that is not a single option letter encodes as UNMARKED.
+    """
+    letters = np.frombuffer("".join(label[:1] or "?" for label in labels).encode("ascii", "replace"), dtype=np.uint8)
+    codes = letters - np.uint8(ord("A"))
+    valid = (codes < len(OPTION_LABELS)) & np.fromiter((len(label) == 1 for label in labels), dtype=bool, count=len(labels))
+    return np.where(valid, codes, UNMARKED).astype(np.uint8)
+
+
+class AnswerKey:
+    """
+    Answer key encoded for vectorized scoring.
+
+    Parameters:
+        - answer_key: Anything normalize_answer_key accepts (dict, list, JSON),
+          with one option letter per question
+        - weights: Marks per question, a number or {question: marks} (default 1)
+        - negative: Marks deducted for a wrong answer, as a fraction of the
+          question's weight (e.g. 0.25); a number or {question: fraction}.
+          Unmarked questions are never penalized; multiple marks count as wrong.
+    """
+
+    def __init__(self, answer_key, weights=None, negative=0.0):
+        answer_key = normalize_answer_key(answer_key)
+        self.questions = np.array(sorted(answer_key), dtype=np.int64)
+        self.answers = _option_codes([answer_key[q] for q in self.questions])
+        if (self.answers == UNMARKED).any():
+            raise ValueError(f"Answer key answers must be one of {', '.join(OPTION_LABELS)}")
+        self.weights = self._per_question(weights, 1.0)
+        self.penalties = self.weights * self._per_question(negative, 0.0)
+        self.weighted = bool((self.weights != 1.0).any() or (self.penalties != 0.0).any())
+
+    @classmethod
+    def from_spec(cls, spec) -> "AnswerKey":
+        """
+        Build a key from a plain answer key or an extended spec.
+
+        The extended form is {"answers": {...}, "weights": {...} or number,
+        "negative": number or {...}}, given as a dict or JSON string.
+        """
+        if isinstance(spec, AnswerKey):
+            return spec
+        if isinstance(spec, (str, bytes)):
+            spec = json.loads(spec)
+        if isinstance(spec, dict) and "answers" in spec:
+            return cls(spec["answers"], weights=spec.get("weights"), negative=spec.get("negative", 0.0))
+        return cls(spec)
+
+    def _per_question(self, value, default: float) -> np.ndarray:
+        if value is None:
+            return np.full(len(self.questions), default)
+        if isinstance(value, dict):
+            value = {int(q): float(v) for q, v in value.items()}
+            return np.array([value.get(int(q), default) for q in self.questions])
+        return np.full(len(self.questions), float(value))
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    @property
+    def max_score(self) -> float:
+        return float(self.weights.sum())
+
+    def encode(self, detected_answers: dict, multiple_marks=None) -> np.ndarray:
+        """
+        Encode one sheet's detected answers as a (N,) uint8 code row.
+
+        Questions not in the key are ignored. Questions listed in
+        multiple_marks are flagged as multi-marked.
+        """
+        codes = np.full(len(self.questions), UNMARKED, dtype=np.uint8)
+        if detected_answers:
+            questions = np.fromiter((int(q) for q in detected_answers), dtype=np.int64, count=len(detected_answers))
+            options = _option_codes([str(a).strip().upper() for a in detected_answers.values()])
+            columns, known = self._columns(questions)
+            codes[columns[known]] = options[known]
+
+        if multiple_marks:
+            columns, known = self._columns(np.asarray(multiple_marks, dtype=np.int64))
+            columns = columns[known]
+            marked = codes[columns]
+            bits = np.where(marked == UNMARKED, 0, np.left_shift(1, marked, dtype=np.uint16))
+            codes[columns] = MULTI_FLAG | bits.astype(np.uint8)
+        return codes
+
+    def encode_batch(self, detections) -> np.ndarray:
+        """Encode a sequence of detection results as an (S, N) uint8 matrix"""
+        matrix = np.full((len(detections), len(self.questions)), UNMARKED, dtype=np.uint8)
+        for row, detection in enumerate(detections):
+            matrix[row] = self.encode(detection.get("detected_answers"), detection.get("multiple_marks"))
+        return matrix
+
+    def decode(self, codes) -> dict:
+        """
+        Decode a code row (array or bytes) back to {question: "A"}.
+
+        Multi-marked questions decode to their lowest marked option.
+        """
+        if isinstance(codes, (bytes, memoryview)):
+            codes = np.frombuffer(codes, dtype=np.uint8)
+        codes = codes[:len(self.questions)]
+        options = np.where(codes >= MULTI_FLAG, _LOWEST_OPTION[codes & 0x3F], codes)
+        answered = np.flatnonzero((codes != UNMARKED) & (codes != MULTI_FLAG))
+        return {int(self.questions[i]): OPTION_LABELS[int(options[i])] for i in answered}
+
+    def _columns(self, questions: np.ndarray) -> tuple:
+        """Key column of each question number, and which of them are in the key"""
+        columns = np.searchsorted(self.questions, questions)
+        columns = np.minimum(columns, len(self.questions) - 1)
+        return columns, self.questions[columns] == questions
+
+    def correct_matrix(self, codes: np.ndarray) -> np.ndarray:
+        """Boolean matrix of correctly answered questions"""
+        return codes == self.answers
+
+    def score_batch(self, codes: np.ndarray) -> dict:
+        """
+        Score an (S, N) code matrix.
+
+        Returns: dict of (S,) arrays: score, percentage, correct, wrong,
+        unmarked and multiple (multi-marked, included in wrong)
+        """
+        codes = np.atleast_2d(codes)
+        correct = codes == self.answers
+        unmarked = codes == UNMARKED
+        wrong = ~(correct | unmarked)
+        multiple = wrong & (codes >= MULTI_FLAG)
+
+        score = correct @ self.weights - wrong @ self.penalties
+        max_score = self.max_score
+        percentage = score * (100.0 / max_score) if max_score else np.zeros(len(codes))
+        return {
+            "score": score,
+            "percentage": np.round(percentage, 2),
+            "correct": correct.sum(axis=1),
+            "wrong": wrong.sum(axis=1),
+            "unmarked": unmarked.sum(axis=1),
+            "multiple": multiple.sum(axis=1),
+        }
+
+    def score(self, codes: np.ndarray) -> dict:
+        """Score one sheet's (N,) code row"""
+        scores = self.score_batch(codes)
+        score = float(scores["score"][0])
+        result = {
+            "score": round(score, 2) if self.weighted else int(round(score)),
+            "total": len(self.questions),
+            "percentage": float(scores["percentage"][0]),
+            "correct": int(scores["correct"][0]),
+            "wrong": int(scores["wrong"][0]),
+            "unmarked": int(scores["unmarked"][0]),
+        }
+        if self.weighted:
+            result["max_score"] = round(self.max_score, 2)
+        return result
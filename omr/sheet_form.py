@@ -0,0 +1,83 @@
+"""
+Reusable Form XObject for the static bubble grid.
+
+The blank sheet for a (questions, options, columns) configuration is the same
+on every page of multi-page and bulk outputs. ``SheetForm`` imports its page
+once as a PDF Form XObject and references it from each output page, so every
+extra page costs a few bytes of "draw this form" instead of re-emitting every
+bubble circle and label as separate path operations.
+"""
+
+try:
+    import pymupdf
+except ImportError:
+    import fitz as pymupdf
+
+
+class SheetForm:
+    """
+    Blank sheet page held open for stamping as a shared Form XObject.
+
+    Parameters:
+        - blank_pdf: Rendered blank sheet bytes
+        - page: Page of blank_pdf to use (1-based)
+
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, blank_pdf: bytes, page: int = 1):
+        self._source = pymupdf.open(stream=blank_pdf, filetype="pdf")
+        self._pno = page - 1
+        rect = self._source[self._pno].rect
+        self.page_size = (rect.width, rect.height)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._source.close()
+
+    def stamp(self, page, overlay: bool = False):
+        """
+        Draw the grid on a page of another document.
+
+        The first stamp into a document imports the XObject; later stamps
+        into the same document reference it again.
+        """
+        page.show_pdf_page(page.rect, self._source, self._pno, overlay=overlay)
+
+    def build(self, copies: int = 1, overlay_pdf: bytes = None) -> bytes:
+        """
+        Build a multi-page PDF with the grid on every page.
+
+        Parameters:
+            - copies: Number of pages when no overlay is given
+            - overlay_pdf: Optional PDF whose pages carry per-page variable
+              content; the grid is placed underneath each of its pages
+
+        Returns: PDF bytes
+        """
+        if overlay_pdf is not None:
+            doc = pymupdf.open(stream=overlay_pdf, filetype="pdf")
+        else:
+            doc = pymupdf.open()
+            for _ in range(copies):
+                doc.new_page(width=self.page_size[0], height=self.page_size[1])
+
+        with doc:
+            for page in doc:
+                self.stamp(page)
+            # Page streams are already compressed; deeper garbage collection
+            # (duplicate merging) is quadratic in page count
+            return doc.tobytes(garbage=1)
+
+
+def build_copies(blank_pdf: bytes, copies: int) -> bytes:
+    """Return a PDF with `copies` pages of the blank sheet sharing one XObject"""
+    if copies <= 1:
+        return blank_pdf
+    with SheetForm(blank_pdf) as form:
+        return form.build(copies=copies)
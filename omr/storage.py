@@ -0,0 +1,387 @@
+"""
+SQLite persistence for exams and evaluation results.
+
+The database runs in WAL mode so the batch pipeline can write while API
+requests read. Connections come from a small shared pool instead of being
+opened per request, and evaluations are buffered and written with one
+executemany per batch, so a 10,000-sheet exam costs a few dozen
+transactions instead of 10,000.
+
+Evaluations are unique per (exam_id, sheet_hash): resubmitting a sheet
+replaces its stored result instead of counting it twice.
+
+Answer rows are positional against the exam's key, so replacing a key
+re-aligns every stored row to the new key's questions (by question number)
+and rescores it in the same transaction, and rows buffered against an
+older key are re-aligned the same way when they are flushed.
+
+Detected answers are stored as the compact uint8 code row of
+omr.scoring.AnswerKey (one byte per question, aligned with the exam's key)
+rather than as JSON.
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from omr.scoring import UNMARKED, AnswerKey
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    id INTEGER PRIMARY KEY,
+    answer_key TEXT
+);
+
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    exam_id INTEGER NOT NULL,
+    sheet_hash TEXT,
+    file TEXT,
+    score REAL NOT NULL,
+    total INTEGER NOT NULL,
+    percentage REAL NOT NULL,
+    correct INTEGER NOT NULL,
+    wrong INTEGER NOT NULL,
+    unmarked INTEGER NOT NULL,
+    answers BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_evaluations_exam_score ON evaluations (exam_id, score);
+CREATE INDEX IF NOT EXISTS idx_evaluations_sheet_hash ON evaluations (sheet_hash);
+
+CREATE TABLE IF NOT EXISTS scan_results (
+    cache_key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    name TEXT,
+    data BLOB NOT NULL,
+    first_page INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (job_id, file_index)
+);
+
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    page INTEGER NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'queued',
+    seq INTEGER,
+    result TEXT,
+    PRIMARY KEY (job_id, item_index)
+);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (job_id, status, item_index);
+CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items (job_id, seq);
+"""
+
+# Created by init_db after collapsing duplicates left by older versions,
+# which inserted a new row for every resubmission
+EVALUATION_UNIQUE_INDEX = "idx_evaluations_exam_sheet"
+
+DEDUPLICATE_EVALUATIONS = """
+DELETE FROM evaluations
+WHERE sheet_hash IS NOT NULL
+  AND id NOT IN (SELECT MAX(id) FROM evaluations WHERE sheet_hash IS NOT NULL GROUP BY exam_id, sheet_hash)
+"""
+
+INSERT_EVALUATION = """
+INSERT INTO evaluations (exam_id, sheet_hash, file, score, total, percentage, correct, wrong, unmarked, answers)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (exam_id, sheet_hash) DO UPDATE SET
+    file = excluded.file, score = excluded.score, total = excluded.total, percentage = excluded.percentage,
+    correct = excluded.correct, wrong = excluded.wrong, unmarked = excluded.unmarked,
+    answers = excluded.answers, created_at = CURRENT_TIMESTAMP
+"""
+
+
+def content_hash(data: bytes) -> str:
+    """Hex digest identifying a sheet upload by content"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def connect(path) -> sqlite3.Connection:
+    """Open a connection configured for concurrent readers and one writer"""
+    conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Durable at checkpoints; a power cut can lose only the last commits
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_db(conn: sqlite3.Connection):
+    """Create tables and indexes if they do not exist"""
+    conn.executescript(SCHEMA)
+    # job_files rows hold single PDF pages since first_page was added
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(job_files)")}
+    if "first_page" not in columns:
+        conn.execute("ALTER TABLE job_files ADD COLUMN first_page INTEGER NOT NULL DEFAULT 1")
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (EVALUATION_UNIQUE_INDEX,)
+    ).fetchone()
+    if not exists:
+        removed = conn.execute(DEDUPLICATE_EVALUATIONS).rowcount
+        if removed:
+            logger.info(f"Removed {removed} duplicate evaluations before adding the unique sheet index")
+        conn.execute(
+            f"CREATE UNIQUE INDEX {EVALUATION_UNIQUE_INDEX} ON evaluations (exam_id, sheet_hash)"
+        )
+    conn.commit()
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of SQLite connections shared across threads.
+
+    Parameters:
+        - path: Database file
+        - size: Number of connections (WAL allows readers alongside one writer)
+    """
+
+    def __init__(self, path, size: int = 4):
+        self.path = Path(path)
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success and rolls back on error"""
+        conn = self._get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def _get(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect(self.path)
+        return self._idle.get()
+
+    def init(self):
+        """Create the schema"""
+        with self.connection() as conn:
+            init_db(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+def save_exam(pool: ConnectionPool, exam_id: int, answer_key: dict) -> int:
+    """
+    Insert or replace an exam's answer key.
+
+    Stored evaluations are re-aligned to and rescored against the new key.
+    Returns the number of evaluations rescored.
+    """
+    new_key = AnswerKey.from_spec(answer_key)
+    with pool.connection() as conn:
+        old_key = _exam_key(conn, exam_id)
+        conn.execute(
+            "INSERT OR REPLACE INTO exams (id, answer_key) VALUES (?, ?)",
+            (exam_id, json.dumps(answer_key))
+        )
+        if old_key is None or _same_key(old_key, new_key):
+            return 0
+
+        rows = conn.execute("SELECT id, answers FROM evaluations WHERE exam_id = ?", (exam_id,)).fetchall()
+        if not rows:
+            return 0
+        codes = np.stack([np.frombuffer(answers, dtype=np.uint8) for _, answers in rows])
+        scored = _rescore(codes, old_key, new_key)
+        conn.executemany(
+            "UPDATE evaluations SET score = ?, total = ?, percentage = ?, correct = ?, wrong = ?, unmarked = ?, "
+            "answers = ? WHERE id = ?",
+            [(*fields, row_id) for fields, (row_id, _) in zip(scored, rows)]
+        )
+    logger.info(f"Rescored {len(rows)} evaluations of exam {exam_id} against its new answer key")
+    return len(rows)
+
+
+def _exam_key(conn: sqlite3.Connection, exam_id: int):
+    row = conn.execute("SELECT answer_key FROM exams WHERE id = ?", (exam_id,)).fetchone()
+    return AnswerKey.from_spec(json.loads(row[0])) if row else None
+
+
+def _same_key(a: AnswerKey, b: AnswerKey) -> bool:
+    return all(np.array_equal(x, y) for x, y in (
+        (a.questions, b.questions), (a.answers, b.answers), (a.weights, b.weights), (a.penalties, b.penalties)
+    ))
+
+
+def _rescore(codes: np.ndarray, old_key: AnswerKey, new_key: AnswerKey) -> list:
+    """
+    Move (S, N_old) code rows to new_key's columns by question number and
+    score them; questions new to the key are unmarked.
+
+    Returns: per row (score, total, percentage, correct, wrong, unmarked, answers blob)
+    """
+    columns = np.minimum(np.searchsorted(old_key.questions, new_key.questions), len(old_key) - 1)
+    known = old_key.questions[columns] == new_key.questions
+    aligned = np.full((len(codes), len(new_key)), UNMARKED, dtype=np.uint8)
+    aligned[:, known] = codes[:, columns[known]]
+
+    scores = new_key.score_batch(aligned)
+    return [
+        (
+            round(float(scores["score"][i]), 2) if new_key.weighted else int(round(scores["score"][i])),
+            len(new_key), float(scores["percentage"][i]), int(scores["correct"][i]),
+            int(scores["wrong"][i]), int(scores["unmarked"][i]), aligned[i].tobytes(),
+        )
+        for i in range(len(aligned))
+    ]
+
+
+def load_exam_key(pool: ConnectionPool, exam_id: int):
+    """Return an exam's answer key spec as stored (decoded JSON), or None"""
+    with pool.connection() as conn:
+        row = conn.execute("SELECT answer_key FROM exams WHERE id = ?", (exam_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+class EvaluationStore:
+    """
+    Buffered writer for evaluation results.
+
+    add() only queues a row; rows are written with a single executemany per
+    `batch_size` rows (or on flush()/close()). Use as a context manager.
+    A sheet already stored for the exam (same sheet_hash) is overwritten.
+    If the exam's key was replaced since answer_key was loaded, rows are
+    re-aligned to and rescored against the stored key before writing.
+
+    Parameters:
+        - pool: ConnectionPool
+        - exam_id: Exam the evaluations belong to
+        - answer_key: AnswerKey used for scoring (encodes the answer blobs)
+        - batch_size: Rows per insert transaction
+    """
+
+    def __init__(self, pool: ConnectionPool, exam_id: int, answer_key: AnswerKey, batch_size: int = 500):
+        self.pool = pool
+        self.exam_id = exam_id
+        self.answer_key = answer_key
+        self.batch_size = batch_size
+        self.written = 0
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    @property
+    def full(self) -> bool:
+        return len(self._rows) >= self.batch_size
+
+    def add(self, record: dict, sheet_hash: str = None):
+        """Queue a successful evaluation record (errors are not stored)"""
+        if record.get("status") != "success":
+            return
+        codes = self.answer_key.encode(record["detected_answers"], record.get("multiple_marks"))
+        self._rows.append((
+            self.exam_id, sheet_hash, record.get("file"), record["score"], record["total"],
+            record["percentage"], record["correct"], record["wrong"], record["unmarked"],
+            codes.tobytes(),
+        ))
+
+    def flush(self):
+        """Write queued rows in one transaction"""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        with self.pool.connection() as conn:
+            current = _exam_key(conn, self.exam_id)
+            if current is not None and not _same_key(current, self.answer_key):
+                codes = np.stack([np.frombuffer(row[-1], dtype=np.uint8) for row in rows])
+                rows = [row[:3] + fields for row, fields in zip(rows, _rescore(codes, self.answer_key, current))]
+            conn.executemany(INSERT_EVALUATION, rows)
+        self.written += len(rows)
+        logger.debug(f"Stored {len(rows)} evaluations for exam {self.exam_id}")
+
+
+def query_evaluations(pool: ConnectionPool, exam_id: int, limit: int = 100, offset: int = 0,
+                      answer_key: AnswerKey = None) -> list:
+    """
+    Evaluations of an exam, best score first (served by the exam/score index).
+
+    When answer_key is given, answer blobs are decoded to {question: "A"}.
+    """
+    with pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT id, sheet_hash, file, score, total, percentage, correct, wrong, unmarked, answers, created_at "
+            "FROM evaluations WHERE exam_id = ? ORDER BY score DESC LIMIT ? OFFSET ?",
+            (exam_id, limit, offset)
+        ).fetchall()
+
+    columns = ["id", "sheet_hash", "file", "score", "total", "percentage", "correct", "wrong", "unmarked"]
+    results = []
+    for row in rows:
+        result = dict(zip(columns, row[:9]))
+        result["created_at"] = row[10]
+        if answer_key is not None:
+            result["detected_answers"] = answer_key.decode(row[9])
+        results.append(result)
+    return results
+
+
+def exam_statistics(pool: ConnectionPool, exam_id: int) -> dict:
+    """Count and score statistics of an exam's stored evaluations"""
+    with pool.connection() as conn:
+        count, mean, low, high, mean_percentage = conn.execute(
+            "SELECT COUNT(*), AVG(score), MIN(score), MAX(score), AVG(percentage) "
+            "FROM evaluations WHERE exam_id = ?",
+            (exam_id,)
+        ).fetchone()
+    return {
+        "exam_id": exam_id,
+        "evaluations": count,
+        "mean_score": round(mean, 2) if mean is not None else None,
+        "min_score": low,
+        "max_score": high,
+        "mean_percentage": round(mean_percentage, 2) if mean_percentage is not None else None,
+    }
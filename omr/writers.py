@@ -0,0 +1,232 @@
+"""
+Incremental result writers for bulk scanning.
+
+Each writer appends one flat row per sheet and makes rows durable as it goes,
+so a long run never holds all results in memory and a crash loses at most the
+rows that were not yet flushed. ``write`` returns True once every row written
+so far is safely on disk; the CLI only checkpoints sheets after that.
+``retain`` rewrites existing output keeping only the rows a predicate accepts,
+which lets a resumed run drop the rows of sheets it is about to retry.
+"""
+
+import csv
+import json
+import os
+from pathlib import Path
+
+BASE_COLUMNS = ["file", "status", "score", "total", "percentage", "correct", "wrong", "unmarked", "error"]
+
+
+def question_columns(questions) -> list:
+    """Per-question answer columns (q1, q2, ...)"""
+    return [f"q{q}" for q in questions]
+
+
+def flatten_record(record: dict, questions) -> dict:
+    """Flatten an evaluation record into one row with a column per question"""
+    row = {column: record.get(column) for column in BASE_COLUMNS}
+    answers = record.get("detected_answers") or {}
+    for q in questions:
+        row[f"q{q}"] = answers.get(q, answers.get(str(q)))
+    return row
+
+
+class CsvWriter:
+    """Append rows to a CSV file, flushing after every row"""
+
+    name = "csv"
+
+    def __init__(self, path, columns: list, append: bool = False):
+        path = Path(path)
+        write_header = not (append and path.exists() and path.stat().st_size)
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=columns)
+        if write_header:
+            self._writer.writeheader()
+
+    def write(self, row: dict) -> bool:
+        self._writer.writerow(row)
+        self._file.flush()
+        return True
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def retain(path, keep) -> int:
+        """Rewrite the file with only the rows keep(row) accepts; returns rows dropped"""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        dropped = 0
+        with open(path, newline="", encoding="utf-8") as src, open(tmp, "w", newline="", encoding="utf-8") as dst:
+            reader = csv.DictReader(src)
+            writer = csv.DictWriter(dst, fieldnames=reader.fieldnames or [])
+            if reader.fieldnames:
+                writer.writeheader()
+            for row in reader:
+                if keep(row):
+                    writer.writerow(row)
+                else:
+                    dropped += 1
+        os.replace(tmp, path)
+        return dropped
+
+
+class JsonlWriter:
+    """Append rows as JSON lines, flushing after every row"""
+
+    name = "jsonl"
+
+    def __init__(self, path, columns: list, append: bool = False):
+        self._columns = columns
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, row: dict) -> bool:
+        self._file.write(json.dumps({column: row.get(column) for column in self._columns}) + "\n")
+        self._file.flush()
+        return True
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def retain(path, keep) -> int:
+        """Rewrite the file with only the rows keep(row) accepts; returns rows dropped"""
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        dropped = 0
+        with open(path, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None  # last line cut short by a crash
+                if row is not None and keep(row):
+                    dst.write(line if line.endswith("\n") else line + "\n")
+                else:
+                    dropped += 1
+        os.replace(tmp, path)
+        return dropped
+
+
+class ParquetWriter:
+    """
+    Write rows as a Parquet dataset directory of part files.
+
+    A Parquet file is unreadable until its footer is written, so rows are
+    buffered and written as complete part-NNNNN.parquet files of
+    `rows_per_part` rows. The directory reads as one table with pyarrow or
+    pandas. Requires pyarrow.
+    """
+
+    name = "parquet"
+
+    def __init__(self, path, columns: list, append: bool = False, rows_per_part: int = 1000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+
+        self._dir = Path(path)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        existing = sorted(self._dir.glob("part-*.parquet"))
+        if not append:
+            for part in existing:
+                part.unlink()
+            existing = []
+        self._next_part = len(existing)
+
+        types = {"score": pa.float64(), "percentage": pa.float64(), "total": pa.int32(),
+                 "correct": pa.int32(), "wrong": pa.int32(), "unmarked": pa.int32()}
+        self._schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+        self._rows_per_part = rows_per_part
+        self._rows = []
+
+    def write(self, row: dict) -> bool:
+        self._rows.append(row)
+        if len(self._rows) < self._rows_per_part:
+            return False
+        self._flush()
+        return True
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+        part = self._dir / f"part-{self._next_part:05d}.parquet"
+        tmp = part.with_suffix(".tmp")
+        self._pq.write_table(table, tmp)
+        tmp.replace(part)
+        self._next_part += 1
+        self._rows = []
+
+    def close(self):
+        self._flush()
+
+    @staticmethod
+    def retain(path, keep) -> int:
+        """
+        Rewrite the part files with only the rows keep(row) accepts; returns
+        rows dropped. Emptied parts are kept (with no rows) so part numbering
+        stays contiguous for appends.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        dropped = 0
+        for part in sorted(Path(path).glob("part-*.parquet")):
+            table = pq.read_table(part)
+            mask = [keep(row) for row in table.to_pylist()]
+            if all(mask):
+                continue
+            dropped += mask.count(False)
+            tmp = part.with_suffix(".tmp")
+            pq.write_table(table.filter(pa.array(mask, type=pa.bool_())), tmp)
+            tmp.replace(part)
+        return dropped
+
+
+WRITERS = {
+    CsvWriter.name: CsvWriter,
+    JsonlWriter.name: JsonlWriter,
+    ParquetWriter.name: ParquetWriter,
+}
+
+
+def writer_format(path, fmt: str = None) -> str:
+    """Return the output format, inferred from the file extension when not given"""
+    fmt = (fmt or Path(path).suffix.lstrip(".") or "csv").lower()
+    if fmt == "ndjson":
+        fmt = "jsonl"
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown output format '{fmt}', choose from {sorted(WRITERS)}")
+    return fmt
+
+
+def retain_rows(path, keep, fmt: str = None) -> int:
+    """
+    Keep only the rows of existing output at path that keep(row) accepts.
+
+    Returns the number of rows dropped (0 when there is no output yet).
+    """
+    if not Path(path).exists():
+        return 0
+    fmt = writer_format(path, fmt)
+    try:
+        return WRITERS[fmt].retain(path, keep)
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow, install it with: pip install pyarrow")
+
+
+def open_writer(path, columns: list, fmt: str = None, append: bool = False):
+    """
+    Open a result writer for path.
+
+    Raises ImportError for Parquet output when pyarrow is not installed.
+    """
+    fmt = writer_format(path, fmt)
+    try:
+        return WRITERS[fmt](path, columns, append=append)
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow, install it with: pip install pyarrow")
@@ -0,0 +1,142 @@
+import pytest
+
+from omr import key_cache
+from omr.key_cache import AnswerKeyCache
+from omr.result_cache import ScanResultCache, scan_cache_key
+from omr.scoring import AnswerKey
+from omr.storage import ConnectionPool
+
+RESULT = {"status": "success", "detected_answers": {"1": "A"}, "total_questions": 1}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(key_cache.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = ConnectionPool(tmp_path / "omr.db", size=2)
+    pool.init()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def specs():
+    return {1: {"1": "A", "2": "B"}, 2: ["C", "D"], 3: {"1": "B"}}
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def keys(specs, loads, clock):
+    def loader(exam_id):
+        loads.append(exam_id)
+        return specs.get(exam_id)
+    return AnswerKeyCache(loader, ttl=60, max_entries=2)
+
+
+def test_key_cache_loads_once(keys, loads):
+    first = keys.get(1)
+    assert isinstance(first, AnswerKey)
+    assert keys.get(1) is first
+    assert loads == [1]
+    assert (keys.hits, keys.misses) == (1, 1)
+
+
+def test_key_cache_unknown_exam(keys):
+    assert keys.get(99) is None
+    assert keys.stats()["entries"] == 0
+
+
+def test_key_cache_without_load_only_checks_memory(keys, loads):
+    assert keys.get(1, load=False) is None
+    assert loads == []
+
+
+def test_key_cache_expires_after_ttl(keys, loads, specs, clock):
+    keys.get(1)
+    specs[1] = {"1": "C"}
+    clock.now += 59
+    assert keys.get(1).decode(keys.get(1).answers) == {1: "A", 2: "B"}
+    clock.now += 2
+    assert keys.get(1).decode(keys.get(1).answers) == {1: "C"}
+    assert loads == [1, 1]
+
+
+def test_key_cache_evicts_least_recently_used(keys, loads):
+    keys.get(1)
+    keys.get(2)
+    keys.get(1)
+    keys.get(3)
+    assert keys.get(1, load=False) is not None
+    assert keys.get(2, load=False) is None
+
+
+def test_key_cache_put_and_invalidate(keys, loads):
+    key = AnswerKey.from_spec({"1": "D"})
+    keys.put(1, key)
+    assert keys.get(1) is key
+    # Shared across requests, so the arrays are read-only
+    assert not key.answers.flags.writeable
+    keys.invalidate(1)
+    assert keys.get(1) is not key
+    assert loads == [1]
+
+
+def test_scan_cache_key_covers_parameters():
+    base = scan_cache_key("abc", 4, 200)
+    assert base == scan_cache_key("abc", 4, 200, None, None, True)
+    assert len({base, scan_cache_key("abd", 4, 200), scan_cache_key("abc", 5, 200), scan_cache_key("abc", 4, 300),
+                scan_cache_key("abc", 4, 200, 50, 2), scan_cache_key("abc", 4, 200, deskew=False)}) == 6
+
+
+def test_result_cache_memory_lru():
+    cache = ScanResultCache(max_entries=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    assert cache.cached("a") == RESULT
+    cache.put("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_result_cache_skips_failed_results():
+    cache = ScanResultCache()
+    cache.put("a", {"status": "error", "error": "No bubbles"})
+    assert cache.get("a") is None
+
+
+def test_result_cache_sqlite_tier_survives_restart(db):
+    ScanResultCache(db_pool=db).put("a", RESULT)
+
+    cache = ScanResultCache(db_pool=db)
+    assert cache.cached("a") is None
+    assert cache.get("a") == RESULT
+    assert cache.db_hits == 1
+    assert cache.cached("a") == RESULT
+
+
+def test_result_cache_prunes_oldest_rows(db):
+    cache = ScanResultCache(max_entries=0, db_pool=db, max_db_entries=3)
+    for key in "abcde":
+        cache.put(key, RESULT)
+    # Replacing a row makes it the newest
+    cache.put("b", RESULT)
+    assert cache.prune() == 2
+    assert [key for key in "abcde" if cache.get(key)] == ["b", "d", "e"]
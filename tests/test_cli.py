@@ -0,0 +1,121 @@
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+# omr.cli imports the scan pipeline, which needs the contour detector module
+pytest.importorskip("omr.detector_enhanced")
+
+from omr import cli  # noqa: E402
+from omr.evaluation import evaluation_record  # noqa: E402
+
+KEY = {"1": "A", "2": "B"}
+
+
+class FakeEvaluate:
+    """
+    Stands in for iter_evaluate: scores every sheet as answering "A", "B"
+    except the names in `failing`, and raises KeyboardInterrupt after
+    `interrupt_after` records.
+    """
+
+    def __init__(self):
+        self.failing = set()
+        self.interrupt_after = None
+        self.scanned = []
+
+    def __call__(self, sources, answer_key, **options):
+        for index, source in enumerate(sources):
+            if self.interrupt_after is not None and len(self.scanned) >= self.interrupt_after:
+                raise KeyboardInterrupt
+            name = Path(source).name
+            self.scanned.append(name)
+            if name in self.failing:
+                yield evaluation_record(index, name, None, answer_key, error=ValueError("unreadable"))
+            else:
+                yield evaluation_record(index, name, {"detected_answers": {1: "A", 2: "B"}}, answer_key)
+
+
+@pytest.fixture
+def evaluate(monkeypatch):
+    fake = FakeEvaluate()
+    monkeypatch.setattr(cli, "iter_evaluate", fake)
+    return fake
+
+
+@pytest.fixture
+def sheets(tmp_path):
+    folder = tmp_path / "scans"
+    folder.mkdir()
+    for name in ("a.png", "b.png", "c.png", "d.png"):
+        (folder / name).write_bytes(b"image")
+    (tmp_path / "key.json").write_text(json.dumps(KEY))
+    return tmp_path
+
+
+def scan(sheets, out: str, *extra) -> int:
+    return cli.main(["scan", str(sheets / "scans"), "--key", str(sheets / "key.json"),
+                     "--out", str(sheets / out), "--workers", "1", "--quiet", *extra])
+
+
+def read_rows(path: Path) -> list:
+    if path.suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def checkpoint(sheets, out: str) -> list:
+    return sorted(Path(line).name for line in (sheets / f"{out}.checkpoint").read_text().splitlines())
+
+
+@pytest.mark.parametrize("out", ["results.csv", "results.jsonl"])
+def test_resume_retries_failed_sheets_without_duplicate_rows(sheets, evaluate, out):
+    evaluate.failing = {"b.png"}
+    assert scan(sheets, out) == 0
+    rows = read_rows(sheets / out)
+    assert sorted((Path(r["file"]).name, r["status"]) for r in rows) == [
+        ("a.png", "success"), ("b.png", "error"), ("c.png", "success"), ("d.png", "success"),
+    ]
+    assert checkpoint(sheets, out) == ["a.png", "c.png", "d.png"]
+
+    evaluate.failing = set()
+    evaluate.scanned = []
+    assert scan(sheets, out, "--resume") == 0
+    assert evaluate.scanned == ["b.png"]
+    rows = read_rows(sheets / out)
+    assert sorted(Path(r["file"]).name for r in rows) == ["a.png", "b.png", "c.png", "d.png"]
+    assert {r["status"] for r in rows} == {"success"}
+    assert {r["q1"] for r in rows} == {"A"}
+    assert checkpoint(sheets, out) == ["a.png", "b.png", "c.png", "d.png"]
+
+
+def test_resume_after_interruption(sheets, evaluate):
+    evaluate.interrupt_after = 2
+    assert scan(sheets, "results.csv") == 130
+    assert checkpoint(sheets, "results.csv") == ["a.png", "b.png"]
+
+    evaluate.interrupt_after = None
+    evaluate.scanned = []
+    assert scan(sheets, "results.csv", "--resume") == 0
+    assert evaluate.scanned == ["c.png", "d.png"]
+    rows = read_rows(sheets / "results.csv")
+    assert [Path(r["file"]).name for r in rows] == ["a.png", "b.png", "c.png", "d.png"]
+
+
+def test_resume_with_nothing_left(sheets, evaluate):
+    assert scan(sheets, "results.csv") == 0
+    evaluate.scanned = []
+    assert scan(sheets, "results.csv", "--resume") == 0
+    assert evaluate.scanned == []
+    assert len(read_rows(sheets / "results.csv")) == 4
+
+
+def test_run_without_resume_starts_over(sheets, evaluate):
+    evaluate.failing = {"a.png"}
+    scan(sheets, "results.csv")
+    evaluate.failing = set()
+    scan(sheets, "results.csv")
+    assert len(read_rows(sheets / "results.csv")) == 4
+    assert checkpoint(sheets, "results.csv") == ["a.png", "b.png", "c.png", "d.png"]
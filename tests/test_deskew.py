@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+import pytest
+
+from omr.deskew import deskew, estimate_skew
+
+
+@pytest.fixture
+def page():
+    """Blank sheet-like page: numbered rows of bubbles with a rule under each"""
+    page = np.full((1100, 850), 255, dtype=np.uint8)
+    for row in range(12):
+        y = 120 + row * 70
+        cv2.putText(page, f"{row + 1}.", (60, y + 8), cv2.FONT_HERSHEY_SIMPLEX, 0.7, 0, 2)
+        for option in range(5):
+            cv2.circle(page, (150 + option * 60, y), 18, 0, 2)
+        cv2.line(page, (60, y + 35), (790, y + 35), 0, 1)
+    return page
+
+
+def rotate(image: np.ndarray, angle: float) -> np.ndarray:
+    """Rotate content counter-clockwise by angle degrees"""
+    height, width = image.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), borderValue=255)
+
+
+@pytest.mark.parametrize("angle", [0.0, 1.5, -3.0, 4.5])
+def test_estimate_skew(page, angle):
+    assert estimate_skew(rotate(page, angle)) == pytest.approx(angle, abs=0.1)
+
+
+def test_estimate_skew_blank_page():
+    assert estimate_skew(np.full((500, 400), 255, dtype=np.uint8)) == 0.0
+
+
+def test_deskew_straightens_rotated_scan(page):
+    gray, angle, applied = deskew(cv2.cvtColor(rotate(page, 2.0), cv2.COLOR_GRAY2BGR))
+    assert applied
+    assert angle == pytest.approx(2.0, abs=0.1)
+    assert gray.ndim == 2
+    assert estimate_skew(gray) == pytest.approx(0.0, abs=0.1)
+
+
+def test_deskew_leaves_straight_scan_alone(page):
+    gray, angle, applied = deskew(page)
+    assert not applied
+    assert gray is page
+
+
+def test_deskew_tolerance(page):
+    skewed = rotate(page, 1.0)
+    assert not deskew(skewed, tolerance=1.5)[2]
+    assert deskew(skewed, tolerance=0.5)[2]
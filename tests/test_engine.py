@@ -0,0 +1,88 @@
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from omr.engine import DetectionPool, PoolSaturated
+
+
+def square(x):
+    return x * x
+
+
+def crash():
+    os._exit(1)
+
+
+def crash_once(marker):
+    # The first attempt kills its worker; the isolated resubmit succeeds
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return "recovered"
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.fixture
+def pool():
+    pool = DetectionPool(workers=2, max_queue=4, timeout=10)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+def test_run_returns_result(pool):
+    assert asyncio.run(pool.run(square, 7)) == 49
+    assert pool.pending == 0
+
+
+def test_crashing_job_fails_alone_and_pool_recovers(pool):
+    async def scenario():
+        crashing = pool.submit(crash)
+        healthy = pool.submit(sleep, 0.2)
+        with pytest.raises(BrokenProcessPool):
+            await pool.wait(crashing)
+        # A job caught in the broken executor is resubmitted, not failed
+        assert await pool.wait(healthy) == 0.2
+        return await pool.run(square, 3)
+
+    assert asyncio.run(scenario()) == 9
+    assert pool.restarts >= 1
+    assert pool.pending == 0
+
+
+def test_job_resubmitted_after_worker_crash(pool, tmp_path):
+    assert asyncio.run(pool.run(crash_once, str(tmp_path / "crashed"))) == "recovered"
+    assert pool.restarts == 1
+
+
+def test_timed_out_job_recycles_workers(pool):
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(sleep, 30, timeout=0.5)
+        return await pool.run(square, 4, timeout=10)
+
+    started = time.perf_counter()
+    assert asyncio.run(scenario()) == 16
+    # The hung worker was killed instead of running for its full 30s
+    assert time.perf_counter() - started < 15
+    assert pool.restarts == 1
+    assert pool.pending == 0
+
+
+def test_saturated_pool_rejects_submissions():
+    pool = DetectionPool(workers=1, max_queue=1, retry_after=7)
+    try:
+        future = pool.submit(sleep, 0.2)
+        with pytest.raises(PoolSaturated) as error:
+            pool.submit(square, 2)
+        assert error.value.retry_after == 7
+        assert future.result(timeout=10) == 0.2
+        assert pool.submit(square, 2).result(timeout=10) == 4
+    finally:
+        pool.shutdown(wait=False)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from omr.fill import disc_fill_ratios
+
+
+@pytest.fixture
+def binary():
+    image = np.zeros((40, 60), dtype=np.uint8)
+    image[5:16, 5:16] = 255      # fully inked square around (10, 10)
+    image[20:31, 20:26] = 255    # left half of the disc around (25, 25)
+    return image
+
+
+def test_full_and_empty_discs(binary):
+    fills = disc_fill_ratios(binary, [(10, 10), (45, 10)], 5)
+    assert fills.tolist() == [100.0, 0.0]
+
+
+def test_partial_disc(binary):
+    fills = disc_fill_ratios(binary, [(25, 25)], 5)
+    assert 50 < fills[0] < 60
+
+
+def test_results_in_input_order_with_mixed_radii(binary):
+    fills = disc_fill_ratios(binary, [(45, 10), (10, 10), (10, 10)], [3, 5, 2])
+    assert fills.tolist() == [0.0, 100.0, 100.0]
+
+
+def test_discs_at_the_image_edge_report_zero(binary):
+    binary[:] = 255
+    height, width = binary.shape
+    centers = [(0, 20), (30, 0), (width - 1, 20), (30, height - 1), (4, 20), (5, 20)]
+    fills = disc_fill_ratios(binary, centers, 5)
+    assert fills.tolist() == [0.0, 0.0, 0.0, 0.0, 0.0, 100.0]
+
+
+def test_threshold_counts_dark_pixels_as_ink():
+    gray = np.full((30, 30), 200, dtype=np.uint8)
+    gray[10:21, 10:21] = 120
+    centers = [(15, 15)]
+    assert disc_fill_ratios(gray, centers, 5, threshold=127).tolist() == [100.0]
+    assert disc_fill_ratios(gray, centers, 5, threshold=120).tolist() == [100.0]
+    assert disc_fill_ratios(gray, centers, 5, threshold=119).tolist() == [0.0]
+    # Without a threshold every non-zero pixel is ink
+    assert disc_fill_ratios(gray, centers, 5).tolist() == [100.0]
+
+
+def test_radii_are_rounded_and_at_least_one():
+    binary = np.zeros((10, 10), dtype=np.uint8)
+    binary[5, 5] = 255
+    # Radius 0.2 rounds up to 1: the center is one of the disc's five pixels
+    assert disc_fill_ratios(binary, [(5.4, 4.6)], 0.2).tolist() == [20.0]
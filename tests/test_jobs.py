@@ -0,0 +1,144 @@
+import pytest
+
+# omr.jobs runs omr.scan, which needs the contour detector module
+pytest.importorskip("omr.detector_enhanced")
+
+from omr.engine import DetectionPool  # noqa: E402
+from omr.jobs import (  # noqa: E402
+    COMPLETE, JobRunner, JobTooLarge, _item_record, cancel_job, create_job, get_job, purge_jobs
+)
+from omr.storage import ConnectionPool  # noqa: E402
+
+try:
+    import pymupdf
+except ImportError:
+    import fitz as pymupdf
+
+PARAMS = {"expected_options": 4}
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = ConnectionPool(tmp_path / "jobs.db", size=2)
+    pool.init()
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def runner(db):
+    # Never started: the tests drive _claim/_finish directly
+    return JobRunner(DetectionPool(workers=1), db)
+
+
+@pytest.fixture
+def pdf():
+    with pymupdf.open() as doc:
+        for page in range(3):
+            doc.new_page().insert_text((72, 72), f"page {page + 1}")
+        return doc.tobytes()
+
+
+def success(item: tuple) -> dict:
+    job_id, index, name, page = item[:4]
+    return _item_record(index, name, page, {"detected_answers": {1: "A"}, "total_questions": 1})
+
+
+def test_create_job_splits_pdf_pages(db, pdf):
+    job = create_job(db, [("a.png", b"png"), ("class.pdf", pdf)], PARAMS)
+    assert job["total"] == 4
+
+    with db.connection() as conn:
+        files = conn.execute(
+            "SELECT name, first_page FROM job_files WHERE job_id = ? ORDER BY file_index", (job["job_id"],)
+        ).fetchall()
+        data = conn.execute("SELECT data FROM job_files WHERE job_id = ? AND file_index = 2",
+                            (job["job_id"],)).fetchone()[0]
+    assert files == [("a.png", 1), ("class.pdf", 1), ("class.pdf", 2), ("class.pdf", 3)]
+    with pymupdf.open(stream=data, filetype="pdf") as page:
+        assert page.page_count == 1
+        assert "page 2" in page[0].get_text()
+
+
+def test_create_job_limits(db, pdf):
+    with pytest.raises(ValueError):
+        create_job(db, [], PARAMS)
+    with pytest.raises(JobTooLarge) as error:
+        create_job(db, [("a.png", b"png"), ("class.pdf", pdf)], PARAMS, max_items=3)
+    assert error.value.items == 4
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+
+
+def test_claim_round_robin_across_jobs(db, runner, pdf):
+    first = create_job(db, [("class.pdf", pdf)], PARAMS)["job_id"]
+    second = create_job(db, [("a.png", b"a"), ("b.png", b"b")], PARAMS)["job_id"]
+
+    claimed = [runner._claim() for _ in range(5)]
+    assert [(item[0], item[1]) for item in claimed] == [
+        (first, 0), (second, 0), (first, 1), (second, 1), (first, 2),
+    ]
+    # Pages of a split PDF are page 1 of their own stored file
+    assert [(item[3], item[5]) for item in claimed if item[0] == first] == [(1, 1), (2, 1), (3, 1)]
+    assert claimed[1][4] == b"a"
+    assert claimed[1][6] == PARAMS
+    assert runner._claim() is None
+
+
+def test_finish_completes_job_and_pages_results(db, runner):
+    job_id = create_job(db, [("a.png", b"a"), ("b.png", b"b"), ("c.png", b"c")], PARAMS)["job_id"]
+    items = [runner._claim() for _ in range(3)]
+    runner._finish(items[1], success(items[1]))
+    runner._finish(items[0], _item_record(0, "a.png", 1, error=ValueError("unreadable")))
+
+    job = get_job(db, job_id, limit=1)
+    assert (job["status"], job["done"], job["failed"]) == ("running", 1, 1)
+    assert [r["file"] for r in job["results"]] == ["b.png"]
+    assert job["has_more"]
+    job = get_job(db, job_id, after=job["cursor"])
+    assert [r["status"] for r in job["results"]] == ["error"]
+
+    runner._finish(items[2], success(items[2]))
+    # A second result for the same item is ignored
+    runner._finish(items[2], success(items[2]))
+    job = get_job(db, job_id, after=2)
+    assert (job["status"], job["done"], job["progress"]) == (COMPLETE, 2, 100.0)
+    assert [r["file"] for r in job["results"]] == ["c.png"]
+    assert job["finished_at"] is not None
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM job_files WHERE job_id = ?", (job_id,)).fetchone()[0] == 0
+
+
+def test_interrupted_items_are_requeued(db, runner):
+    job_id = create_job(db, [("a.png", b"a")], PARAMS)["job_id"]
+    assert runner._claim()[0] == job_id
+    assert runner._claim() is None
+
+    restarted = JobRunner(DetectionPool(workers=1), db)
+    assert restarted._requeue() == 1
+    assert restarted._claim()[0] == job_id
+
+
+def test_cancel_job(db, runner):
+    job_id = create_job(db, [("a.png", b"a"), ("b.png", b"b")], PARAMS)["job_id"]
+    item = runner._claim()
+    assert cancel_job(db, job_id)
+    assert not cancel_job(db, job_id)
+    assert runner._claim() is None
+    runner._finish(item, success(item))
+    assert get_job(db, job_id)["status"] == "cancelled"
+
+
+def test_purge_removes_old_finished_jobs(db):
+    old, recent, active = (create_job(db, [("a.png", b"a")], PARAMS)["job_id"] for _ in range(3))
+    cancel_job(db, old)
+    cancel_job(db, recent)
+    with db.connection() as conn:
+        conn.execute("UPDATE jobs SET finished_at = datetime('now', '-48 hours') WHERE id = ?", (old,))
+
+    assert purge_jobs(db, 24) == 1
+    assert get_job(db, old) is None
+    assert get_job(db, recent) is not None
+    assert get_job(db, active)["status"] == "queued"
+    with db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM job_items WHERE job_id = ?", (old,)).fetchone()[0] == 0
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+import pytest
+
+from omr.layout import SheetLayout, detect_with_layout, extract_layout
+from omr.rasterizer import render_page
+
+try:
+    import pymupdf
+except ImportError:
+    import fitz as pymupdf
+
+DPI = 150
+MARKS = {1: "A", 2: "D", 4: "B", 7: "C"}
+
+
+def bubble(question: int, option: int) -> tuple:
+    """Center of a bubble on the test sheet, in points"""
+    return 70 + option * 40, 40 + question * 38
+
+
+@pytest.fixture(scope="module")
+def sheet_pdf():
+    """Eight numbered questions with four bubbles each inside a frame"""
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=300, height=400)
+        for question in range(1, 9):
+            page.insert_text((28, bubble(question, 0)[1] + 4), f"{question}.", fontsize=10)
+            for option in range(4):
+                page.draw_circle(bubble(question, option), 9, color=(0, 0, 0), width=1)
+        page.draw_rect(pymupdf.Rect(15, 15, 285, 385), color=(0, 0, 0), width=2)
+        return doc.tobytes()
+
+
+@pytest.fixture(scope="module")
+def layout(sheet_pdf):
+    return extract_layout(sheet_pdf, 4)
+
+
+@pytest.fixture(scope="module")
+def scan(sheet_pdf):
+    image = render_page(sheet_pdf, 1, dpi=DPI)
+    scale = DPI / 72
+    for question, answer in MARKS.items():
+        x, y = bubble(question, "ABCD".index(answer))
+        cv2.circle(image, (round(x * scale), round(y * scale)), round(7 * scale), 0, -1)
+    return image
+
+
+def test_extract_layout(layout):
+    assert layout.page_size == (300, 400)
+    assert layout.total_questions == 8
+    assert layout.bubbles.shape == (32, 5)
+    assert layout.bubbles[0].tolist() == [1, 0, 70, 78, 9]
+    assert layout.bubbles[-1].tolist() == [8, 3, 190, 344, 9]
+
+
+def test_extract_layout_rejects_wrong_option_count(sheet_pdf):
+    with pytest.raises(ValueError):
+        extract_layout(sheet_pdf, 3)
+
+
+def test_layout_dict_round_trip(layout):
+    restored = SheetLayout.from_dict(layout.to_dict())
+    assert np.allclose(restored.bubbles, layout.bubbles)
+    assert restored.page_size == layout.page_size
+
+
+def test_detect_with_layout(scan, layout):
+    result = detect_with_layout(scan, layout)
+    assert result["status"] == "success"
+    assert result["detected_answers"] == MARKS
+    assert result["total_questions"] == 8
+    assert result["multiple_marks"] == []
+
+
+def test_registration_follows_shifted_scan(scan, layout):
+    shifted = cv2.warpAffine(scan, np.float32([[1, 0, 10], [0, 1, -6]]), scan.shape[::-1], borderValue=255)
+    result = detect_with_layout(shifted, layout)
+    assert result["detected_answers"] == MARKS
+    dx, dy = result["registration"]["shift"]
+    assert dx == pytest.approx(10, abs=1.5)
+    assert dy == pytest.approx(-6, abs=1.5)
+
+
+def test_registration_searches_scale_for_scans_with_margins(scan, layout):
+    small = cv2.resize(scan, None, fx=0.9, fy=0.9, interpolation=cv2.INTER_AREA)
+    canvas = np.full_like(scan, 255)
+    canvas[20:20 + small.shape[0], 25:25 + small.shape[1]] = small
+    result = detect_with_layout(canvas, layout)
+    assert result["detected_answers"] == MARKS
+    assert result["registration"]["scale"][0] == pytest.approx(0.9 * DPI / 72, rel=0.01)
+
+
+def test_fill_threshold(scan, layout):
+    scale = DPI / 72
+    faint = scan.copy()
+    x, y = bubble(3, 1)
+    # Left part of the disc only
+    cv2.rectangle(faint, (round((x - 7) * scale), round((y - 6) * scale)),
+                  (round(x * scale), round((y + 6) * scale)), 0, -1)
+    assert 3 not in detect_with_layout(faint, layout)["detected_answers"]
+    assert detect_with_layout(faint, layout, fill_threshold=30)["detected_answers"][3] == "B"
+
+
+def test_unregistrable_scan_is_an_error(layout):
+    noise = np.random.default_rng(0).integers(0, 256, (833, 625), dtype=np.uint8)
+    result = detect_with_layout(noise, layout)
+    assert result["status"] == "error"
+    assert result["method"] == "layout"
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+import pytest
+
+from omr.loader import decode_gray, encoded_size, is_pdf
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (600, 800, 3), dtype=np.uint8)
+
+
+def encode(image, ext: str, params=()) -> bytes:
+    ok, buffer = cv2.imencode(ext, image, list(params))
+    assert ok
+    return buffer.tobytes()
+
+
+@pytest.mark.parametrize("ext, params", [
+    (".png", ()),
+    (".jpg", ()),
+    (".jpg", (cv2.IMWRITE_JPEG_PROGRESSIVE, 1)),
+])
+def test_encoded_size_reads_header(image, ext, params):
+    assert encoded_size(encode(image, ext, params)) == (800, 600)
+
+
+def test_encoded_size_unknown_or_truncated(image):
+    assert encoded_size(encode(image, ".bmp")) is None
+    assert encoded_size(b"%PDF-1.7") is None
+    assert encoded_size(encode(image, ".png")[:20]) is None
+    # Header cut before the start-of-frame segment
+    assert encoded_size(encode(image, ".jpg")[:30]) is None
+
+
+def test_decode_gray_full_size(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    assert np.array_equal(decode_gray(encode(gray, ".png")), gray)
+    assert decode_gray(encode(image, ".png")).shape == (600, 800)
+
+
+@pytest.mark.parametrize("min_width, shape", [
+    (100, (150, 200)),   # shorter side 600 allows a quarter, not an eighth
+    (300, (300, 400)),
+    (301, (600, 800)),
+    (None, (600, 800)),
+])
+def test_decode_gray_reduces_large_scans(image, min_width, shape):
+    assert decode_gray(encode(image, ".jpg"), min_width=min_width).shape == shape
+
+
+def test_decode_gray_rejects_garbage():
+    with pytest.raises(ValueError):
+        decode_gray(b"not an image")
+
+
+def test_is_pdf():
+    assert is_pdf(b"%PDF-1.4 ...")
+    assert is_pdf(b"", "scan.PDF")
+    assert not is_pdf(b"\x89PNG\r\n", "scan.png")
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from omr.scoring import MULTI_FLAG, UNMARKED, AnswerKey
+
+
+@pytest.fixture
+def key():
+    return AnswerKey({1: "A", 2: "B", 3: "C", 4: "D", 5: "E"})
+
+
+def test_encode_decode_round_trip(key):
+    answers = {1: "A", 2: "C", 4: "D", 5: "B"}
+    codes = key.encode(answers)
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [0, 2, UNMARKED, 3, 1]
+    assert key.decode(codes) == answers
+    assert key.decode(codes.tobytes()) == answers
+
+
+def test_encode_normalizes_and_ignores_unknown(key):
+    codes = key.encode({"1": " a ", 2: "Z", 3: "AB", 99: "A"})
+    assert codes.tolist() == [0, UNMARKED, UNMARKED, UNMARKED, UNMARKED]
+
+
+def test_unmarked_is_255(key):
+    codes = key.encode({})
+    assert (codes == UNMARKED).all()
+    assert key.decode(codes) == {}
+    assert key.score(codes)["unmarked"] == len(key)
+
+
+def test_multiple_marks_set_flag_and_mask(key):
+    codes = key.encode({1: "C", 2: "B"}, multiple_marks=[1, 3])
+    assert codes[0] == MULTI_FLAG | (1 << 2)
+    # Multi-marked without a known option keeps only the flag
+    assert codes[2] == MULTI_FLAG
+    assert codes[1] == 1
+    # Decodes to the lowest marked option, flag-only entries are dropped
+    assert key.decode(codes) == {1: "C", 2: "B"}
+
+    result = key.score(codes)
+    assert (result["correct"], result["wrong"], result["unmarked"]) == (1, 2, 2)
+
+
+def test_multiple_marks_count_as_wrong_even_with_correct_option(key):
+    codes = key.encode({1: "A"}, multiple_marks=[1])
+    scores = key.score_batch(codes)
+    assert scores["correct"][0] == 0
+    assert scores["wrong"][0] == 1
+    assert scores["multiple"][0] == 1
+
+
+def test_score_batch_matches_score():
+    key = AnswerKey.from_spec({"answers": ["A", "B", "C", "D"], "weights": {"2": 2}, "negative": 0.25})
+    sheets = [
+        {"detected_answers": {1: "A", 2: "B", 3: "C", 4: "D"}},
+        {"detected_answers": {1: "B", 2: "B"}},
+        {"detected_answers": {}},
+        {"detected_answers": {1: "A", 3: "D"}, "multiple_marks": [2]},
+    ]
+    matrix = key.encode_batch(sheets)
+    batch = key.score_batch(matrix)
+
+    for row, sheet in enumerate(sheets):
+        single = key.score(key.encode(sheet["detected_answers"], sheet.get("multiple_marks")))
+        assert single["score"] == pytest.approx(batch["score"][row])
+        assert single["percentage"] == pytest.approx(batch["percentage"][row])
+        for field in ("correct", "wrong", "unmarked"):
+            assert single[field] == batch[field][row]
+
+    assert batch["score"].tolist() == pytest.approx([5.0, 1.75, 0.0, 0.25])
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from omr.scoring import UNMARKED, AnswerKey
+from omr.storage import (
+    EVALUATION_UNIQUE_INDEX, ConnectionPool, EvaluationStore, init_db, query_evaluations, save_exam
+)
+
+KEY = {"1": "A", "2": "B", "3": "C"}
+
+
+@pytest.fixture
+def db(tmp_path):
+    pool = ConnectionPool(tmp_path / "omr.db", size=2)
+    pool.init()
+    yield pool
+    pool.close()
+
+
+def record(answers: dict, key) -> dict:
+    key = AnswerKey.from_spec(key)
+    result = {"status": "success", "file": "sheet.png", "detected_answers": answers}
+    result.update(key.score(key.encode(answers)))
+    return result
+
+
+def store(db, exam_id, key, *sheets):
+    with EvaluationStore(db, exam_id, AnswerKey.from_spec(key)) as evaluations:
+        for sheet_hash, answers in sheets:
+            evaluations.add(record(answers, key), sheet_hash=sheet_hash)
+    return evaluations
+
+
+def test_resubmitted_sheet_is_overwritten(db):
+    save_exam(db, 1, KEY)
+    store(db, 1, KEY, ("h1", {1: "A"}), ("h2", {1: "A", 2: "B"}))
+    store(db, 1, KEY, ("h1", {1: "A", 2: "B", 3: "C"}))
+
+    rows = query_evaluations(db, 1, answer_key=AnswerKey.from_spec(KEY))
+    assert len(rows) == 2
+    assert rows[0]["sheet_hash"] == "h1"
+    assert rows[0]["score"] == 3
+    assert rows[0]["detected_answers"] == {1: "A", 2: "B", 3: "C"}
+
+
+def test_errors_are_not_stored(db):
+    with EvaluationStore(db, 1, AnswerKey.from_spec(KEY)) as evaluations:
+        evaluations.add({"status": "error", "error": "unreadable"}, sheet_hash="h1")
+    assert evaluations.written == 0
+    assert query_evaluations(db, 1) == []
+
+
+def test_init_db_removes_duplicates_before_unique_index(db):
+    with db.connection() as conn:
+        conn.execute(f"DROP INDEX {EVALUATION_UNIQUE_INDEX}")
+        conn.executemany(
+            "INSERT INTO evaluations (exam_id, sheet_hash, score, total, percentage, correct, wrong, unmarked, "
+            "answers) VALUES (?, ?, ?, 3, 0, 0, 0, 0, x'')",
+            [(1, "h1", 1), (1, "h1", 2), (1, "h2", 1), (2, "h1", 1), (1, None, 0), (1, None, 0)]
+        )
+    with db.connection() as conn:
+        init_db(conn)
+        rows = conn.execute("SELECT exam_id, sheet_hash, score FROM evaluations ORDER BY id").fetchall()
+        index = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (EVALUATION_UNIQUE_INDEX,)).fetchone()
+
+    # The newest row per (exam, sheet) is kept; rows without a hash are left alone
+    assert rows == [(1, "h1", 2), (1, "h2", 1), (2, "h1", 1), (1, None, 0), (1, None, 0)]
+    assert index is not None
+
+
+def test_new_key_rescores_and_realigns_stored_answers(db):
+    save_exam(db, 1, KEY)
+    store(db, 1, KEY, ("h1", {1: "A", 2: "B", 3: "D"}), ("h2", {2: "C"}))
+
+    # Question 1 dropped, 3 corrected, 4 added
+    new_key = {"2": "B", "3": "D", "4": "A"}
+    assert save_exam(db, 1, new_key) == 2
+
+    key = AnswerKey.from_spec(new_key)
+    rows = {row["sheet_hash"]: row for row in query_evaluations(db, 1, answer_key=key)}
+    assert rows["h1"]["detected_answers"] == {2: "B", 3: "D"}
+    assert (rows["h1"]["score"], rows["h1"]["total"], rows["h1"]["unmarked"]) == (2, 3, 1)
+    assert (rows["h2"]["score"], rows["h2"]["wrong"], rows["h2"]["unmarked"]) == (0, 1, 2)
+    with db.connection() as conn:
+        blob = conn.execute("SELECT answers FROM evaluations WHERE sheet_hash = 'h1'").fetchone()[0]
+    assert np.frombuffer(blob, dtype=np.uint8).tolist() == [1, 3, UNMARKED]
+
+
+def test_saving_the_same_key_rescores_nothing(db):
+    save_exam(db, 1, KEY)
+    store(db, 1, KEY, ("h1", {1: "A"}))
+    assert save_exam(db, 1, dict(KEY)) == 0
+
+
+def test_store_with_stale_key_realigns_to_stored_key(db):
+    save_exam(db, 1, KEY)
+    evaluations = EvaluationStore(db, 1, AnswerKey.from_spec(KEY))
+    evaluations.add(record({1: "A", 3: "C"}, KEY), sheet_hash="h1")
+
+    # The key changes while rows are still buffered
+    save_exam(db, 1, {"3": "C", "4": "D"})
+    evaluations.flush()
+
+    row = query_evaluations(db, 1, answer_key=AnswerKey.from_spec({"3": "C", "4": "D"}))[0]
+    assert row["detected_answers"] == {3: "C"}
+    assert (row["score"], row["total"], row["unmarked"]) == (1, 2, 1)